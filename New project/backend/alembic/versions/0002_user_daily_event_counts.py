@@ -0,0 +1,34 @@
+"""user daily event counts rollup
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_daily_event_counts",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("event_type", sa.String(length=100), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_user_daily_event_counts_day", "user_daily_event_counts", ["day"])
+    op.execute(
+        "INSERT INTO user_daily_event_counts (user_id, day, event_type, count) "
+        "SELECT user_id, date(\"timestamp\"), event_type, count(*) FROM events "
+        "GROUP BY user_id, date(\"timestamp\"), event_type"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_daily_event_counts_day", table_name="user_daily_event_counts")
+    op.drop_table("user_daily_event_counts")
@@ -0,0 +1,41 @@
+"""insight runs
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "insight_runs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("start_time", sa.DateTime(), nullable=False),
+        sa.Column("end_time", sa.DateTime(), nullable=False),
+        sa.Column("cohort_label", sa.String(length=50), nullable=True),
+        sa.Column("user_count", sa.Integer(), nullable=False),
+        sa.Column("feature_columns", sa.JSON(), nullable=False),
+        sa.Column("feature_vectors", sa.LargeBinary(), nullable=False),
+    )
+    op.create_index("ix_insight_runs_created_at", "insight_runs", ["created_at"])
+    with op.batch_alter_table("insights") as batch:
+        batch.add_column(sa.Column("run_id", sa.Integer(), nullable=True))
+        batch.create_foreign_key("fk_insights_run_id", "insight_runs", ["run_id"], ["id"])
+        batch.create_index("ix_insights_run_id", ["run_id"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("insights") as batch:
+        batch.drop_index("ix_insights_run_id")
+        batch.drop_constraint("fk_insights_run_id", type_="foreignkey")
+        batch.drop_column("run_id")
+    op.drop_index("ix_insight_runs_created_at", table_name="insight_runs")
+    op.drop_table("insight_runs")
@@ -0,0 +1,38 @@
+"""insight jobs
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "insight_jobs",
+        sa.Column("id", sa.String(length=32), primary_key=True),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("stage", sa.String(length=50), nullable=True),
+        sa.Column("progress", sa.JSON(), nullable=False),
+        sa.Column("start_time", sa.DateTime(), nullable=False),
+        sa.Column("end_time", sa.DateTime(), nullable=False),
+        sa.Column("cohort_label", sa.String(length=50), nullable=True),
+        sa.Column("run_id", sa.Integer(), sa.ForeignKey("insight_runs.id"), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_insight_jobs_status", "insight_jobs", ["status"])
+    op.create_index("ix_insight_jobs_created_at", "insight_jobs", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_insight_jobs_created_at", table_name="insight_jobs")
+    op.drop_index("ix_insight_jobs_status", table_name="insight_jobs")
+    op.drop_table("insight_jobs")
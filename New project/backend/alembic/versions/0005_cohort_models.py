@@ -0,0 +1,30 @@
+"""cohort models
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cohort_models",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("n_clusters", sa.Integer(), nullable=False),
+        sa.Column("feature_columns", sa.JSON(), nullable=False),
+        sa.Column("samples_seen", sa.Integer(), nullable=False),
+        sa.Column("model", sa.LargeBinary(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cohort_models")
@@ -0,0 +1,22 @@
+"""index users.cohort_label
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_cohort_label", "users", ["cohort_label"])
+    op.create_index("ix_insight_runs_cohort_label", "insight_runs", ["cohort_label"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_insight_runs_cohort_label", table_name="insight_runs")
+    op.drop_index("ix_users_cohort_label", table_name="users")
@@ -0,0 +1,121 @@
+"""partition events by month
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+ENSURE_PARTITIONS_FN = """
+CREATE OR REPLACE FUNCTION ensure_event_partitions(from_month date, months integer) RETURNS integer AS $$
+DECLARE
+    created integer := 0;
+    lower_bound date;
+    partition text;
+BEGIN
+    FOR i IN 0..months - 1 LOOP
+        lower_bound := (date_trunc('month', from_month) + make_interval(months => i))::date;
+        partition := format('events_p%s', to_char(lower_bound, 'YYYYMM'));
+        IF to_regclass(partition) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+                partition, lower_bound, (lower_bound + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def _months_between(start: date, end: date) -> int:
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        # SQLite keeps a single events table; only the composite window index applies.
+        op.create_index("ix_events_timestamp_user_id", "events", ["timestamp", "user_id"])
+        return
+
+    op.execute("ALTER TABLE events RENAME TO events_legacy")
+    op.execute("ALTER TABLE events_legacy RENAME CONSTRAINT events_pkey TO events_legacy_pkey")
+    for column in ("user_id", "event_type", "timestamp"):
+        op.execute(f"ALTER INDEX IF EXISTS ix_events_{column} RENAME TO ix_events_legacy_{column}")
+
+    op.execute(
+        """
+        CREATE TABLE events (
+            id integer NOT NULL DEFAULT nextval('events_id_seq'::regclass),
+            user_id integer REFERENCES users (id),
+            event_type varchar(100),
+            metadata json NOT NULL,
+            "timestamp" timestamp without time zone NOT NULL,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+        """
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    # Indexes on the parent are created on every partition, including future ones.
+    op.execute("CREATE INDEX ix_events_user_id ON events (user_id)")
+    op.execute("CREATE INDEX ix_events_event_type ON events (event_type)")
+    op.execute('CREATE INDEX ix_events_timestamp_user_id ON events ("timestamp", user_id)')
+    op.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+    op.execute(ENSURE_PARTITIONS_FN)
+
+    oldest, newest = bind.execute(sa.text('SELECT min("timestamp"), max("timestamp") FROM events_legacy')).one()
+    today = datetime.utcnow().date().replace(day=1)
+    first = (oldest.date() if oldest else today).replace(day=1)
+    last = max(newest.date().replace(day=1) if newest else today, today)
+    months = _months_between(first, last) + 1 + MONTHS_AHEAD
+    bind.execute(sa.text("SELECT ensure_event_partitions(:start, :months)"), {"start": first, "months": months})
+
+    op.execute(
+        'INSERT INTO events (id, user_id, event_type, metadata, "timestamp") '
+        'SELECT id, user_id, event_type, metadata, "timestamp" FROM events_legacy'
+    )
+    op.execute("DROP TABLE events_legacy")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.drop_index("ix_events_timestamp_user_id", table_name="events")
+        return
+
+    op.execute("ALTER TABLE events RENAME TO events_partitioned")
+    for name in ("user_id", "event_type", "timestamp_user_id"):
+        op.execute(f"ALTER INDEX IF EXISTS ix_events_{name} RENAME TO ix_events_partitioned_{name}")
+    op.execute(
+        """
+        CREATE TABLE events (
+            id integer NOT NULL DEFAULT nextval('events_id_seq'::regclass) PRIMARY KEY,
+            user_id integer REFERENCES users (id),
+            event_type varchar(100),
+            metadata json NOT NULL,
+            "timestamp" timestamp without time zone NOT NULL
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    op.execute(
+        'INSERT INTO events (id, user_id, event_type, metadata, "timestamp") '
+        'SELECT id, user_id, event_type, metadata, "timestamp" FROM events_partitioned'
+    )
+    op.execute("DROP TABLE events_partitioned CASCADE")
+    op.execute("DROP FUNCTION IF EXISTS ensure_event_partitions(date, integer)")
+    op.execute("CREATE INDEX ix_events_user_id ON events (user_id)")
+    op.execute("CREATE INDEX ix_events_event_type ON events (event_type)")
+    op.execute('CREATE INDEX ix_events_timestamp ON events ("timestamp")')
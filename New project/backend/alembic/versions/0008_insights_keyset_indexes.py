@@ -0,0 +1,22 @@
+"""composite indexes for insights keyset pagination
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_insights_created_at_id", "insights", ["created_at", "id"])
+    op.create_index("ix_insights_type_created_at_id", "insights", ["type", "created_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_insights_type_created_at_id", table_name="insights")
+    op.drop_index("ix_insights_created_at_id", table_name="insights")
@@ -0,0 +1,46 @@
+"""normalized events.feature column
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 50_000
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        # Adding a stored generated column rewrites every partition, which is the backfill.
+        # Only top-level strings count, as in ml.pipeline.metadata_feature.
+        op.execute(
+            "ALTER TABLE events ADD COLUMN feature varchar(100) GENERATED ALWAYS AS ("
+            "CASE WHEN json_typeof(metadata -> 'feature') = 'string' "
+            "THEN (metadata ->> 'feature')::varchar(100) END) STORED"
+        )
+    else:
+        op.add_column("events", sa.Column("feature", sa.String(length=100), nullable=True))
+        low, high = bind.execute(sa.text("SELECT min(id), max(id) FROM events")).one()
+        # Batched by id so no single statement holds the write lock for the whole table.
+        for start in range(low or 0, (high or 0) + 1, BACKFILL_BATCH):
+            bind.execute(
+                sa.text(
+                    "UPDATE events SET feature = substr(json_extract(metadata, '$.feature'), 1, 100) "
+                    "WHERE id >= :start AND id < :end AND json_type(metadata, '$.feature') = 'text'"
+                ),
+                {"start": start, "end": start + BACKFILL_BATCH},
+            )
+    op.create_index("ix_events_feature", "events", ["feature"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_events_feature", table_name="events")
+    with op.batch_alter_table("events") as batch:
+        batch.drop_column("feature")
@@ -0,0 +1,32 @@
+"""daily rollup coverage state
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_rollup_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("stale_from", sa.Date(), nullable=True),
+        sa.Column("stale_to", sa.Date(), nullable=True),
+    )
+    # An empty rollup next to raw events has never been built; mark all of it stale.
+    op.execute(
+        "INSERT INTO daily_rollup_state (id, stale_from, stale_to) "
+        "SELECT 1, min(date(\"timestamp\")), max(date(\"timestamp\")) FROM events "
+        "WHERE NOT EXISTS (SELECT 1 FROM user_daily_event_counts)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_rollup_state")
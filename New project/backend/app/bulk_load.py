@@ -0,0 +1,249 @@
+import ast
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator
+import pandas as pd
+from sqlalchemy import Index, Table, inspect, text
+from sqlalchemy.orm import Session
+
+from ml.pipeline import extract_features
+from . import crud, models
+
+DEFAULT_CHUNK_ROWS = 200_000
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+@dataclass(frozen=True)
+class LoadSpec:
+    table: Table
+    columns: tuple[str, ...]
+    timestamps: tuple[str, ...] = ()
+    integers: tuple[str, ...] = ()
+    json_columns: tuple[str, ...] = ()
+    # Computed by the database where they are generated columns; derived from the chunk otherwise.
+    generated: tuple[str, ...] = ()
+
+
+# Load order matters: events and feedback reference users.
+SPECS = {
+    "users": LoadSpec(models.User.__table__, ("id", "created_at", "plan", "country"), ("created_at",), ("id",)),
+    "events": LoadSpec(
+        models.Event.__table__,
+        ("user_id", "event_type", "metadata", "timestamp"),
+        ("timestamp",),
+        ("user_id",),
+        ("metadata",),
+        ("feature",),
+    ),
+    "feedback": LoadSpec(
+        models.Feedback.__table__, ("user_id", "text", "rating", "timestamp"), ("timestamp",), ("user_id", "rating")
+    ),
+}
+
+
+@dataclass
+class LoadReport:
+    table: str
+    rows: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    first_timestamp: datetime | None = None
+    last_timestamp: datetime | None = None
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_chunks(path: Path, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif suffix in (".ndjson", ".jsonl"):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False, convert_dates=False)
+    else:
+        # Strings stay strings so metadata and timestamps are parsed by the code below.
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[""])
+
+
+def _legacy_json(value: str) -> str:
+    # An apostrophe may sit inside a JSON string ('{"msg": "it\'s"}'), so only text that
+    # is not JSON is read as a Python literal.
+    try:
+        json.loads(value)
+    except ValueError:
+        return json.dumps(ast.literal_eval(value))
+    return value
+
+
+def _json_text(values: pd.Series) -> pd.Series:
+    # JSON text is handed to the database as is. Dicts (NDJSON/Parquet) are encoded, and
+    # legacy Python-literal rows ("{'feature': 'export'}") are converted one by one.
+    if values.map(type).eq(dict).any():
+        return values.map(lambda v: json.dumps(v) if isinstance(v, dict) else v)
+    values = values.fillna("{}").astype(str)
+    legacy = values.str.contains("'", regex=False)
+    if legacy.any():
+        values = values.copy()
+        values[legacy] = values[legacy].map(_legacy_json)
+    return values
+
+
+# Generated column -> how to derive it from the prepared chunk.
+DERIVED = {"feature": lambda frame: extract_features(frame["metadata"])}
+
+
+def prepare_chunk(spec: LoadSpec, frame: pd.DataFrame, derive_generated: bool = False) -> pd.DataFrame:
+    frame = frame.loc[:, list(spec.columns)].copy()
+    for column in spec.timestamps:
+        frame[column] = pd.to_datetime(frame[column], utc=True, format="ISO8601").dt.tz_localize(None)
+    for column in spec.integers:
+        frame[column] = pd.to_numeric(frame[column]).astype("Int64")
+    for column in spec.json_columns:
+        frame[column] = _json_text(frame[column])
+    if derive_generated:
+        for column in spec.generated:
+            frame[column] = DERIVED[column](frame)
+    return frame
+
+
+def _copy_chunk(db: Session, spec: LoadSpec, frame: pd.DataFrame) -> None:
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, date_format=TIMESTAMP_FORMAT)
+    buffer.seek(0)
+    column_list = ", ".join(f'"{c}"' for c in frame.columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {spec.table.name} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _executemany_chunk(db: Session, spec: LoadSpec, frame: pd.DataFrame) -> None:
+    # Timestamps use SQLAlchemy's SQLite storage format so ORM reads and range filters work.
+    frame = frame.assign(**{c: frame[c].dt.strftime(TIMESTAMP_FORMAT) for c in spec.timestamps})
+    values = frame.astype(object).where(frame.notna(), None)
+    column_list = ", ".join(f'"{c}"' for c in frame.columns)
+    placeholders = ", ".join("?" for _ in frame.columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.executemany(
+            f"INSERT INTO {spec.table.name} ({column_list}) VALUES ({placeholders})",
+            values.itertuples(index=False, name=None),
+        )
+    finally:
+        cursor.close()
+
+
+def write_chunk(db: Session, spec: LoadSpec, frame: pd.DataFrame) -> None:
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_chunk(db, spec, frame)
+    else:
+        _executemany_chunk(db, spec, frame)
+
+
+class Checkpoint:
+    # Rows committed per table and source file. A chunk is committed before the
+    # checkpoint is written, so a crash in between reloads at most one chunk.
+    def __init__(self, path: Path | None):
+        self.path = path
+        self.state: dict[str, dict] = {}
+        if path is not None and path.exists():
+            self.state = json.loads(path.read_text())
+
+    def done(self, table: str, source: Path) -> int:
+        entry = self.state.get(table)
+        if entry is None or entry.get("source") != str(source.resolve()):
+            return 0
+        return int(entry["rows"])
+
+    def mark(self, table: str, source: Path, rows: int) -> None:
+        self.state[table] = {"source": str(source.resolve()), "rows": rows}
+        if self.path is None:
+            return
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.path)
+
+
+@contextmanager
+def indexes_dropped(db: Session, tables: list[Table]) -> Iterator[list[Index]]:
+    # Drops the secondary indexes the models define (and that exist) and rebuilds them
+    # after the load, so each index is built once instead of maintained per row.
+    existing = {table.name: {ix["name"] for ix in inspect(db.get_bind()).get_indexes(table.name)} for table in tables}
+    dropped = [ix for table in tables for ix in table.indexes if ix.name in existing[table.name]]
+    for index in dropped:
+        index.drop(db.connection())
+    db.commit()
+    try:
+        yield dropped
+    finally:
+        for index in dropped:
+            index.create(db.connection())
+        db.commit()
+
+
+def load_file(
+    db: Session,
+    table: str,
+    path: Path,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    checkpoint: Checkpoint | None = None,
+    progress: Callable[[LoadReport], None] | None = None,
+) -> LoadReport:
+    spec = SPECS[table]
+    checkpoint = checkpoint or Checkpoint(None)
+    report = LoadReport(table=table)
+    done = checkpoint.done(table, path)
+    offset = 0
+    started = time.perf_counter()
+    for frame in read_chunks(path, chunk_rows):
+        end = offset + len(frame)
+        if end <= done:
+            report.skipped += len(frame)
+            offset = end
+            continue
+        if offset < done:
+            report.skipped += done - offset
+            frame = frame.iloc[done - offset:]
+        chunk = prepare_chunk(spec, frame, derive_generated=crud.writes_generated_columns(db))
+        if table == "events" and len(chunk):
+            # Until refresh_rollups runs, generation reads these days from raw events.
+            crud.mark_rollups_stale(db, chunk["timestamp"].min().date(), chunk["timestamp"].max().date())
+        write_chunk(db, spec, chunk)
+        db.commit()
+        checkpoint.mark(table, path, end)
+        offset = end
+        report.rows += len(chunk)
+        if spec.timestamps and len(chunk):
+            column = chunk[spec.timestamps[0]]
+            first, last = column.min().to_pydatetime(), column.max().to_pydatetime()
+            report.first_timestamp = min(report.first_timestamp or first, first)
+            report.last_timestamp = max(report.last_timestamp or last, last)
+        report.seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(report)
+    report.seconds = time.perf_counter() - started
+    if table == "users" and report.rows and db.get_bind().dialect.name == "postgresql":
+        # Explicit ids bypass the sequence; move it past them.
+        db.execute(text("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))"))
+        db.commit()
+    return report
+
+
+def refresh_rollups(db: Session, report: LoadReport) -> int:
+    if report.skipped:
+        # Days touched by an earlier, interrupted run are not known here.
+        return crud.backfill_daily_counts(db)
+    if report.first_timestamp is None:
+        return 0
+    return crud.backfill_daily_counts(db, report.first_timestamp.date(), report.last_timestamp.date())
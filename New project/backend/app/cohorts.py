@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import any_, bindparam, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from ml.cohorts import DEFAULT_CLUSTERS, CohortModel, fit_cohort_model, update_cohort_model
+
+# Stays under SQLite's bound-parameter limit; PostgreSQL gets one statement per cohort.
+SQLITE_UPDATE_CHUNK = 30_000
+
+
+def load_active_model(db: Session) -> tuple[models.CohortModelVersion | None, CohortModel | None]:
+    row = db.scalar(select(models.CohortModelVersion).order_by(models.CohortModelVersion.id.desc()).limit(1))
+    if row is None:
+        return None, None
+    return row, CohortModel.loads(row.model)
+
+
+def save_model(db: Session, model: CohortModel, row: models.CohortModelVersion | None = None) -> models.CohortModelVersion:
+    if row is None:
+        row = models.CohortModelVersion()
+        db.add(row)
+    row.n_clusters = model.n_clusters
+    row.feature_columns = model.feature_columns
+    row.samples_seen = model.samples_seen
+    row.model = model.dumps()
+    row.updated_at = datetime.utcnow()
+    db.flush()
+    return row
+
+
+def write_labels(db: Session, labels: dict[int, str]) -> int:
+    by_cohort: dict[str, list[int]] = {}
+    for user_id, label in labels.items():
+        by_cohort.setdefault(label, []).append(user_id)
+    table = models.User.__table__
+    postgres = db.get_bind().dialect.name == "postgresql"
+    for label, user_ids in by_cohort.items():
+        if postgres:
+            stmt = update(table).where(table.c.id == any_(bindparam("ids"))).values(cohort_label=label)
+            db.execute(stmt, {"ids": user_ids})
+            continue
+        for start in range(0, len(user_ids), SQLITE_UPDATE_CHUNK):
+            chunk = user_ids[start:start + SQLITE_UPDATE_CHUNK]
+            db.execute(update(table).where(table.c.id.in_(chunk)).values(cohort_label=label))
+    return len(labels)
+
+
+@dataclass
+class CohortAssignment:
+    # A fitted model update and its labels, not yet written.
+    row: models.CohortModelVersion | None
+    model: CohortModel
+    labels: dict[int, str]
+
+    def write(self, db: Session) -> None:
+        save_model(db, self.model, self.row)
+        write_labels(db, self.labels)
+
+
+def fit_cohorts(db: Session, feature_vectors: pd.DataFrame, k: int = DEFAULT_CLUSTERS) -> CohortAssignment | None:
+    if feature_vectors.empty:
+        return None
+    row, model = load_active_model(db)
+    updated = update_cohort_model(model, feature_vectors, k=k)
+    return CohortAssignment(row if updated is model else None, updated, updated.predict(feature_vectors))
+
+
+def assign_cohorts(db: Session, feature_vectors: pd.DataFrame, k: int = DEFAULT_CLUSTERS) -> dict[int, str]:
+    assignment = fit_cohorts(db, feature_vectors, k)
+    if assignment is None:
+        return {}
+    assignment.write(db)
+    db.commit()
+    return assignment.labels
+
+
+def recluster(db: Session, feature_vectors: pd.DataFrame, k: int = DEFAULT_CLUSTERS) -> tuple[models.CohortModelVersion, dict[int, str]]:
+    # Fits a fresh model version; cohort numbers are matched to the previous version.
+    _, previous = load_active_model(db)
+    model = fit_cohort_model(feature_vectors, k=k, previous=previous)
+    row = save_model(db, model)
+    labels = model.predict(feature_vectors)
+    write_labels(db, labels)
+    db.commit()
+    return row, labels
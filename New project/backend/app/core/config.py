@@ -9,6 +9,28 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 60 * 24
     OPENAI_API_KEY: str | None = None
+    INGEST_BATCH_SIZE: int = 5000
+    STREAM_MAX_LINE_BYTES: int = 1024 * 1024
+    LOAD_CHUNK_SIZE: int = 50_000
+    USE_DAILY_ROLLUPS: bool = True
+    EVENT_PARTITION_MONTHS_AHEAD: int = 3
+    RESULT_CACHE_ENTRIES: int = 128
+    RESULT_CACHE_PATH: str | None = None
+    RESULT_CACHE_DISK_MAX_ENTRIES: int = 1024
+    TIMING_HEADER: bool = False
+    DETECTOR_THREADS: int = 3
+    SHARD_WORKERS: int = 1
+    SHARD_ROWS: int = 500_000
+    MISUSE_RULES: list[dict] = [{"feature": "export", "threshold": 3}]
+    JOB_WORKERS: int = 2
+    JOB_EXECUTOR: str = "process"
+    JOB_LEASE_SECONDS: int = 120
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_WARMUP: bool = False
+    EMBEDDING_CACHE_DIR: str | None = None
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000
+    SENTIMENT_BACKEND: str = "embedding"
+    SENTIMENT_MODEL_PATH: str | None = None
 
 
 settings = Settings()
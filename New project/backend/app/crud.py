@@ -1,44 +1,368 @@
-from datetime import datetime
+import base64
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from sqlalchemy import Table, and_, delete, func, insert, or_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models
+from . import models, schemas
+from .core.config import settings
+from .feature_store import encode_feature_vectors
+from .metrics import record_ingest
+from .result_cache import get_result_cache
+from ml.pipeline import metadata_feature
 
 
-def create_events(db: Session, events: list[dict]) -> int:
-    for e in events:
-        db.add(models.Event(
-            user_id=e["user_id"],
-            event_type=e["event_type"],
-            metadata=e.get("metadata", {}),
-            timestamp=e.get("timestamp") or datetime.utcnow(),
-        ))
+@dataclass
+class BulkInsertResult:
+    count: int = 0
+    chunks: list[dict] = field(default_factory=list)
+
+
+def _chunked(rows: list[dict], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _execute_values(db: Session, table: Table, rows: list[dict]) -> None:
+    from psycopg2.extras import execute_values
+
+    columns = list(rows[0])
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    values = [
+        tuple(json.dumps(row[c]) if isinstance(row[c], (dict, list)) else row[c] for c in columns)
+        for row in rows
+    ]
+    cursor = db.connection().connection.cursor()
+    try:
+        execute_values(
+            cursor,
+            f"INSERT INTO {table.name} ({column_list}) VALUES %s",
+            values,
+            page_size=len(values),
+        )
+    finally:
+        cursor.close()
+
+
+def bulk_insert(
+    db: Session,
+    table: Table,
+    rows: list[dict],
+    batch_size: int | None = None,
+    commit: bool = True,
+) -> BulkInsertResult:
+    result = BulkInsertResult()
+    if not rows:
+        return result
+    batch_size = max(1, batch_size or settings.INGEST_BATCH_SIZE)
+    use_execute_values = db.get_bind().dialect.name == "postgresql"
+    for chunk in _chunked(rows, batch_size):
+        started = time.perf_counter()
+        if use_execute_values:
+            _execute_values(db, table, chunk)
+        else:
+            db.execute(insert(table), chunk)
+        result.chunks.append({"rows": len(chunk), "seconds": round(time.perf_counter() - started, 6)})
+        result.count += len(chunk)
+    if commit:
+        db.commit()
+    return result
+
+
+_GENERATED_FEATURE: dict[str, bool] = {}
+
+
+def writes_generated_columns(db: Session) -> bool:
+    # events.feature is a generated column only where migration 0009 made it one on
+    # PostgreSQL; create_all makes a plain column that ingest has to fill.
+    bind = db.get_bind()
+    key = bind.url.render_as_string(hide_password=True)
+    if key not in _GENERATED_FEATURE:
+        _GENERATED_FEATURE[key] = bind.dialect.name == "postgresql" and db.execute(text(
+            "SELECT is_generated FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'events' AND column_name = 'feature'"
+        )).scalar() == "ALWAYS"
+    return not _GENERATED_FEATURE[key]
+
+
+def bulk_create_events(db: Session, events: list[dict], batch_size: int | None = None) -> BulkInsertResult:
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": e["user_id"],
+            "event_type": e["event_type"],
+            "metadata": e.get("metadata") or {},
+            "timestamp": e.get("timestamp") or now,
+        }
+        for e in events
+    ]
+    if writes_generated_columns(db):
+        for row in rows:
+            row["feature"] = metadata_feature(row["metadata"])
+    result = bulk_insert(db, models.Event.__table__, rows, batch_size, commit=False)
+    upsert_daily_counts(db, rows, batch_size)
     db.commit()
-    return len(events)
+    record_ingest("events", result.count, result.chunks)
+    get_result_cache().invalidate_rows(rows)
+    return result
+
+
+def bulk_create_feedback(db: Session, items: list[dict], batch_size: int | None = None) -> BulkInsertResult:
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": f["user_id"],
+            "text": f["text"],
+            "rating": f.get("rating"),
+            "timestamp": f.get("timestamp") or now,
+        }
+        for f in items
+    ]
+    result = bulk_insert(db, models.Feedback.__table__, rows, batch_size)
+    record_ingest("feedback", result.count, result.chunks)
+    get_result_cache().invalidate_rows(rows)
+    return result
+
+
+def _day(timestamp) -> date:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return timestamp.date()
+
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def upsert_daily_counts(db: Session, events: list[dict], batch_size: int | None = None) -> int:
+    dialect_insert = _UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+    if dialect_insert is None or not events:
+        return 0
+    counts = Counter((e["user_id"], _day(e["timestamp"]), e["event_type"]) for e in events)
+    rows = [
+        {"user_id": user_id, "day": day, "event_type": event_type, "count": count}
+        for (user_id, day, event_type), count in counts.items()
+    ]
+    table = models.UserDailyEventCount.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day, table.c.event_type],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    for chunk in _chunked(rows, max(1, batch_size or settings.INGEST_BATCH_SIZE)):
+        db.execute(stmt, chunk)
+    return len(rows)
+
+
+ROLLUP_STATE_ID = 1
+
+
+def backfill_daily_counts(db: Session, start: date | None = None, end: date | None = None) -> int:
+    # Rebuilds rollup rows for [start, end] (whole table when unbounded) from raw events.
+    table = models.UserDailyEventCount.__table__
+    event = models.Event
+    day = func.date(event.timestamp)
+    clear = delete(table)
+    source = select(event.user_id, day, event.event_type, func.count()).group_by(event.user_id, day, event.event_type)
+    if start is not None:
+        clear = clear.where(table.c.day >= start)
+        source = source.where(event.timestamp >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        clear = clear.where(table.c.day <= end)
+        source = source.where(event.timestamp < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    db.execute(clear)
+    result = db.execute(insert(table).from_select(["user_id", "day", "event_type", "count"], source))
+    state = db.get(models.DailyRollupState, ROLLUP_STATE_ID)
+    if state is None:
+        if start is None and end is None:
+            db.add(models.DailyRollupState(id=ROLLUP_STATE_ID))
+    elif state.stale_from is not None:
+        if (start is None or start <= state.stale_from) and (end is None or state.stale_to <= end):
+            state.stale_from = state.stale_to = None
+    db.commit()
+    return result.rowcount
+
+
+def seed_rollup_state(db: Session) -> None:
+    # Schemas built by create_all have no state row, which reads as "nothing covered".
+    # Events already stored are marked stale until a backfill; an empty table is covered.
+    if db.get(models.DailyRollupState, ROLLUP_STATE_ID) is not None:
+        return
+    first, last = db.execute(select(func.min(models.Event.timestamp), func.max(models.Event.timestamp))).one()
+    db.add(models.DailyRollupState(
+        id=ROLLUP_STATE_ID,
+        stale_from=first.date() if first is not None else None,
+        stale_to=last.date() if last is not None else None,
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker seeded it first.
+        db.rollback()
+
+
+def mark_rollups_stale(db: Session, first: date, last: date) -> None:
+    # Widens the stale range; called in the transaction that writes events around the rollup.
+    # Without a state row nothing counts as covered, so there is nothing to widen.
+    state = db.get(models.DailyRollupState, ROLLUP_STATE_ID, with_for_update=True)
+    if state is None:
+        return
+    state.stale_from = min(state.stale_from or first, first)
+    state.stale_to = max(state.stale_to or last, last)
+    db.flush()
+
+
+def rollups_cover(db: Session, first: date, last: date) -> bool:
+    # True when the rollup counts every event on the days [first, last].
+    state = db.get(models.DailyRollupState, ROLLUP_STATE_ID, populate_existing=True)
+    if state is None:
+        return False
+    if state.stale_from is None:
+        return True
+    return last < state.stale_from or state.stale_to < first
+
+
+def create_events(db: Session, events: list[dict]) -> int:
+    return bulk_create_events(db, events).count
 
 
 def create_feedback(db: Session, items: list[dict]) -> int:
-    for f in items:
-        db.add(models.Feedback(
-            user_id=f["user_id"],
-            text=f["text"],
-            rating=f.get("rating"),
-            timestamp=f.get("timestamp") or datetime.utcnow(),
+    return bulk_create_feedback(db, items).count
+
+
+INSIGHT_COLUMNS = (
+    models.Insight.id,
+    models.Insight.type,
+    models.Insight.score,
+    models.Insight.payload,
+    models.Insight.created_at,
+    models.Insight.explanation,
+    models.Insight.run_id,
+)
+
+
+def encode_cursor(created_at: datetime, insight_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{insight_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, insight_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(insight_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def insights_version(db: Session) -> int:
+    # Insights are append-only, so the highest id identifies the table's contents; it
+    # is answered from the primary key index.
+    return db.scalar(select(func.max(models.Insight.id))) or 0
+
+
+def list_insights(
+    db: Session,
+    limit: int = 10,
+    cohort_label: str | None = None,
+    insight_type: str | None = None,
+    min_score: float | None = None,
+    run_id: int | None = None,
+    before: tuple[datetime, int] | None = None,
+):
+    # Newest first, keyset-paginated on (created_at, id); returns plain row mappings.
+    # A cohort matches insights about its users (payload.user_id), whichever run produced
+    # them, plus every insight of runs scoped to it (e.g. its sentiment summary).
+    insight = models.Insight
+    stmt = select(*INSIGHT_COLUMNS)
+    if cohort_label is not None:
+        stmt = stmt.where(or_(
+            insight.payload["user_id"].as_integer().in_(
+                select(models.User.id).where(models.User.cohort_label == cohort_label)
+            ),
+            insight.run_id.in_(select(models.InsightRun.id).where(models.InsightRun.cohort_label == cohort_label)),
         ))
-    db.commit()
-    return len(items)
+    if insight_type is not None:
+        stmt = stmt.where(insight.type == insight_type)
+    if min_score is not None:
+        stmt = stmt.where(insight.score >= min_score)
+    if run_id is not None:
+        stmt = stmt.where(insight.run_id == run_id)
+    if before is not None:
+        created_at, insight_id = before
+        stmt = stmt.where(
+            or_(insight.created_at < created_at, and_(insight.created_at == created_at, insight.id < insight_id))
+        )
+    stmt = stmt.order_by(insight.created_at.desc(), insight.id.desc()).limit(limit)
+    return db.execute(stmt).mappings().all()
 
 
-def list_insights(db: Session, limit: int = 10):
-    return db.query(models.Insight).order_by(models.Insight.created_at.desc()).limit(limit).all()
+def list_run_insights(db: Session, run_id: int):
+    return db.query(models.Insight).filter(models.Insight.run_id == run_id).order_by(models.Insight.id).all()
 
 
-def create_insight(db: Session, insight: dict) -> models.Insight:
-    obj = models.Insight(
-        type=insight["type"],
-        score=insight.get("score", 0.0),
-        payload=insight.get("payload", {}),
-        explanation=insight.get("explanation"),
+def create_insight_run(
+    db: Session,
+    start_time: datetime,
+    end_time: datetime,
+    feature_vectors,
+    cohort_label: str | None = None,
+    commit: bool = True,
+) -> models.InsightRun:
+    columns, blob = encode_feature_vectors(feature_vectors)
+    run = models.InsightRun(
+        start_time=start_time,
+        end_time=end_time,
+        cohort_label=cohort_label,
+        user_count=len(feature_vectors),
+        feature_columns=columns,
+        feature_vectors=blob,
     )
-    db.add(obj)
-    db.commit()
-    db.refresh(obj)
-    return obj
+    db.add(run)
+    if commit:
+        db.commit()
+        db.refresh(run)
+    else:
+        db.flush()
+    return run
+
+
+def get_insight_run(db: Session, run_id: int) -> models.InsightRun | None:
+    return db.get(models.InsightRun, run_id)
+
+
+def create_insights(
+    db: Session,
+    insights: list[dict],
+    run_id: int | None = None,
+    batch_size: int | None = None,
+    commit: bool = True,
+) -> list[schemas.InsightOut]:
+    # One transaction for the whole run; ids come back through INSERT ... RETURNING
+    # so no per-row refresh is needed.
+    if not insights:
+        if commit:
+            db.commit()
+        return []
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            "type": insight["type"],
+            "score": insight.get("score", 0.0),
+            "payload": insight.get("payload", {}),
+            "explanation": insight.get("explanation"),
+            "created_at": created_at,
+            "run_id": run_id,
+        }
+        for insight in insights
+    ]
+    table = models.Insight.__table__
+    stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    ids: list[int] = []
+    for chunk in _chunked(rows, max(1, batch_size or settings.INGEST_BATCH_SIZE)):
+        ids.extend(db.execute(stmt, chunk).scalars().all())
+    if commit:
+        db.commit()
+    return [schemas.InsightOut(id=insight_id, **row) for insight_id, row in zip(ids, rows)]
+
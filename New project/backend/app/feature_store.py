@@ -0,0 +1,50 @@
+import io
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class FeatureMatrix:
+    columns: list[str]
+    user_ids: np.ndarray
+    values: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def row(self, user_id: int) -> dict[str, int] | None:
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        return dict(zip(self.columns, self.values[pos].tolist()))
+
+    def page(self, offset: int, limit: int) -> list[dict]:
+        rows = self.values[offset:offset + limit].tolist()
+        return [
+            {"user_id": int(uid), "features": dict(zip(self.columns, row))}
+            for uid, row in zip(self.user_ids[offset:offset + limit], rows)
+        ]
+
+
+def encode_feature_vectors(feature_vectors: pd.DataFrame) -> tuple[list[str], bytes]:
+    # Stored once per run as a compressed npz: sorted int64 user ids plus an int32
+    # count matrix, instead of one JSON record per user on every insight.
+    if feature_vectors.empty:
+        columns = [str(c) for c in feature_vectors.columns if c != "user_id"]
+        user_ids = np.empty(0, dtype=np.int64)
+        values = np.empty((0, len(columns)), dtype=np.int32)
+    else:
+        ordered = feature_vectors.sort_values("user_id")
+        feature_columns = [c for c in ordered.columns if c != "user_id"]
+        columns = [str(c) for c in feature_columns]
+        user_ids = ordered["user_id"].to_numpy(dtype=np.int64)
+        values = ordered[feature_columns].to_numpy(dtype=np.int32)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, user_ids=user_ids, values=values)
+    return columns, buffer.getvalue()
+
+
+def decode_feature_vectors(columns: list[str], blob: bytes) -> FeatureMatrix:
+    with np.load(io.BytesIO(blob)) as data:
+        return FeatureMatrix(columns=list(columns), user_ids=data["user_ids"], values=data["values"])
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Callable
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+from .core.config import settings
+from .cohorts import fit_cohorts
+from .loaders import load_window
+from ml.instrumentation import record, timed
+from ml.pipeline import generate_insights_for_window, window_stages
+from ml.misuse import parse_rules
+from ml.sharding import ShardConfig
+
+STAGES = ("load", "features", "cluster", "detect", "persist")
+
+
+def run_generation(
+    db: Session,
+    start_time: datetime,
+    end_time: datetime,
+    cohort_label: str | None = None,
+    on_stage: Callable[[str], None] | None = None,
+    before_commit: Callable[[models.InsightRun], None] | None = None,
+) -> tuple[models.InsightRun, list[schemas.InsightOut]]:
+    # `on_stage` is called with each name in STAGES as that stage starts; every stage is
+    # also timed as "generation.<stage>". Everything the run writes (cohort labels, the
+    # run and its insights) is committed together at the end of "persist", after
+    # `before_commit`, which may raise to roll the run back.
+    notify = on_stage or (lambda stage: None)
+
+    def stage(name: str):
+        notify(name)
+        return timed(f"generation.{name}")
+
+    rules = parse_rules(settings.MISUSE_RULES)
+    with stage("load"):
+        window = load_window(
+            db,
+            start_time,
+            end_time,
+            chunk_size=settings.LOAD_CHUNK_SIZE,
+            use_rollups=settings.USE_DAILY_ROLLUPS,
+            cohort_label=cohort_label,
+            misuse_features={rule.feature for rule in rules},
+        )
+    for table in window.stats:
+        record(f"load.frame.{table.table}", table.frame_seconds)
+    events_df, feedback_df, users_df = window.events, window.feedback, window.users
+    # One memo of the window's intermediates serves both the features and detect stages.
+    shards = ShardConfig(workers=settings.SHARD_WORKERS, shard_rows=settings.SHARD_ROWS)
+    intermediates = window_stages(events_df, feedback_df, users_df, window.daily_counts, shards, rules)
+
+    with stage("features"):
+        feature_vectors = intermediates.get("feature_vectors")
+
+    with stage("cluster"):
+        # A single cohort is not a representative sample, so scoped runs leave the model alone.
+        cohorts = fit_cohorts(db, feature_vectors) if cohort_label is None else None
+
+    with stage("detect"):
+        insights = generate_insights_for_window(
+            events_df, feedback_df, users_df, stages=intermediates, max_workers=settings.DETECTOR_THREADS
+        )
+        if cohort_label is not None:
+            for insight in insights:
+                insight["payload"] = {**insight["payload"], "cohort": cohort_label}
+
+    with stage("persist"):
+        if cohorts is not None:
+            cohorts.write(db)
+        run = crud.create_insight_run(db, start_time, end_time, feature_vectors, cohort_label=cohort_label, commit=False)
+        stored = crud.create_insights(db, insights, run_id=run.id, commit=False)
+        if before_commit is not None:
+            before_commit(run)
+        db.commit()
+    return run, stored
@@ -0,0 +1,299 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import models
+from .core.config import settings
+from .generation import run_generation
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Per-process engine cache so each pool worker reuses its own connection pool.
+_session_factories: dict[str, sessionmaker] = {}
+
+
+def _session_factory(database_url: str) -> sessionmaker:
+    factory = _session_factories.get(database_url)
+    if factory is None:
+        engine = create_engine(database_url, pool_pre_ping=True)
+        factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        _session_factories[database_url] = factory
+    return factory
+
+
+def _init_worker(
+    model_name: str, cache_dir: str | None, cache_entries: int, sentiment_backend: str, sentiment_model: str | None
+) -> None:
+    from ml.embedding_cache import configure_cache
+    from ml.embeddings import get_registry
+    from ml.sentiment import configure_sentiment
+
+    registry = get_registry()
+    registry.configure(model_name)
+    configure_cache(cache_dir, registry.model_name, cache_entries)
+    configure_sentiment(sentiment_backend, sentiment_model)
+
+
+def worker_id() -> str:
+    # Read per call: forked pool workers inherit module state from the API process.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _set_status(
+    db: Session,
+    job_id: str,
+    status: str,
+    expected: tuple[str, ...],
+    owner: str | None = None,
+    commit: bool = True,
+    **values,
+) -> bool:
+    # With `owner`, only the process holding the job's lease can move it on.
+    conditions = [models.InsightJob.id == job_id, models.InsightJob.status.in_(expected)]
+    if owner is not None:
+        conditions.append(models.InsightJob.owner == owner)
+    result = db.execute(
+        update(models.InsightJob).where(*conditions).values(status=status, updated_at=datetime.utcnow(), **values)
+    )
+    if commit:
+        db.commit()
+    return result.rowcount == 1
+
+
+class Lease:
+    # Renews updated_at while this process runs the job, so recover() in other
+    # processes can tell a live job from one whose worker died.
+    def __init__(self, database_url: str, job_id: str, owner: str, seconds: float):
+        self.database_url = database_url
+        self.job_id = job_id
+        self.owner = owner
+        self.interval = max(0.05, seconds / 3)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f"lease-{job_id}", daemon=True)
+
+    def __enter__(self) -> "Lease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _renew(self) -> None:
+        SessionLocal = _session_factory(self.database_url)
+        while not self._stop.wait(self.interval):
+            try:
+                with SessionLocal() as db:
+                    db.execute(
+                        update(models.InsightJob)
+                        .where(
+                            models.InsightJob.id == self.job_id,
+                            models.InsightJob.owner == self.owner,
+                            models.InsightJob.status == RUNNING,
+                        )
+                        .values(updated_at=datetime.utcnow())
+                    )
+                    db.commit()
+            except SQLAlchemyError:
+                logger.warning("Could not renew the lease on insight job %s", self.job_id, exc_info=True)
+
+
+class StageTracker:
+    def __init__(self, db: Session, job_id: str, owner: str):
+        self.db = db
+        self.job_id = job_id
+        self.owner = owner
+        self.progress: dict[str, dict] = {}
+        self._current: str | None = None
+        self._started = 0.0
+
+    def _close_current(self) -> None:
+        if self._current is not None:
+            self.progress[self._current] = {
+                "status": "done",
+                "seconds": round(time.perf_counter() - self._started, 6),
+            }
+
+    def __call__(self, stage: str) -> None:
+        # Stops the run once the job is cancelled or its lease has passed to another process.
+        self._close_current()
+        self._current = stage
+        self._started = time.perf_counter()
+        self.progress[stage] = {"status": "running"}
+        if not self._save(stage, RUNNING):
+            raise JobCancelled(self.job_id)
+
+    def finish(self) -> None:
+        self._close_current()
+        self._current = None
+        self._save(None, SUCCEEDED)
+
+    def _save(self, stage: str | None, status: str) -> bool:
+        # Written only while this process still owns the job, like _claim and succeed().
+        result = self.db.execute(
+            update(models.InsightJob)
+            .where(
+                models.InsightJob.id == self.job_id,
+                models.InsightJob.owner == self.owner,
+                models.InsightJob.status == status,
+            )
+            .values(stage=stage, progress=dict(self.progress), updated_at=datetime.utcnow())
+        )
+        self.db.commit()
+        return result.rowcount == 1
+
+
+def _claim(db: Session, job_id: str, owner: str) -> bool:
+    result = db.execute(
+        update(models.InsightJob)
+        .where(models.InsightJob.id == job_id, models.InsightJob.status == QUEUED)
+        .values(status=RUNNING, owner=owner, updated_at=datetime.utcnow())
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def execute_job(job_id: str, database_url: str) -> str:
+    # Runs inside a pool worker; every state change is written to the database so the
+    # API process (or a restarted one) can observe it.
+    SessionLocal = _session_factory(database_url)
+    owner = worker_id()
+    with SessionLocal() as db:
+        if not _claim(db, job_id, owner):
+            return db.scalar(select(models.InsightJob.status).where(models.InsightJob.id == job_id)) or FAILED
+        job = db.get(models.InsightJob, job_id)
+        tracker = StageTracker(db, job_id, owner)
+
+        def succeed(run: models.InsightRun) -> None:
+            # In the run's own transaction: a cancel (or a lost lease) that lands during
+            # persist rolls the run back instead of leaving it orphaned.
+            if not _set_status(db, job_id, SUCCEEDED, (RUNNING,), owner=owner, commit=False, run_id=run.id):
+                raise JobCancelled(job_id)
+
+        try:
+            with Lease(database_url, job_id, owner, settings.JOB_LEASE_SECONDS):
+                run_generation(
+                    db, job.start_time, job.end_time, job.cohort_label, on_stage=tracker, before_commit=succeed
+                )
+        except JobCancelled:
+            db.rollback()
+            return CANCELLED
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Insight job %s failed", job_id)
+            _set_status(db, job_id, FAILED, (RUNNING,), owner=owner, error=repr(exc))
+            return FAILED
+        tracker.finish()
+        return SUCCEEDED
+
+
+class JobManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Executor | None = None
+        self._futures: dict[str, Future] = {}
+
+    def _ensure_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                workers = max(1, settings.JOB_WORKERS)
+                if settings.JOB_EXECUTOR == "thread":
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="insight-job")
+                else:
+                    # The on-disk embedding cache is single-writer, so it is only shared
+                    # with a single worker process.
+                    cache_dir = settings.EMBEDDING_CACHE_DIR if workers == 1 else None
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        initializer=_init_worker,
+                        initargs=(
+                            settings.EMBEDDING_MODEL_NAME,
+                            cache_dir,
+                            settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                            settings.SENTIMENT_BACKEND,
+                            settings.SENTIMENT_MODEL_PATH,
+                        ),
+                    )
+            return self._executor
+
+    def create(self, db: Session, start_time: datetime, end_time: datetime, cohort_label: str | None, database_url: str) -> models.InsightJob:
+        job = models.InsightJob(
+            id=uuid.uuid4().hex,
+            status=QUEUED,
+            start_time=start_time,
+            end_time=end_time,
+            cohort_label=cohort_label,
+            progress={},
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self.submit(job.id, database_url)
+        return job
+
+    def submit(self, job_id: str, database_url: str) -> None:
+        future = self._ensure_executor().submit(execute_job, job_id, database_url)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id))
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def cancel(self, db: Session, job_id: str) -> bool:
+        # Queued jobs are dropped from the pool; running jobs stop at the next stage.
+        if not _set_status(db, job_id, CANCELLED, ACTIVE_STATUSES):
+            return False
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return True
+
+    def recover(self, db: Session, database_url: str) -> int:
+        # Running jobs whose lease has not been renewed for JOB_LEASE_SECONDS lost their
+        # worker and are restarted from the beginning; live ones belong to other processes.
+        # Queued jobs are offered to this pool too; the first worker to claim one runs it.
+        expired = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        db.execute(
+            update(models.InsightJob)
+            .where(models.InsightJob.status == RUNNING, models.InsightJob.updated_at < expired)
+            .values(status=QUEUED, owner=None, stage=None, progress={}, updated_at=datetime.utcnow())
+        )
+        db.commit()
+        job_ids = db.scalars(
+            select(models.InsightJob.id).where(models.InsightJob.status == QUEUED).order_by(models.InsightJob.created_at)
+        ).all()
+        for job_id in job_ids:
+            self.submit(job_id, database_url)
+        return len(job_ids)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+manager = JobManager()
@@ -0,0 +1,180 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Collection
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Output column -> dtype. "category" columns are built per chunk and unioned at the end.
+EVENT_COLUMNS = {
+    "user_id": "int32", "event_type": "category", "metadata": "object", "feature": "category", "timestamp": "datetime64[ns]"
+}
+FEEDBACK_COLUMNS = {"user_id": "int32", "text": "object", "rating": "float32", "timestamp": "datetime64[ns]"}
+DAILY_COUNT_COLUMNS = {"user_id": "int32", "day": "datetime64[ns]", "event_type": "category", "count": "int32"}
+USER_COLUMNS = {"user_id": "int32", "plan": "category", "country": "category", "cohort_label": "object"}
+
+
+@dataclass
+class TableLoadStats:
+    table: str
+    rows: int
+    seconds: float
+    # Part of `seconds` spent building arrays and the DataFrame rather than fetching.
+    frame_seconds: float = 0.0
+
+
+@dataclass
+class WindowFrames:
+    events: pd.DataFrame
+    feedback: pd.DataFrame
+    users: pd.DataFrame
+    daily_counts: pd.DataFrame | None = None
+    stats: list[TableLoadStats] = field(default_factory=list)
+
+
+def _column(values: list, dtype: str):
+    if dtype == "category":
+        # Object categories even for all-NULL chunks, so chunks can be unioned.
+        return pd.Categorical(pd.array(values, dtype=object))
+    if dtype == "float32":
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+    if dtype == "object":
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    return np.array(values, dtype=dtype)
+
+
+def _concat(parts: list, dtype: str):
+    if dtype == "category":
+        return union_categoricals(parts) if parts else pd.Categorical([])
+    if not parts:
+        return np.array([], dtype=dtype)
+    return np.concatenate(parts)
+
+
+def load_frame(db: Session, table: str, stmt: Select, columns: dict[str, str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[pd.DataFrame, TableLoadStats]:
+    # yield_per streams rows through a server-side cursor where the driver supports it,
+    # so only one chunk of Row tuples is alive at a time.
+    started = time.perf_counter()
+    parts: dict[str, list] = {name: [] for name in columns}
+    rows = 0
+    building = 0.0
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        rows += len(partition)
+        chunk_started = time.perf_counter()
+        for (name, dtype), values in zip(columns.items(), zip(*partition)):
+            parts[name].append(_column(list(values), dtype))
+        building += time.perf_counter() - chunk_started
+    chunk_started = time.perf_counter()
+    frame = pd.DataFrame({name: _concat(parts[name], dtype) for name, dtype in columns.items()})
+    building += time.perf_counter() - chunk_started
+    stats = TableLoadStats(table=table, rows=rows, seconds=time.perf_counter() - started, frame_seconds=building)
+    logger.info("Loaded %s rows from %s in %.3fs", rows, table, stats.seconds)
+    return frame, stats
+
+
+def scope_to_cohort(stmt: Select, user_id_column, cohort_label: str | None) -> Select:
+    # Filters through the indexed users.cohort_label so only the cohort's rows leave the database.
+    if cohort_label is None:
+        return stmt
+    return stmt.join(models.User, models.User.id == user_id_column).where(models.User.cohort_label == cohort_label)
+
+
+def load_window(
+    db: Session,
+    start_time: datetime,
+    end_time: datetime,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    use_rollups: bool = False,
+    cohort_label: str | None = None,
+    misuse_features: Collection[str] | None = None,
+) -> WindowFrames:
+    # With rollups covering the window, per-user counts come from daily_counts and raw
+    # events are only needed for misuse rules, so just rows whose feature is in
+    # `misuse_features` are loaded (None loads every event, as without rollups).
+    stats = []
+    daily_counts = None
+    if use_rollups:
+        daily_counts, rollup_stats = load_daily_counts(db, start_time, end_time, chunk_size, cohort_label)
+        stats.extend(rollup_stats)
+
+    events_stmt = select(
+        models.Event.user_id, models.Event.event_type, models.Event.metadata_, models.Event.feature, models.Event.timestamp
+    ).where(models.Event.timestamp >= start_time, models.Event.timestamp <= end_time)
+    if daily_counts is not None and misuse_features is not None:
+        events_stmt = events_stmt.where(models.Event.feature.in_(sorted(misuse_features)))
+    events_stmt = scope_to_cohort(events_stmt, models.Event.user_id, cohort_label)
+    feedback_stmt = select(
+        models.Feedback.user_id, models.Feedback.text, models.Feedback.rating, models.Feedback.timestamp
+    ).where(models.Feedback.timestamp >= start_time, models.Feedback.timestamp <= end_time)
+    feedback_stmt = scope_to_cohort(feedback_stmt, models.Feedback.user_id, cohort_label)
+    users_stmt = select(models.User.id, models.User.plan, models.User.country, models.User.cohort_label)
+    if cohort_label is not None:
+        users_stmt = users_stmt.where(models.User.cohort_label == cohort_label)
+
+    events, events_stats = load_frame(db, "events", events_stmt, EVENT_COLUMNS, chunk_size)
+    feedback, feedback_stats = load_frame(db, "feedback", feedback_stmt, FEEDBACK_COLUMNS, chunk_size)
+    users, users_stats = load_frame(db, "users", users_stmt, USER_COLUMNS, chunk_size)
+    return WindowFrames(events, feedback, users, daily_counts, [events_stats, feedback_stats, users_stats, *stats])
+
+
+def _midnight(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def load_daily_counts(
+    db: Session,
+    start_time: datetime,
+    end_time: datetime,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    cohort_label: str | None = None,
+) -> tuple[pd.DataFrame | None, list[TableLoadStats]]:
+    # Whole days inside the window come from the rollup table; the partial days at
+    # either edge are aggregated from raw events so results match the raw path exactly.
+    # Returns None (read raw events instead) when the window has no whole day or the
+    # rollup does not cover its whole days yet.
+    rollup = models.UserDailyEventCount
+    first_full = _midnight(start_time) if start_time == _midnight(start_time) else _midnight(start_time) + timedelta(days=1)
+    end_full = _midnight(end_time)
+    if first_full >= end_full:
+        return None, []
+    if not crud.rollups_cover(db, first_full.date(), (end_full - timedelta(days=1)).date()):
+        logger.info("Daily rollups are stale for %s..%s; reading raw events", first_full.date(), end_full.date())
+        return None, []
+
+    full_stmt = select(rollup.user_id, rollup.day, rollup.event_type, rollup.count).where(
+        rollup.day >= first_full.date(), rollup.day < end_full.date()
+    )
+    full_stmt = scope_to_cohort(full_stmt, rollup.user_id, cohort_label)
+    full, full_stats = load_frame(db, "user_daily_event_counts", full_stmt, DAILY_COUNT_COLUMNS, chunk_size)
+
+    edge_stmt = select(models.Event.user_id, models.Event.event_type, models.Event.timestamp).where(
+        ((models.Event.timestamp >= start_time) & (models.Event.timestamp < first_full))
+        | ((models.Event.timestamp >= end_full) & (models.Event.timestamp <= end_time))
+    )
+    edge_stmt = scope_to_cohort(edge_stmt, models.Event.user_id, cohort_label)
+    edge_columns = {"user_id": "int32", "event_type": "category", "timestamp": "datetime64[ns]"}
+    edges, edge_stats = load_frame(db, "events (window edges)", edge_stmt, edge_columns, chunk_size)
+    edge_counts = (
+        edges.assign(day=edges["timestamp"].dt.normalize())
+        .groupby(["user_id", "day", "event_type"], observed=True)
+        .size()
+        .reset_index(name="count")
+        .astype({"count": "int32"})
+    )
+    parts = [frame for frame in (full, edge_counts) if not frame.empty]
+    daily = pd.concat(parts, ignore_index=True) if parts else full
+    daily["event_type"] = daily["event_type"].astype("category")
+    return daily, [full_stats, edge_stats]
@@ -1,25 +1,96 @@
+import hashlib
+import json
+import logging
+import time
+import zlib
+from collections import Counter
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Any
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from pydantic import TypeAdapter
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-import pandas as pd
 
 from .core.config import settings
 from .core.security import FIXTURE_USER, create_access_token
 from .db.session import get_db, engine
+from .db import session as db_session
 from .db.base import Base
-from . import crud, models, schemas
-from ml.pipeline import generate_insights_for_window, compute_user_feature_vectors, cluster_users
+from . import cohorts, crud, jobs, metrics, models, partitions, schemas
+from .feature_store import decode_feature_vectors
+from .generation import run_generation
+from .loaders import load_window
+from .result_cache import configure_result_cache, get_result_cache, window_watermark
+from .streaming import NDJSON_CONTENT_TYPES, ingest_ndjson
+from ml.embedding_cache import configure_cache, get_cache
+from ml.embeddings import get_registry
+from ml.sentiment import configure_sentiment, get_sentiment_backend
+from ml.instrumentation import timed
+from ml.pipeline import compute_user_feature_vectors
 
 
+logger = logging.getLogger(__name__)
+
 Base.metadata.create_all(bind=engine)
+metrics.install()
+
+
+def _database_url() -> str:
+    return db_session.engine.url.render_as_string(hide_password=False)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    registry = get_registry()
+    registry.configure(settings.EMBEDDING_MODEL_NAME)
+    configure_cache(settings.EMBEDDING_CACHE_DIR, registry.model_name, settings.EMBEDDING_CACHE_MAX_ENTRIES)
+    configure_sentiment(settings.SENTIMENT_BACKEND, settings.SENTIMENT_MODEL_PATH)
+    if settings.EMBEDDING_WARMUP:
+        registry.warm_up()
+    configure_result_cache(
+        settings.RESULT_CACHE_ENTRIES, settings.RESULT_CACHE_PATH, settings.RESULT_CACHE_DISK_MAX_ENTRIES
+    )
+    with db_session.SessionLocal() as db:
+        try:
+            partitions.ensure_future_partitions(db, settings.EVENT_PARTITION_MONTHS_AHEAD)
+        except SQLAlchemyError:
+            # Missing months only cost pruning (rows fall into events_default); the API
+            # still starts and scripts/manage_partitions.py can be rerun.
+            logger.exception("Could not create upcoming event partitions")
+            db.rollback()
+        crud.seed_rollup_state(db)
+        jobs.manager.recover(db, _database_url())
+    yield
+    jobs.manager.shutdown()
+
+
+app = FastAPI(title="Signal > Noise", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    timings = metrics.start_request_timings()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(
+        elapsed, method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code
+    )
+    if settings.TIMING_HEADER:
+        response.headers["Server-Timing"] = timings.header(elapsed)
+    return response
 
-app = FastAPI(title="Signal > Noise")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+EVENT_LIST_ADAPTER = TypeAdapter(list[schemas.EventIn])
+FEEDBACK_LIST_ADAPTER = TypeAdapter(list[schemas.FeedbackIn])
+
 
 def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     try:
@@ -42,7 +113,8 @@ def login(payload: schemas.LoginIn) -> schemas.TokenOut:
 
 @app.post("/api/events")
 def ingest_events(
-    events: Any,
+    events: Any = Body(...),
+    batch_size: int | None = Query(None, ge=1, le=50_000),
     db: Session = Depends(get_db),
     _: dict = Depends(get_current_user),
 ):
@@ -55,13 +127,14 @@ def ingest_events(
     for item in events:
         parsed.append(schemas.EventIn(**item).model_dump())
 
-    count = crud.create_events(db, parsed)
-    return {"status": "ok", "ingested": count}
+    result = crud.bulk_create_events(db, parsed, batch_size=batch_size)
+    return {"status": "ok", "ingested": result.count, "chunks": result.chunks}
 
 
 @app.post("/api/feedback")
 def ingest_feedback(
-    feedback: Any,
+    feedback: Any = Body(...),
+    batch_size: int | None = Query(None, ge=1, le=50_000),
     db: Session = Depends(get_db),
     _: dict = Depends(get_current_user),
 ):
@@ -74,62 +147,265 @@ def ingest_feedback(
     for item in feedback:
         parsed.append(schemas.FeedbackIn(**item).model_dump())
 
-    count = crud.create_feedback(db, parsed)
-    return {"status": "ok", "ingested": count}
+    result = crud.bulk_create_feedback(db, parsed, batch_size=batch_size)
+    return {"status": "ok", "ingested": result.count, "chunks": result.chunks}
+
+
+async def _ingest_stream(request: Request, adapter: TypeAdapter, flush, batch_size: int) -> dict:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Expected application/x-ndjson")
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    try:
+        result = await ingest_ndjson(
+            request.stream(), adapter, flush, batch_size, gzipped=gzipped, max_line_bytes=settings.STREAM_MAX_LINE_BYTES
+        )
+    except zlib.error as exc:
+        raise HTTPException(status_code=400, detail="Invalid gzip body") from exc
+    return {
+        "status": "ok",
+        "ingested": result.ingested,
+        "failed": result.failed,
+        "errors": result.errors,
+        "chunks": result.chunks,
+    }
+
+
+@app.post("/api/events/stream")
+async def stream_events(
+    request: Request,
+    batch_size: int = Query(settings.INGEST_BATCH_SIZE, ge=1, le=50_000),
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    return await _ingest_stream(
+        request, EVENT_LIST_ADAPTER, lambda rows: crud.bulk_create_events(db, rows, batch_size), batch_size
+    )
+
+
+@app.post("/api/feedback/stream")
+async def stream_feedback(
+    request: Request,
+    batch_size: int = Query(settings.INGEST_BATCH_SIZE, ge=1, le=50_000),
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    return await _ingest_stream(
+        request, FEEDBACK_LIST_ADAPTER, lambda rows: crud.bulk_create_feedback(db, rows, batch_size), batch_size
+    )
 
 
 @app.post("/api/insights/generate", response_model=list[schemas.InsightOut])
 def generate_insights(
     payload: schemas.InsightGenerateIn,
+    response: Response,
     db: Session = Depends(get_db),
     _: dict = Depends(get_current_user),
 ):
-    events = db.query(models.Event).filter(
-        models.Event.timestamp >= payload.start_time,
-        models.Event.timestamp <= payload.end_time,
-    ).all()
-    feedback = db.query(models.Feedback).filter(
-        models.Feedback.timestamp >= payload.start_time,
-        models.Feedback.timestamp <= payload.end_time,
-    ).all()
-    users = db.query(models.User).all()
-
-    events_df = pd.DataFrame([
-        {"user_id": e.user_id, "event_type": e.event_type, "timestamp": e.timestamp, "metadata": e.metadata}
-        for e in events
-    ])
-    feedback_df = pd.DataFrame([
-        {"user_id": f.user_id, "text": f.text, "rating": f.rating, "timestamp": f.timestamp}
-        for f in feedback
-    ])
-    users_df = pd.DataFrame([
-        {"user_id": u.id, "plan": u.plan, "country": u.country, "cohort_label": u.cohort_label}
-        for u in users
-    ])
-
-    feature_vectors = compute_user_feature_vectors(events_df)
-    cohorts = cluster_users(feature_vectors) if not feature_vectors.empty else {}
-    if cohorts:
-        for user in users:
-            if user.id in cohorts:
-                user.cohort_label = cohorts[user.id]
-        db.commit()
+    # Repeated windows with unchanged data return the insights of the run that first
+    # computed them; X-Cache tells the client which case it got.
+    cache = get_result_cache()
+    with timed("generate.cache_lookup"):
+        watermark = window_watermark(db, payload.start_time, payload.end_time, payload.cohort_label)
+        key = cache.key(payload.start_time, payload.end_time, payload.cohort_label, watermark)
+        cached = cache.get(key)
+    if cached is not None:
+        response.headers["X-Cache"] = "hit"
+        return cached
+    _, stored = run_generation(db, payload.start_time, payload.end_time, payload.cohort_label)
+    cache.put(key, payload.start_time, payload.end_time, stored)
+    response.headers["X-Cache"] = "miss"
+    return stored
 
-    insights = generate_insights_for_window(events_df, feedback_df, users_df)
 
-    stored = []
-    for insight in insights:
-        stored.append(crud.create_insight(db, insight))
-    return stored
+def _get_job(db: Session, job_id: str) -> models.InsightJob:
+    job = db.get(models.InsightJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/insights/jobs", response_model=schemas.InsightJobOut, status_code=202)
+def submit_insight_job(
+    payload: schemas.InsightGenerateIn,
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    return jobs.manager.create(db, payload.start_time, payload.end_time, payload.cohort_label, _database_url())
+
+
+@app.get("/api/insights/jobs/{job_id}", response_model=schemas.InsightJobOut)
+def get_insight_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    return _get_job(db, job_id)
+
+
+@app.get("/api/insights/jobs/{job_id}/result", response_model=list[schemas.InsightOut])
+def get_insight_job_result(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    job = _get_job(db, job_id)
+    if job.status != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return crud.list_run_insights(db, job.run_id)
+
+
+@app.post("/api/insights/jobs/{job_id}/cancel", response_model=schemas.InsightJobOut)
+def cancel_insight_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    job = _get_job(db, job_id)
+    if not jobs.manager.cancel(db, job_id):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    db.refresh(job)
+    return job
+
+
+@app.post("/api/cohorts/recluster", response_model=schemas.CohortModelOut)
+def recluster_cohorts(
+    payload: schemas.ReclusterIn,
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    window = load_window(
+        db,
+        payload.start_time,
+        payload.end_time,
+        chunk_size=settings.LOAD_CHUNK_SIZE,
+        use_rollups=settings.USE_DAILY_ROLLUPS,
+        misuse_features=(),
+    )
+    feature_vectors = compute_user_feature_vectors(window.events, window.daily_counts)
+    if feature_vectors.empty:
+        raise HTTPException(status_code=400, detail="No events in window")
+    row, labels = cohorts.recluster(db, feature_vectors, k=payload.k)
+    return schemas.CohortModelOut(
+        version=row.id,
+        n_clusters=row.n_clusters,
+        samples_seen=row.samples_seen,
+        feature_columns=row.feature_columns,
+        cohort_sizes=dict(Counter(labels.values())),
+    )
+
+
+def _run_features(db: Session, run_id: int):
+    run = crud.get_insight_run(db, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Insight run not found")
+    return decode_feature_vectors(run.feature_columns, run.feature_vectors)
+
+
+@app.get("/api/insight-runs/{run_id}/features", response_model=schemas.FeatureVectorPage)
+def list_run_features(
+    run_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    matrix = _run_features(db, run_id)
+    return schemas.FeatureVectorPage(
+        run_id=run_id,
+        columns=matrix.columns,
+        total=len(matrix),
+        offset=offset,
+        limit=limit,
+        items=matrix.page(offset, limit),
+    )
+
+
+@app.get("/api/insight-runs/{run_id}/features/{user_id}", response_model=schemas.FeatureVectorOut)
+def get_run_user_features(
+    run_id: int,
+    user_id: int,
+    db: Session = Depends(get_db),
+    _: dict = Depends(get_current_user),
+):
+    features = _run_features(db, run_id).row(user_id)
+    if features is None:
+        raise HTTPException(status_code=404, detail="User not in run")
+    return schemas.FeatureVectorOut(user_id=user_id, features=features)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
 
 
 @app.get("/api/insights", response_model=list[schemas.InsightOut])
 def list_insights(
     limit: int = Query(10, ge=1, le=100),
+    cohort_label: str | None = Query(None, max_length=50),
+    insight_type: str | None = Query(None, alias="type", max_length=100),
+    min_score: float | None = Query(None),
+    run_id: int | None = Query(None),
+    cursor: str | None = Query(None, max_length=200),
+    if_none_match: str | None = Header(None),
     db: Session = Depends(get_db),
     _: dict = Depends(get_current_user),
 ):
-    return crud.list_insights(db, limit=limit)
+    # The ETag covers the query and the table version, so an unchanged poll is answered
+    # with 304 before the listing query runs.
+    query = [limit, cohort_label, insight_type, min_score, run_id, cursor]
+    version = crud.insights_version(db)
+    digest = hashlib.blake2b(json.dumps([version, query]).encode(), digest_size=12).hexdigest()
+    etag = f'"{digest}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        before = crud.decode_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+    rows = crud.list_insights(
+        db,
+        limit=limit,
+        cohort_label=cohort_label,
+        insight_type=insight_type,
+        min_score=min_score,
+        run_id=run_id,
+        before=before,
+    )
+    headers = {"ETag": etag}
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = crud.encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    # Rows are serialized straight from the result mappings, skipping pydantic.
+    return ORJSONResponse([dict(row) for row in rows], headers=headers)
+
+
+@app.get("/api/models/embedding")
+def embedding_model_stats(_: dict = Depends(get_current_user)):
+    cache = get_cache()
+    return {**get_registry().stats(), "cache": cache.stats() if cache else None}
+
+
+@app.get("/api/models/sentiment")
+def sentiment_backend_info(_: dict = Depends(get_current_user)):
+    # "backend" is what scores feedback; it differs from "configured" after a fallback.
+    return {
+        "configured": settings.SENTIMENT_BACKEND,
+        "backend": get_sentiment_backend().name,
+        "model_path": settings.SENTIMENT_MODEL_PATH,
+    }
+
+
+@app.get("/api/cache/results")
+def result_cache_stats(_: dict = Depends(get_current_user)):
+    return get_result_cache().stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/api/seed/demo")
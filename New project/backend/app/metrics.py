@@ -0,0 +1,238 @@
+import math
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ml import instrumentation
+
+# Metrics are per process. Insight jobs running in a process pool report into their
+# worker's registry, which /metrics does not see; the thread executor shares this one.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_BUCKETS = (1, 10, 100, 1_000, 5_000, 10_000, 50_000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state["count"] if state else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, dict(state, buckets=list(state["buckets"]))) for key, state in self._values.items())
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, state["buckets"]):
+                cumulative += hits
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self._metrics:
+            metric.reset()
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram("insight_stage_seconds", "Time spent in each insight generation stage.", ("stage",)))
+SQL_STATEMENTS = registry.register(Counter("sql_statements_total", "SQL statements executed.", ("operation",)))
+SQL_SECONDS = registry.register(Histogram("sql_statement_seconds", "SQL statement latency.", ("operation",)))
+INGEST_ROWS = registry.register(Counter("ingest_rows_total", "Rows ingested.", ("kind",)))
+INGEST_BATCH_ROWS = registry.register(
+    Histogram("ingest_batch_rows", "Rows per ingest insert batch.", ("kind",), buckets=BATCH_BUCKETS)
+)
+INGEST_SECONDS = registry.register(Histogram("ingest_seconds", "Insert time per ingest call.", ("kind",)))
+INGEST_RATE = registry.register(Gauge("ingest_rows_per_second", "Throughput of the most recent ingest call.", ("kind",)))
+HTTP_SECONDS = registry.register(
+    Histogram("http_request_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+)
+
+class RequestTimings:
+    # Per-request breakdown (stage -> seconds, plus SQL totals) used for the Server-Timing
+    # header. Pipeline stages and their SQL report from StageRun's worker threads (under a
+    # copied context) into the same instance, so updates and reads take the lock.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: dict[str, float] = {}
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_sql(self, seconds: float) -> None:
+        with self._lock:
+            self.sql_count += 1
+            self.sql_seconds += seconds
+
+    def header(self, total_seconds: float) -> str:
+        with self._lock:
+            stages, sql_count, sql_seconds = list(self.stages.items()), self.sql_count, self.sql_seconds
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages]
+        parts.append(f'sql;desc="{sql_count} statements";dur={sql_seconds * 1000:.1f}')
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_request_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add_stage(stage, seconds)
+
+
+def record_ingest(kind: str, rows: int, chunks: list[dict]) -> None:
+    seconds = sum(chunk["seconds"] for chunk in chunks)
+    INGEST_ROWS.inc(rows, kind=kind)
+    INGEST_SECONDS.observe(seconds, kind=kind)
+    for chunk in chunks:
+        INGEST_BATCH_ROWS.observe(chunk["rows"], kind=kind)
+    if seconds > 0:
+        INGEST_RATE.set(rows / seconds, kind=kind)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    SQL_STATEMENTS.inc(operation=operation)
+    SQL_SECONDS.observe(seconds, operation=operation)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add_sql(seconds)
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+_installed = False
+
+
+def install() -> None:
+    # Listening on the Engine class covers every engine, including ones created later
+    # (tests, job workers).
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    instrumentation.add_observer(observe_stage)
+    _installed = True
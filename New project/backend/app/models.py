@@ -1,5 +1,5 @@
-from datetime import datetime
-from sqlalchemy import JSON, DateTime, Float, ForeignKey, Integer, String, Text
+from datetime import date, datetime
+from sqlalchemy import JSON, Date, DateTime, FetchedValue, Float, ForeignKey, Index, Integer, LargeBinary, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .db.base import Base
 
@@ -11,7 +11,7 @@ class User(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     plan: Mapped[str] = mapped_column(String(50), default="free", nullable=False)
     country: Mapped[str | None] = mapped_column(String(2))
-    cohort_label: Mapped[str | None] = mapped_column(String(50))
+    cohort_label: Mapped[str | None] = mapped_column(String(50), index=True)
 
     events = relationship("Event", back_populates="user")
     feedback = relationship("Feedback", back_populates="user")
@@ -23,11 +23,18 @@ class Event(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
     event_type: Mapped[str] = mapped_column(String(100), index=True)
-    metadata: Mapped[dict] = mapped_column(JSON, default=dict)
+    # "metadata" is reserved on declarative classes, so the attribute is suffixed.
+    metadata_: Mapped[dict] = mapped_column("metadata", JSON, default=dict)
+    # metadata["feature"], normalized for misuse rules (ml.pipeline.metadata_feature).
+    # Migration 0009 makes it a generated column on PostgreSQL; otherwise ingest fills it.
+    feature: Mapped[str | None] = mapped_column(String(100), server_default=FetchedValue(), index=True)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
 
     user = relationship("User", back_populates="events")
 
+    # On PostgreSQL the table is range-partitioned by month on timestamp (migration 0007).
+    __table_args__ = (Index("ix_events_timestamp_user_id", "timestamp", "user_id"),)
+
 
 class Feedback(Base):
     __tablename__ = "feedback"
@@ -41,6 +48,70 @@ class Feedback(Base):
     user = relationship("User", back_populates="feedback")
 
 
+class UserDailyEventCount(Base):
+    __tablename__ = "user_daily_event_counts"
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    event_type: Mapped[str] = mapped_column(String(100), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class DailyRollupState(Base):
+    __tablename__ = "daily_rollup_state"
+
+    # A single row. Days in [stale_from, stale_to] may hold events the rollup has not
+    # counted yet: bulk loads write events first and rebuild the rollup afterwards.
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    stale_from: Mapped[date | None] = mapped_column(Date)
+    stale_to: Mapped[date | None] = mapped_column(Date)
+
+
+class CohortModelVersion(Base):
+    __tablename__ = "cohort_models"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    n_clusters: Mapped[int] = mapped_column(Integer, nullable=False)
+    feature_columns: Mapped[list] = mapped_column(JSON, default=list)
+    samples_seen: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    model: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class InsightRun(Base):
+    __tablename__ = "insight_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    cohort_label: Mapped[str | None] = mapped_column(String(50), index=True)
+    user_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    feature_columns: Mapped[list] = mapped_column(JSON, default=list)
+    feature_vectors: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    insights = relationship("Insight", back_populates="run")
+
+
+class InsightJob(Base):
+    __tablename__ = "insight_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), default="queued", nullable=False, index=True)
+    stage: Mapped[str | None] = mapped_column(String(50))
+    progress: Mapped[dict] = mapped_column(JSON, default=dict)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    cohort_label: Mapped[str | None] = mapped_column(String(50))
+    run_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("insight_runs.id"))
+    error: Mapped[str | None] = mapped_column(Text)
+    # Worker ("host:pid") running the job; it renews updated_at while the lease is held.
+    owner: Mapped[str | None] = mapped_column(String(100))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 class Insight(Base):
     __tablename__ = "insights"
 
@@ -50,3 +121,11 @@ class Insight(Base):
     payload: Mapped[dict] = mapped_column(JSON, default=dict)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
     explanation: Mapped[str | None] = mapped_column(Text)
+    run_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("insight_runs.id"), index=True)
+
+    run = relationship("InsightRun", back_populates="insights")
+
+    __table_args__ = (
+        Index("ix_insights_created_at_id", "created_at", "id"),
+        Index("ix_insights_type_created_at_id", "type", "created_at", "id"),
+    )
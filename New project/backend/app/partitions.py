@@ -0,0 +1,63 @@
+import re
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Monthly range partitions of `events` are named events_pYYYYMM (see migration 0007);
+# rows outside every partition land in events_default.
+PARTITION_PATTERN = re.compile(r"^events_p(\d{4})(\d{2})$")
+
+
+def partition_name(month: date) -> str:
+    return f"events_p{month.year:04d}{month.month:02d}"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.scalar(text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'events'::regclass)")))
+
+
+def list_partitions(db: Session) -> list[str]:
+    if not is_partitioned(db):
+        return []
+    rows = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'events'::regclass ORDER BY c.relname"
+    ))
+    return [row[0] for row in rows]
+
+
+def ensure_future_partitions(db: Session, months_ahead: int, today: date | None = None) -> int:
+    # No-op on SQLite and on an unpartitioned PostgreSQL table.
+    if not is_partitioned(db):
+        return 0
+    current = (today or date.today()).replace(day=1)
+    created = db.scalar(
+        text("SELECT ensure_event_partitions(:start, :months)"),
+        {"start": current, "months": months_ahead + 1},
+    )
+    db.commit()
+    return int(created or 0)
+
+
+def drop_partitions_before(db: Session, cutoff: date) -> list[str]:
+    # Retention by detaching and dropping whole months whose range ends on or before
+    # `cutoff`; far cheaper than a DELETE over the same rows.
+    dropped = []
+    for name in list_partitions(db):
+        match = PARTITION_PATTERN.match(name)
+        if match is None:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(month, 1) <= cutoff:
+            db.execute(text(f'ALTER TABLE events DETACH PARTITION "{name}"'))
+            db.execute(text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+    db.commit()
+    return dropped
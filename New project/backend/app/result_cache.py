@@ -0,0 +1,174 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+INSIGHT_LIST_ADAPTER = TypeAdapter(list[schemas.InsightOut])
+
+
+def _naive_utc(value: datetime | str) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _iso(value: datetime) -> str:
+    # Fixed-width so the disk tier can compare window bounds as strings.
+    return _naive_utc(value).isoformat(timespec="microseconds")
+
+
+def window_watermark(db: Session, start_time: datetime, end_time: datetime, cohort_label: str | None = None) -> list:
+    # Any insert landing in the window moves max(id) and count(*). Scoped runs also depend
+    # on users' cohort labels, which only change together with the cohort model.
+    start_time, end_time = _naive_utc(start_time), _naive_utc(end_time)
+    marks = []
+    for table in (models.Event, models.Feedback):
+        max_id, count = db.execute(
+            select(func.max(table.id), func.count()).where(table.timestamp >= start_time, table.timestamp <= end_time)
+        ).one()
+        marks.extend([max_id, count])
+    if cohort_label is not None:
+        version = db.execute(
+            select(models.CohortModelVersion.id, models.CohortModelVersion.updated_at)
+            .order_by(models.CohortModelVersion.id.desc())
+            .limit(1)
+        ).first()
+        marks.extend([version[0], version[1].isoformat()] if version else [None, None])
+    return marks
+
+
+class ResultCache:
+    # Two tiers: an in-process LRU and an optional SQLite file shared across workers.
+    def __init__(self, max_entries: int = 128, path: str | None = None, disk_max_entries: int = 1024):
+        self.max_entries = max(0, max_entries)
+        self.disk_max_entries = max(1, disk_max_entries)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, tuple[str, str, list[schemas.InsightOut]]] = OrderedDict()
+        self._disk: sqlite3.Connection | None = None
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, start_time TEXT NOT NULL, end_time TEXT NOT NULL, "
+                "payload BLOB NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS ix_result_cache_accessed ON result_cache (accessed_at)")
+
+    @staticmethod
+    def key(start_time: datetime, end_time: datetime, cohort_label: str | None, watermark: list) -> str:
+        return json.dumps([_iso(start_time), _iso(end_time), cohort_label, watermark])
+
+    def get(self, key: str) -> list[schemas.InsightOut] | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            row = None
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT start_time, end_time, payload FROM result_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._disk.execute(
+                "UPDATE result_cache SET accessed_at = ? WHERE key = ?", (datetime.utcnow().timestamp(), key)
+            )
+            value = INSIGHT_LIST_ADAPTER.validate_json(row[2])
+            self._remember(key, row[0], row[1], value)
+            self.disk_hits += 1
+            return value
+
+    def put(self, key: str, start_time: datetime, end_time: datetime, value: list[schemas.InsightOut]) -> None:
+        start, end = _iso(start_time), _iso(end_time)
+        with self._lock:
+            self._remember(key, start, end, value)
+            if self._disk is None:
+                return
+            self._disk.execute(
+                "INSERT OR REPLACE INTO result_cache (key, start_time, end_time, payload, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, start, end, INSIGHT_LIST_ADAPTER.dump_json(value), datetime.utcnow().timestamp()),
+            )
+            self._disk.execute(
+                "DELETE FROM result_cache WHERE key IN ("
+                "SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+
+    def _remember(self, key: str, start: str, end: str, value: list[schemas.InsightOut]) -> None:
+        if self.max_entries == 0:
+            return
+        self._memory[key] = (start, end, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, start_time: datetime, end_time: datetime) -> int:
+        # Drops every cached window overlapping [start_time, end_time].
+        start, end = _iso(start_time), _iso(end_time)
+        with self._lock:
+            stale = [key for key, (lo, hi, _) in self._memory.items() if lo <= end and hi >= start]
+            for key in stale:
+                del self._memory[key]
+            removed = len(stale)
+            if self._disk is not None:
+                cursor = self._disk.execute(
+                    "DELETE FROM result_cache WHERE start_time <= ? AND end_time >= ?", (end, start)
+                )
+                removed = max(removed, cursor.rowcount)
+            return removed
+
+    def invalidate_rows(self, rows: list[dict]) -> int:
+        timestamps = [_naive_utc(row["timestamp"]) for row in rows if row.get("timestamp") is not None]
+        if not timestamps:
+            return 0
+        return self.invalidate(min(timestamps), max(timestamps))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM result_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk_entries = self._disk.execute("SELECT count(*) FROM result_cache").fetchone()[0] if self._disk else None
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_entries": disk_entries,
+                "disk_max_entries": self.disk_max_entries if self._disk else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+_cache: ResultCache | None = None
+
+
+def configure_result_cache(max_entries: int, path: str | None = None, disk_max_entries: int = 1024) -> ResultCache:
+    global _cache
+    _cache = ResultCache(max_entries, path, disk_max_entries)
+    return _cache
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
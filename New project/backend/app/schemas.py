@@ -23,6 +23,21 @@ class InsightOut(BaseModel):
     payload: dict
     created_at: datetime
     explanation: str | None = None
+    run_id: int | None = None
+
+
+class FeatureVectorOut(BaseModel):
+    user_id: int
+    features: dict[str, int]
+
+
+class FeatureVectorPage(BaseModel):
+    run_id: int
+    columns: list[str]
+    total: int
+    offset: int
+    limit: int
+    items: list[FeatureVectorOut]
 
 
 class InsightGenerateIn(BaseModel):
@@ -31,6 +46,34 @@ class InsightGenerateIn(BaseModel):
     cohort_label: str | None = None
 
 
+class InsightJobOut(BaseModel):
+    id: str
+    status: str
+    stage: str | None = None
+    progress: dict = Field(default_factory=dict)
+    start_time: datetime
+    end_time: datetime
+    cohort_label: str | None = None
+    run_id: int | None = None
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class ReclusterIn(BaseModel):
+    start_time: datetime
+    end_time: datetime
+    k: int = Field(3, ge=1, le=50)
+
+
+class CohortModelOut(BaseModel):
+    version: int
+    n_clusters: int
+    samples_seen: int
+    feature_columns: list[str]
+    cohort_sizes: dict[str, int]
+
+
 class LoginIn(BaseModel):
     username: str
     password: str
@@ -0,0 +1,164 @@
+import json
+import zlib
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable
+from pydantic import TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-lines"}
+MAX_REPORTED_ERRORS = 100
+MAX_LINE_BYTES = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+@dataclass
+class StreamIngestResult:
+    ingested: int = 0
+    failed: int = 0
+    errors: list[dict] = field(default_factory=list)
+    chunks: list[dict] = field(default_factory=list)
+
+    def record_error(self, line: int, error) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+
+class _LineBuffer:
+    # Splits a byte stream into numbered lines. Each chunk is split once and only the
+    # current partial line is carried over, as pieces; a line that grows past
+    # max_line_bytes is dropped as it arrives and comes out as None.
+    def __init__(self, max_line_bytes: int):
+        self.max_line_bytes = max_line_bytes
+        self.parts: list[bytes] = []
+        self.size = 0
+        self.line_no = 0
+
+    def _extend(self, piece: bytes) -> None:
+        self.size += len(piece)
+        if self.size > self.max_line_bytes:
+            self.parts.clear()
+        elif piece:
+            self.parts.append(piece)
+
+    def _take(self) -> tuple[int, bytes | None]:
+        self.line_no += 1
+        line = b"".join(self.parts) if self.size <= self.max_line_bytes else None
+        self.parts, self.size = [], 0
+        return self.line_no, line
+
+    def feed(self, chunk: bytes) -> list[tuple[int, bytes | None]]:
+        *complete, rest = chunk.split(b"\n")
+        lines = []
+        for piece in complete:
+            self._extend(piece)
+            lines.append(self._take())
+        self._extend(rest)
+        return lines
+
+    def finish(self) -> list[tuple[int, bytes | None]]:
+        return [self._take()] if self.size else []
+
+
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+
+class _GzipInflater:
+    # Output is produced at most READ_SIZE bytes at a time, including what zlib still
+    # holds once the input is used up, so a small, highly compressed body never expands
+    # in memory all at once. Concatenated members (`cat a.gz b.gz`) are valid gzip and
+    # each gets a fresh decompressor; zero padding after a member is ignored.
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(GZIP_WBITS)
+        self.started = False
+
+    def feed(self, data: bytes):
+        while True:
+            if self.decompressor.eof:
+                data = (self.decompressor.unused_data + data).lstrip(b"\0")
+                if not data:
+                    return
+                self.decompressor = zlib.decompressobj(GZIP_WBITS)
+            self.started = self.started or bool(data)
+            out = self.decompressor.decompress(data, READ_SIZE)
+            data = self.decompressor.unconsumed_tail
+            if out:
+                yield out
+            if not data and len(out) < READ_SIZE and not self.decompressor.eof:
+                return
+
+    def finish(self) -> None:
+        if self.started and not self.decompressor.eof:
+            raise zlib.error("incomplete gzip stream")
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], gzipped: bool = False, max_line_bytes: int = MAX_LINE_BYTES
+) -> AsyncIterator[tuple[int, bytes | None]]:
+    # Yields (line number, line) for non-blank lines; None marks a line over max_line_bytes.
+    inflater = _GzipInflater() if gzipped else None
+    buffer = _LineBuffer(max_line_bytes)
+    async for chunk in chunks:
+        pieces = inflater.feed(chunk) if inflater is not None else (chunk,)
+        for piece in pieces:
+            for line_no, line in buffer.feed(piece):
+                if line is None or line.strip():
+                    yield line_no, line
+    if inflater is not None:
+        inflater.finish()
+    for line_no, line in buffer.finish():
+        if line is None or line.strip():
+            yield line_no, line
+
+
+def validate_chunk(adapter: TypeAdapter, lines: list[int], items: list, result: StreamIngestResult) -> list[dict]:
+    try:
+        return adapter.dump_python(adapter.validate_python(items))
+    except ValidationError as exc:
+        bad: dict[int, list] = {}
+        for err in exc.errors(include_url=False, include_input=False):
+            bad.setdefault(err["loc"][0], []).append({"loc": list(err["loc"][1:]), "msg": err["msg"]})
+    for index, errors in bad.items():
+        result.record_error(lines[index], errors)
+    good = [item for i, item in enumerate(items) if i not in bad]
+    return adapter.dump_python(adapter.validate_python(good)) if good else []
+
+
+async def ingest_ndjson(
+    chunks: AsyncIterator[bytes],
+    adapter: TypeAdapter,
+    flush: Callable[[list[dict]], object],
+    batch_size: int,
+    gzipped: bool = False,
+    max_line_bytes: int = MAX_LINE_BYTES,
+) -> StreamIngestResult:
+    # Lines are validated and written one batch at a time so memory stays bounded by
+    # batch_size and max_line_bytes regardless of the upload size.
+    result = StreamIngestResult()
+    lines: list[int] = []
+    items: list = []
+
+    async def flush_pending() -> None:
+        rows = validate_chunk(adapter, lines, items, result)
+        lines.clear()
+        items.clear()
+        if rows:
+            written = await run_in_threadpool(flush, rows)
+            result.ingested += written.count
+            result.chunks.extend(written.chunks)
+
+    async for line_no, line in iter_lines(chunks, gzipped, max_line_bytes):
+        if line is None:
+            result.record_error(line_no, f"line exceeds {max_line_bytes} bytes")
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as exc:
+            result.record_error(line_no, str(exc))
+            continue
+        lines.append(line_no)
+        if len(items) >= batch_size:
+            await flush_pending()
+    if items:
+        await flush_pending()
+    return result
@@ -1,14 +1,18 @@
 import os
+import json
+import pandas as pd
+import pytest
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, update
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
 from app.db.base import Base
-from app import models
+from app import models, schemas
 import app.db.session as session
 from app.main import app
 from app.core.security import FIXTURE_USER
+from app.result_cache import ResultCache, get_result_cache
 
 
 def setup_db(tmp_path):
@@ -17,6 +21,7 @@ def setup_db(tmp_path):
     session.engine = engine
     session.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     Base.metadata.create_all(bind=engine)
+    get_result_cache().clear()
     db = session.SessionLocal()
     db.add(models.User(id=1, plan="free", country="US"))
     db.commit()
@@ -62,3 +67,676 @@ def test_event_and_insight_flow(tmp_path):
     res = client.get("/api/insights?limit=10", headers=headers)
     assert res.status_code == 200
     assert isinstance(res.json(), list)
+
+
+def test_embedding_model_stats(tmp_path):
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+
+    res = client.get("/api/models/embedding", headers=headers)
+    assert res.status_code == 200
+    assert res.json()["model_name"]
+
+    res = client.get("/api/models/sentiment", headers=headers)
+    assert res.status_code == 200
+    assert res.json()["backend"] == "embedding"
+
+
+def test_bulk_event_ingest_reports_chunks(tmp_path):
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+
+    batch = [
+        {"user_id": 1, "event_type": "feature_use", "metadata": {"feature": "export"}}
+        for _ in range(5)
+    ]
+    res = client.post("/api/events?batch_size=2", json=batch, headers=headers)
+    assert res.status_code == 200
+    body = res.json()
+    assert body["ingested"] == 5
+    assert [c["rows"] for c in body["chunks"]] == [2, 2, 1]
+
+    db = session.SessionLocal()
+    stored = db.query(models.Event).all()
+    db.close()
+    assert len(stored) == 5
+    assert stored[0].metadata_ == {"feature": "export"}
+
+
+def test_ndjson_stream_ingest_reports_line_errors(tmp_path):
+    import gzip
+    import json
+
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+
+    lines = [json.dumps({"user_id": 1, "event_type": "login"}) for _ in range(4)]
+    lines.insert(2, "{not json")
+    lines.insert(4, json.dumps({"user_id": "abc", "event_type": "login"}))
+    body = gzip.compress(("\n".join(lines) + "\n").encode())
+
+    res = client.post(
+        "/api/events/stream?batch_size=2",
+        content=body,
+        headers={**headers, "Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+    )
+    assert res.status_code == 200
+    result = res.json()
+    assert result["ingested"] == 4
+    assert result["failed"] == 2
+    assert [e["line"] for e in result["errors"]] == [3, 5]
+
+
+def test_ndjson_stream_bounds_inflated_chunks_and_line_length(tmp_path, monkeypatch):
+    import asyncio
+    import gzip
+    import zlib
+    from app import streaming
+    from app.core.config import settings
+
+    # A small gzip body that inflates to 8 MiB is never expanded in one piece.
+    bomb = gzip.compress(b"\n" * (8 * 1024 * 1024))
+    inflater = streaming._GzipInflater()
+    pieces = [*inflater.feed(bomb[:100]), *inflater.feed(bomb[100:])]
+    inflater.finish()
+    assert max(len(p) for p in pieces) <= streaming.READ_SIZE
+    assert sum(len(p) for p in pieces) == 8 * 1024 * 1024
+
+    async def collect(chunks, gzipped=False):
+        async def source():
+            for chunk in chunks:
+                yield chunk
+        return [item async for item in streaming.iter_lines(source(), gzipped, max_line_bytes=8)]
+
+    # Lines split across chunks are joined; an oversized one is reported without being kept.
+    assert asyncio.run(collect([b"ab", b"c\n", b"x" * 5, b"x" * 5, b"\nok\n\nend"])) == [
+        (1, b"abc"), (2, None), (3, b"ok"), (5, b"end"),
+    ]
+    # Every member of a multi-member body is read, wherever the chunks split it.
+    members = gzip.compress(b"a\nb") + gzip.compress(b"c\nd\n") + b"\0" * 4
+    for split in (5, len(gzip.compress(b"a\nb")), len(members) - 2):
+        chunks = [members[:split], members[split:]]
+        assert asyncio.run(collect(chunks, gzipped=True)) == [(1, b"a"), (2, b"bc"), (3, b"d")]
+    with pytest.raises(zlib.error):
+        asyncio.run(collect([members[:-12]], gzipped=True))
+    with pytest.raises(zlib.error):
+        asyncio.run(collect([gzip.compress(b"a\n") + b"trailing junk"], gzipped=True))
+
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+    monkeypatch.setattr(settings, "STREAM_MAX_LINE_BYTES", 64)
+    line = json.dumps({"user_id": 1, "event_type": "login"})
+    huge = json.dumps({"user_id": 1, "event_type": "login", "metadata": {"blob": "x" * 500}})
+    res = client.post(
+        "/api/events/stream",
+        content="\n".join([line, huge, line]).encode(),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    result = res.json()
+    assert result["ingested"] == 2
+    assert result["errors"] == [{"line": 2, "error": "line exceeds 64 bytes"}]
+
+    res = client.post("/api/events/stream", content=b"{}", headers={**headers, "Content-Type": "text/plain"})
+    assert res.status_code == 415
+
+
+def test_load_window_builds_typed_frames(tmp_path):
+    from app import crud
+    from app.loaders import load_window
+
+    setup_db(tmp_path)
+    db = session.SessionLocal()
+    now = datetime.utcnow()
+    crud.create_events(db, [
+        {"user_id": 1, "event_type": "login", "metadata": {}, "timestamp": now},
+        {"user_id": 1, "event_type": "feature_use", "metadata": {"feature": "export"}, "timestamp": now},
+        {"user_id": 1, "event_type": "login", "metadata": {}, "timestamp": now - timedelta(days=30)},
+    ])
+    crud.create_feedback(db, [{"user_id": 1, "text": "Buggy", "rating": None, "timestamp": now}])
+
+    window = load_window(db, now - timedelta(days=1), now + timedelta(days=1), chunk_size=1)
+    db.close()
+
+    assert len(window.events) == 2
+    assert str(window.events["user_id"].dtype) == "int32"
+    assert str(window.events["event_type"].dtype) == "category"
+    assert str(window.events["timestamp"].dtype) == "datetime64[ns]"
+    assert window.events["metadata"].tolist() == [{}, {"feature": "export"}]
+    assert window.events["feature"].tolist()[1:] == ["export"] and window.events["feature"].isna().tolist() == [True, False]
+    assert window.feedback["rating"].isna().all()
+    assert [(s.table, s.rows) for s in window.stats] == [("events", 2), ("feedback", 1), ("users", 1)]
+
+
+def test_create_all_schema_fills_feature_at_ingest(tmp_path):
+    from app import crud
+    from app.loaders import load_window
+
+    # create_all makes events.feature a plain column, so ingest has to write it.
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    metadata = [{"feature": "export"}] * 3 + [{"a": {"feature": "export"}}, {"feature": 5}, {}]
+    client.post("/api/events", json=[
+        {"user_id": 1, "event_type": "feature_use", "metadata": m, "timestamp": now.isoformat()} for m in metadata
+    ], headers=headers)
+
+    db = session.SessionLocal()
+    assert crud.writes_generated_columns(db)
+    window = load_window(db, now - timedelta(days=1), now + timedelta(days=1))
+    db.close()
+    assert window.events["feature"].tolist()[:3] == ["export"] * 3
+    assert window.events["feature"].isna().tolist() == [False] * 3 + [True] * 3
+
+    res = client.post("/api/insights/generate", json={
+        "start_time": (now - timedelta(days=1)).isoformat(),
+        "end_time": (now + timedelta(days=1)).isoformat(),
+    }, headers=headers)
+    misuse = [i["payload"] for i in res.json() if i["type"] == "feature_misuse"]
+    assert misuse == [{"user_id": 1, "feature": "export", "count": 3}]
+
+
+def test_event_ingest_maintains_daily_rollups(tmp_path):
+    from app import crud
+    from app.loaders import load_window
+
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+    day = datetime(2026, 3, 10, 12, 0)
+    batch = [
+        {"user_id": 1, "event_type": "login", "timestamp": (day + timedelta(days=i % 4, hours=i % 6)).isoformat()}
+        for i in range(12)
+    ]
+    batch[1]["metadata"] = {"feature": "export"}
+    assert client.post("/api/events", json=batch[:6], headers=headers).status_code == 200
+    assert client.post("/api/events", json=batch[6:], headers=headers).status_code == 200
+
+    db = session.SessionLocal()
+    rollups = db.query(models.UserDailyEventCount).order_by(models.UserDailyEventCount.day).all()
+    assert [r.count for r in rollups] == [3, 3, 3, 3]
+
+    assert crud.backfill_daily_counts(db) == 4
+    start, end = day + timedelta(hours=2), day + timedelta(days=3, hours=1)
+    raw = load_window(db, start, end).events
+    window = load_window(db, start, end, use_rollups=True, misuse_features={"export"})
+    per_day = window.daily_counts.groupby("day")["count"].sum().tolist()
+    assert per_day == raw.groupby(raw["timestamp"].dt.normalize()).size().tolist()
+    # Counts come from the rollup; only the rows misuse rules look at are read raw.
+    assert window.events["feature"].tolist() == ["export"]
+    assert load_window(db, start, end, use_rollups=True, misuse_features=()).events.empty
+
+    # Events written around the rollup (bulk loads) send covered windows back to raw events.
+    crud.mark_rollups_stale(db, (day + timedelta(days=2)).date(), (day + timedelta(days=2)).date())
+    db.commit()
+    stale = load_window(db, start, end, use_rollups=True, misuse_features={"export"})
+    assert stale.daily_counts is None and len(stale.events) == len(raw)
+    assert load_window(db, start, day + timedelta(days=2), use_rollups=True).daily_counts is not None
+
+    crud.backfill_daily_counts(db, (day + timedelta(days=1)).date(), (day + timedelta(days=2)).date())
+    assert load_window(db, start, end, use_rollups=True).daily_counts is not None
+    db.close()
+
+
+def test_generation_counts_events_stored_before_rollup_state(tmp_path):
+    from app import crud
+
+    # create_all schema whose events were written without maintaining the rollup.
+    setup_db(tmp_path)
+    now = datetime.utcnow()
+    db = session.SessionLocal()
+    db.add_all([
+        models.Event(user_id=1, event_type="login", metadata_={}, timestamp=now - timedelta(days=i % 3))
+        for i in range(6)
+    ])
+    db.commit()
+    db.close()
+    window = {"start_time": (now - timedelta(days=4)).isoformat(), "end_time": (now + timedelta(days=1)).isoformat()}
+
+    def event_count(client, headers):
+        get_result_cache().clear()
+        run_id = client.post("/api/insights/generate", json=window, headers=headers).json()[0]["run_id"]
+        return client.get(f"/api/insight-runs/{run_id}/features/1", headers=headers).json()["features"]["event_count"]
+
+    client = TestClient(app)
+    headers = auth_header(client)
+    assert event_count(client, headers) == 6
+    with TestClient(app) as started:
+        db = session.SessionLocal()
+        state = db.get(models.DailyRollupState, crud.ROLLUP_STATE_ID)
+        assert (state.stale_from, state.stale_to) == ((now - timedelta(days=2)).date(), now.date())
+        assert event_count(started, headers) == 6
+        crud.backfill_daily_counts(db)
+        assert db.get(models.DailyRollupState, crud.ROLLUP_STATE_ID, populate_existing=True).stale_from is None
+        db.close()
+        assert event_count(started, headers) == 6
+
+
+def test_generation_run_stores_feature_vectors_once(tmp_path):
+    setup_db(tmp_path)
+    db = session.SessionLocal()
+    db.add(models.User(id=2, plan="pro", country="GB"))
+    db.commit()
+    db.close()
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    batch = [
+        {"user_id": uid, "event_type": "login", "timestamp": now.isoformat()}
+        for uid in (1, 2, 2)
+    ]
+    client.post("/api/events", json=batch, headers=headers)
+
+    res = client.post("/api/insights/generate", json={
+        "start_time": (now - timedelta(days=1)).isoformat(),
+        "end_time": (now + timedelta(days=1)).isoformat(),
+    }, headers=headers)
+    insights = res.json()
+    # The matrix lives on the run: insights carry only their own fields and small payloads.
+    assert all(set(i) == set(schemas.InsightOut.model_fields) for i in insights)
+    assert all(len(json.dumps(i["payload"])) < 200 for i in insights)
+    run_id = insights[0]["run_id"]
+    assert run_id is not None
+
+    page = client.get(f"/api/insight-runs/{run_id}/features?limit=1", headers=headers).json()
+    assert page["total"] == 2
+    assert page["items"] == [{"user_id": 1, "features": {"login": 1, "event_count": 1}}]
+
+    res = client.get(f"/api/insight-runs/{run_id}/features/2", headers=headers)
+    assert res.json()["features"]["event_count"] == 2
+    assert client.get(f"/api/insight-runs/{run_id}/features/99", headers=headers).status_code == 404
+
+
+def test_create_insights_bulk_returns_ids_in_order(tmp_path):
+    from app import crud
+
+    setup_db(tmp_path)
+    db = session.SessionLocal()
+    run = crud.create_insight_run(db, datetime(2026, 1, 1), datetime(2026, 1, 2), pd.DataFrame(), commit=False)
+    insights = [
+        {"type": "feature_misuse", "score": float(i), "payload": {"user_id": i}, "explanation": None}
+        for i in range(7)
+    ]
+    stored = crud.create_insights(db, insights, run_id=run.id, batch_size=3)
+
+    assert [s.payload["user_id"] for s in stored] == list(range(7))
+    rows = db.query(models.Insight).order_by(models.Insight.id).all()
+    assert [(r.id, r.payload["user_id"], r.run_id) for r in rows] == [(s.id, s.payload["user_id"], run.id) for s in stored]
+    db.close()
+
+
+def _wait_for_job(client, headers, job_id, timeout=30.0):
+    import time
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/api/insights/jobs/{job_id}", headers=headers).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_insight_job_lifecycle_and_recovery(tmp_path, monkeypatch):
+    from app import jobs
+    from app.core.config import settings
+
+    setup_db(tmp_path)
+    monkeypatch.setattr(settings, "JOB_EXECUTOR", "thread")
+    monkeypatch.setattr(jobs, "manager", jobs.JobManager())
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    client.post("/api/events", json={"user_id": 1, "event_type": "login", "timestamp": now.isoformat()}, headers=headers)
+    window = {"start_time": (now - timedelta(days=1)).isoformat(), "end_time": (now + timedelta(days=1)).isoformat()}
+
+    res = client.post("/api/insights/jobs", json=window, headers=headers)
+    assert res.status_code == 202
+    job = _wait_for_job(client, headers, res.json()["id"])
+    assert job["status"] == "succeeded"
+    assert set(job["progress"]) == {"load", "features", "cluster", "detect", "persist"}
+    assert all(stage["status"] == "done" for stage in job["progress"].values())
+
+    result = client.get(f"/api/insights/jobs/{job['id']}/result", headers=headers).json()
+    assert result and all(i["run_id"] == job["run_id"] for i in result)
+    assert client.post(f"/api/insights/jobs/{job['id']}/cancel", headers=headers).status_code == 409
+
+    # Only expired leases are taken over; a job another live process renews is left alone.
+    db = session.SessionLocal()
+    for job_id, renewed in (("interrupted", now - timedelta(hours=1)), ("elsewhere", now)):
+        db.add(models.InsightJob(
+            id=job_id, status="running", stage="detect", progress={}, owner="other-host:1",
+            start_time=now - timedelta(days=1), end_time=now + timedelta(days=1), updated_at=renewed,
+        ))
+    db.commit()
+    assert jobs.manager.recover(db, str(session.engine.url)) == 1
+    db.close()
+    assert _wait_for_job(client, headers, "interrupted")["status"] == "succeeded"
+    elsewhere = client.get("/api/insights/jobs/elsewhere", headers=headers).json()
+    assert elsewhere["status"] == "running" and elsewhere["stage"] == "detect"
+    jobs.manager.shutdown()
+
+
+def test_stage_tracker_stops_once_the_lease_is_taken_over(tmp_path):
+    from app import jobs
+
+    setup_db(tmp_path)
+    now = datetime.utcnow()
+    db = session.SessionLocal()
+    db.add(models.InsightJob(
+        id="taken", status="queued", progress={}, start_time=now - timedelta(days=1), end_time=now,
+    ))
+    db.commit()
+    assert jobs._claim(db, "taken", "old-host:1")
+    tracker = jobs.StageTracker(db, "taken", "old-host:1")
+    tracker("load")
+
+    # recover() elsewhere requeued the job and a new worker claimed it and moved on.
+    db.execute(update(models.InsightJob).values(status="queued", owner=None))
+    assert jobs._claim(db, "taken", "new-host:2")
+    jobs.StageTracker(db, "taken", "new-host:2")("cluster")
+    with pytest.raises(jobs.JobCancelled):
+        tracker("features")
+    tracker.finish()
+    job = db.get(models.InsightJob, "taken", populate_existing=True)
+    assert (job.owner, job.stage, set(job.progress)) == ("new-host:2", "cluster", {"cluster"})
+    db.close()
+
+
+def test_job_cancelled_during_persist_rolls_back_run_and_cohorts(tmp_path, monkeypatch):
+    from app import jobs
+
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    client.post("/api/events", json=[
+        {"user_id": 1, "event_type": "login", "timestamp": now.isoformat()} for _ in range(3)
+    ], headers=headers)
+    db = session.SessionLocal()
+    db.add(models.InsightJob(
+        id="cancelled", status="queued", progress={}, start_time=now - timedelta(days=1), end_time=now + timedelta(days=1),
+    ))
+    db.commit()
+    db.close()
+
+    # The cancel lands after the persist stage has started, past the last stage check.
+    track = jobs.StageTracker.__call__
+
+    def cancel_on_persist(tracker, stage):
+        track(tracker, stage)
+        if stage == "persist":
+            with session.SessionLocal() as other:
+                assert jobs.manager.cancel(other, "cancelled")
+
+    monkeypatch.setattr(jobs.StageTracker, "__call__", cancel_on_persist)
+    assert jobs.execute_job("cancelled", str(session.engine.url)) == jobs.CANCELLED
+
+    db = session.SessionLocal()
+    job = db.get(models.InsightJob, "cancelled")
+    assert (job.status, job.run_id) == ("cancelled", None)
+    assert db.query(models.InsightRun).count() == 0 and db.query(models.Insight).count() == 0
+    assert db.query(models.CohortModelVersion).count() == 0
+    assert db.get(models.User, 1).cohort_label is None
+    db.close()
+
+
+def test_cohort_assignment_persists_model_and_recluster_keeps_labels(tmp_path):
+    setup_db(tmp_path)
+    db = session.SessionLocal()
+    db.add_all([models.User(id=i, plan="free", country="US") for i in range(2, 13)])
+    db.commit()
+    db.close()
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    batch = [
+        {"user_id": uid, "event_type": "login" if uid % 3 else "feature_use", "timestamp": now.isoformat()}
+        for uid in range(1, 13)
+        for _ in range(uid % 4 + 1)
+    ]
+    client.post("/api/events", json=batch, headers=headers)
+    window = {"start_time": (now - timedelta(days=1)).isoformat(), "end_time": (now + timedelta(days=1)).isoformat()}
+
+    assert client.post("/api/insights/generate", json=window, headers=headers).status_code == 200
+    db = session.SessionLocal()
+    before = {u.id: u.cohort_label for u in db.query(models.User)}
+    assert db.query(models.CohortModelVersion).count() == 1
+    db.close()
+    assert all(label and label.startswith("cohort_") for label in before.values())
+
+    res = client.post("/api/cohorts/recluster", json=window, headers=headers)
+    assert res.status_code == 200
+    assert res.json()["version"] == 2
+    db = session.SessionLocal()
+    after = {u.id: u.cohort_label for u in db.query(models.User)}
+    db.close()
+    assert after == before
+
+
+def test_cohort_scoped_generation_and_listing(tmp_path):
+    setup_db(tmp_path)
+    db = session.SessionLocal()
+    db.query(models.User).filter(models.User.id == 1).update({"cohort_label": "cohort_0"})
+    db.add(models.User(id=2, plan="pro", country="GB", cohort_label="cohort_1"))
+    db.commit()
+    db.close()
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    client.post("/api/events", json=[
+        {"user_id": uid, "event_type": "login", "timestamp": now.isoformat()} for uid in (1, 2, 2)
+    ], headers=headers)
+    window = {"start_time": (now - timedelta(days=1)).isoformat(), "end_time": (now + timedelta(days=1)).isoformat()}
+
+    res = client.post("/api/insights/generate", json={**window, "cohort_label": "cohort_1"}, headers=headers)
+    run_id = res.json()[0]["run_id"]
+    assert all(i["payload"]["cohort"] == "cohort_1" for i in res.json())
+    page = client.get(f"/api/insight-runs/{run_id}/features", headers=headers).json()
+    assert [item["user_id"] for item in page["items"]] == [2]
+
+    db = session.SessionLocal()
+    assert db.query(models.CohortModelVersion).count() == 0
+    db.close()
+
+    client.post("/api/insights/generate", json=window, headers=headers)
+    scoped = client.get("/api/insights?limit=100&cohort_label=cohort_1", headers=headers).json()
+    assert {i["id"] for i in res.json()} <= {i["id"] for i in scoped}
+    assert len(client.get("/api/insights?limit=100", headers=headers).json()) > len(scoped)
+
+    # Insights about a cohort's users come back from full-population runs too. (The full
+    # run above relabelled users, so the labels are pinned again.)
+    db = session.SessionLocal()
+    for uid, label in ((1, "cohort_0"), (2, "cohort_1")):
+        db.query(models.User).filter(models.User.id == uid).update({"cohort_label": label})
+    full = models.InsightRun(start_time=now, end_time=now, feature_vectors=b"")
+    db.add(full)
+    db.flush()
+    db.add_all([
+        models.Insight(type="feature_misuse", score=3.0, payload={"user_id": 2}, run_id=full.id),
+        models.Insight(type="feature_misuse", score=3.0, payload={"user_id": 1}, run_id=full.id),
+        models.Insight(type="sentiment_mismatch", score=0.5, payload={"count": 1}, run_id=full.id),
+    ])
+    db.commit()
+    full_id = full.id
+    db.close()
+    scoped = client.get("/api/insights?limit=100&cohort_label=cohort_1&type=feature_misuse", headers=headers)
+    assert [(i["run_id"], i["payload"]) for i in scoped.json()] == [(full_id, {"user_id": 2})]
+    others = client.get("/api/insights?limit=100&cohort_label=cohort_0", headers=headers).json()
+    assert {"user_id": 1} in [i["payload"] for i in others]
+    assert all(i["run_id"] != run_id and i["payload"].get("user_id") != 2 for i in others)
+
+
+def test_event_partition_helpers_are_noops_on_sqlite(tmp_path):
+    from datetime import date
+    from app import partitions
+
+    setup_db(tmp_path)
+    assert partitions.partition_name(date(2026, 1, 1)) == "events_p202601"
+    assert partitions.add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert partitions.add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    db = session.SessionLocal()
+    assert not partitions.is_partitioned(db)
+    assert partitions.ensure_future_partitions(db, 3) == 0
+    assert partitions.drop_partitions_before(db, date(2100, 1, 1)) == []
+    db.close()
+
+
+def test_startup_survives_partition_maintenance_errors(tmp_path, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from app import partitions
+
+    def fail(db, months_ahead):
+        raise OperationalError("SELECT ensure_event_partitions(...)", {}, Exception("default partition holds rows"))
+
+    setup_db(tmp_path)
+    monkeypatch.setattr(partitions, "ensure_future_partitions", fail)
+    with TestClient(app) as client:
+        assert client.post("/api/auth/login", json=FIXTURE_USER).status_code == 200
+
+
+def test_generate_reuses_cached_window_until_ingest_overlaps(tmp_path):
+    setup_db(tmp_path)
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    client.post("/api/events", json=[{"user_id": 1, "event_type": "login", "timestamp": now.isoformat()}], headers=headers)
+    window = {"start_time": (now - timedelta(days=1)).isoformat(), "end_time": (now + timedelta(days=1)).isoformat()}
+
+    first = client.post("/api/insights/generate", json=window, headers=headers)
+    second = client.post("/api/insights/generate", json=window, headers=headers)
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("miss", "hit")
+    assert second.json() == first.json()
+
+    old = (now - timedelta(days=30)).isoformat()
+    client.post("/api/events", json=[{"user_id": 1, "event_type": "login", "timestamp": old}], headers=headers)
+    assert client.post("/api/insights/generate", json=window, headers=headers).headers["X-Cache"] == "hit"
+
+    client.post("/api/events", json=[{"user_id": 1, "event_type": "logout", "timestamp": now.isoformat()}], headers=headers)
+    assert get_result_cache().stats()["entries"] == 0
+    assert client.post("/api/insights/generate", json=window, headers=headers).headers["X-Cache"] == "miss"
+
+
+def test_result_cache_disk_tier_is_bounded(tmp_path):
+    path = str(tmp_path / "results.db")
+    cache = ResultCache(max_entries=1, path=path, disk_max_entries=2)
+    day = datetime(2026, 1, 1)
+    insight = schemas.InsightOut(id=1, type="t", score=1.0, payload={}, created_at=day)
+    for offset in range(3):
+        start = day + timedelta(days=offset)
+        cache.put(cache.key(start, start + timedelta(days=1), None, [offset]), start, start + timedelta(days=1), [insight])
+    assert cache.stats()["disk_entries"] == 2
+
+    reopened = ResultCache(max_entries=4, path=path, disk_max_entries=2)
+    assert reopened.get(cache.key(day, day + timedelta(days=1), None, [0])) is None
+    key = cache.key(day + timedelta(days=2), day + timedelta(days=3), None, [2])
+    assert reopened.get(key)[0].id == 1
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.invalidate(day + timedelta(days=2, hours=12), day + timedelta(days=2, hours=13)) == 1
+    assert reopened.get(key) is None
+
+
+def test_insights_listing_keyset_pagination_filters_and_etag(tmp_path):
+    setup_db(tmp_path)
+    db = session.SessionLocal()
+    created = datetime(2026, 1, 1)
+    for idx in range(5):
+        # Two insights share each timestamp so the id tiebreak is exercised.
+        db.add(models.Insight(type="a" if idx % 2 else "b", score=float(idx), payload={}, created_at=created + timedelta(hours=idx // 2)))
+    db.commit()
+    db.close()
+    client = TestClient(app)
+    headers = auth_header(client)
+
+    first = client.get("/api/insights?limit=2", headers=headers)
+    second = client.get(f"/api/insights?limit=2&cursor={first.headers['X-Next-Cursor']}", headers=headers)
+    third = client.get(f"/api/insights?limit=2&cursor={second.headers['X-Next-Cursor']}", headers=headers)
+    assert [i["id"] for i in first.json() + second.json() + third.json()] == [5, 4, 3, 2, 1]
+    assert "X-Next-Cursor" not in third.headers
+
+    assert [i["id"] for i in client.get("/api/insights?type=a&min_score=2", headers=headers).json()] == [4]
+    assert client.get("/api/insights?cursor=bogus", headers=headers).status_code == 400
+
+    cached = client.get("/api/insights?limit=2", headers={**headers, "If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304
+    db = session.SessionLocal()
+    db.add(models.Insight(type="a", score=1.0, payload={}, created_at=created + timedelta(days=1)))
+    db.commit()
+    db.close()
+    assert client.get("/api/insights?limit=2", headers={**headers, "If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_metrics_endpoint_and_server_timing_header(tmp_path, monkeypatch):
+    from app import metrics
+    from app.core.config import settings
+
+    setup_db(tmp_path)
+    monkeypatch.setattr(settings, "TIMING_HEADER", True)
+    client = TestClient(app)
+    headers = auth_header(client)
+    now = datetime.utcnow()
+    before = metrics.INGEST_ROWS.value(kind="events")
+    client.post("/api/events?batch_size=2", json=[
+        {"user_id": 1, "event_type": "login", "timestamp": now.isoformat()} for _ in range(3)
+    ], headers=headers)
+    assert metrics.INGEST_ROWS.value(kind="events") == before + 3
+
+    window = {"start_time": (now - timedelta(days=1)).isoformat(), "end_time": (now + timedelta(days=1)).isoformat()}
+    res = client.post("/api/insights/generate", json=window, headers=headers)
+    timing = res.headers["Server-Timing"]
+    for stage in ("generation.load", "generation.detect", "pipeline.sentiment", "sql;"):
+        assert stage in timing
+
+    # Stage threads share the request's timings through copied contexts.
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+
+    shared = metrics.start_request_timings()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(8):
+            pool.submit(copy_context().run, lambda: [metrics.observe_stage("test.stage", 0.001) for _ in range(500)])
+    assert shared.stages["test.stage"] == pytest.approx(4.0)
+    assert shared.header(1.0).startswith("test.stage;dur=4000.0, sql;")
+
+    body = client.get("/metrics").text
+    assert 'insight_stage_seconds_count{stage="generation.persist"}' in body
+    assert 'sql_statements_total{operation="SELECT"}' in body
+    assert 'ingest_batch_rows_bucket{kind="events",le="10"}' in body
+    assert 'http_request_seconds_count{method="POST",route="/api/insights/generate",status="200"}' in body
+
+
+def test_bulk_loader_streams_csv_and_resumes_from_checkpoint(tmp_path):
+    from pathlib import Path
+    from app import bulk_load
+
+    setup_db(tmp_path)
+    source = Path(tmp_path / "events.csv")
+    source.write_text(
+        "user_id,event_type,metadata,timestamp\n"
+        '1,feature_use,"{""feature"": ""export""}",2026-01-01T10:00:00\n'
+        "1,feature_use,{'feature': 'import'},2026-01-01T11:00:00Z\n"
+        "1,login,{},2026-01-02T09:00:00\n"
+        '1,login,"{""msg"": ""it\'s"", ""flag"": true, ""ref"": null}",2026-01-02T10:00:00\n'
+    )
+    checkpoint = bulk_load.Checkpoint(tmp_path / "load.ckpt")
+    checkpoint.mark("events", source, 1)
+
+    db = session.SessionLocal()
+    with bulk_load.indexes_dropped(db, [models.Event.__table__]) as dropped:
+        assert "ix_events_timestamp_user_id" in {ix.name for ix in dropped}
+        report = bulk_load.load_file(db, "events", source, chunk_rows=2, checkpoint=checkpoint)
+    assert (report.rows, report.skipped) == (3, 1)
+    assert bulk_load.Checkpoint(tmp_path / "load.ckpt").done("events", source) == 4
+    assert bulk_load.refresh_rollups(db, report) == 2
+
+    events = db.query(models.Event).order_by(models.Event.timestamp).all()
+    assert [e.metadata_ for e in events] == [{"feature": "import"}, {}, {"msg": "it's", "flag": True, "ref": None}]
+    assert [e.feature for e in events] == ["import", None, None]
+    assert events[0].timestamp == datetime(2026, 1, 1, 11)
+    in_range = db.query(models.Event).filter(models.Event.timestamp >= datetime(2026, 1, 2)).count()
+    assert in_range == 2
+    db.close()
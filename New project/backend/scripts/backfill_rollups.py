@@ -0,0 +1,28 @@
+import argparse
+import os
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app import crud
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild user_daily_event_counts from raw events")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="first day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "sqlite+pysqlite:///./app.db")
+    engine = create_engine(database_url, pool_pre_ping=True)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with SessionLocal() as db:
+        rows = crud.backfill_daily_counts(db, args.start, args.end)
+    print(f"Backfilled {rows} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
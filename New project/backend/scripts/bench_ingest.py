@@ -0,0 +1,80 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app import crud, models
+
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 50_000]
+
+
+def make_events(n: int, users: int = 100) -> list[dict]:
+    start = datetime.utcnow() - timedelta(days=30)
+    return [
+        {
+            "user_id": i % users + 1,
+            "event_type": "feature_use" if i % 3 else "login",
+            "metadata": {"feature": "export"} if i % 2 else {},
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+
+
+def orm_path(db, events: list[dict]) -> None:
+    for e in events:
+        db.add(models.Event(
+            user_id=e["user_id"],
+            event_type=e["event_type"],
+            metadata_=e.get("metadata", {}),
+            timestamp=e.get("timestamp") or datetime.utcnow(),
+        ))
+    db.commit()
+
+
+def bulk_path(db, events: list[dict]) -> None:
+    crud.bulk_create_events(db, events)
+
+
+def run(database_url: str, sizes: list[int]) -> None:
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as db:
+        if db.query(models.User).count() == 0:
+            db.add_all([models.User(id=i, plan="free", country="US") for i in range(1, 101)])
+            db.commit()
+
+    print(f"{'batch':>8} {'orm rows/s':>12} {'bulk rows/s':>12} {'speedup':>8}")
+    for size in sizes:
+        events = make_events(size)
+        rates = []
+        for path in (orm_path, bulk_path):
+            with SessionLocal() as db:
+                started = time.perf_counter()
+                path(db, events)
+                rates.append(size / (time.perf_counter() - started))
+                db.execute(text("DELETE FROM events"))
+                db.commit()
+        print(f"{size:>8} {rates[0]:>12.0f} {rates[1]:>12.0f} {rates[1] / rates[0]:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ORM and bulk event ingestion throughput")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    if args.database_url:
+        run(args.database_url, args.sizes)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        run(f"sqlite+pysqlite:///{tmp}/bench.db", args.sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy as np
+
+from ml.sentiment import EmbeddingSentiment, HashingSentiment, weak_labels
+from train_sentiment import load_feedback
+
+# Compares the sentiment backends on the same feedback: throughput, sign agreement with
+# each other, and agreement with ratings as weak labels. Run from backend/:
+#   PYTHONPATH=.:.. python scripts/bench_sentiment.py --model sentiment.npz --input feedback.csv
+# The embedding side uses EMBEDDING_MODEL_NAME; without its weights it falls back to the
+# dummy model, and the agreement numbers are then meaningless.
+
+
+def timed_polarity(backend, texts: list[str], batch: int) -> tuple[np.ndarray, float]:
+    started = time.perf_counter()
+    parts = [backend.polarity(texts[i:i + batch]) for i in range(0, len(texts), batch)]
+    return np.concatenate(parts) if parts else np.array([]), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hashing sentiment backend against the embedding one")
+    parser.add_argument("--model", type=Path, required=True, help="model written by train_sentiment.py")
+    parser.add_argument("--input", type=Path, nargs="*", default=[], help="feedback exports (default: the database)")
+    parser.add_argument("--limit", type=int, default=20_000, help="rows to score")
+    parser.add_argument("--batch", type=int, default=1_000)
+    parser.add_argument("--output", type=Path, default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    texts, ratings = load_feedback(args.input)
+    texts, ratings = texts[:args.limit], ratings[:args.limit]
+    report = {"rows": len(texts), "backends": {}}
+    polarities = {}
+    for backend in (HashingSentiment.load(args.model), EmbeddingSentiment()):
+        # One small call first, so model loading is not counted as scoring time.
+        backend.polarity(texts[:1])
+        polarity, seconds = timed_polarity(backend, texts, args.batch)
+        labels = weak_labels(ratings)
+        rated = labels >= 0
+        polarities[backend.name] = polarity
+        report["backends"][backend.name] = {
+            "seconds": round(seconds, 4),
+            "rows_per_sec": round(len(texts) / seconds if seconds else 0.0, 1),
+            "rating_agreement": round(float(((polarity[rated] > 0) == (labels[rated] == 1)).mean()), 4) if rated.any() else None,
+        }
+    report["sign_agreement"] = round(float((np.sign(polarities["hashing"]) == np.sign(polarities["embedding"])).mean()), 4)
+
+    for name, stats in report["backends"].items():
+        print(f"{name:<10} {stats['rows_per_sec']:>14,.0f} rows/s  rating agreement {stats['rating_agreement']}")
+    print(f"sign agreement between backends: {report['sign_agreement']}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import ast
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+# Run from backend/ with the project root on PYTHONPATH, like the app itself:
+#   PYTHONPATH=.. python scripts/bench_suite.py --scale 10000 --scale 100000 --output bench.json
+API_BATCH = 5_000
+DATASET_END = datetime(2026, 1, 1)
+
+
+@dataclass
+class BenchResult:
+    name: str
+    scale: int
+    rows: int
+    seconds: float
+    rows_per_sec: float
+    # Process high-water mark after the stage (ru_maxrss), so it only ever grows.
+    peak_rss_bytes: int
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _use_dummy_model() -> None:
+    from ml import embeddings
+
+    def unavailable(name: str):
+        raise RuntimeError("benchmarks always use the dummy embedding model")
+
+    embeddings._load_sentence_transformer = unavailable
+    embeddings.get_registry().configure("benchmark-dummy")
+
+
+def measure(results: list[BenchResult], name: str, scale: int, rows: int, repeat: int, fn):
+    # Best of `repeat` runs; the last run's return value is handed back.
+    best = float("inf")
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - started)
+    results.append(BenchResult(name, scale, rows, round(best, 6), round(rows / best if best else 0.0, 1), _peak_rss_bytes()))
+    print(f"{name:<28} {scale:>10} {best:>10.3f}s {rows / best if best else 0:>14,.0f} rows/s")
+    return value
+
+
+def generate_dataset(directory: Path, scale: int, seed: int) -> None:
+    from data.generate_synthetic import GeneratorConfig, generate
+
+    # A fixed end keeps the dataset identical across runs; the API window covers it.
+    config = GeneratorConfig(
+        users=max(100, scale // 100), events=scale, feedback=max(10, scale // 20), seed=seed, end=DATASET_END
+    )
+    generate(config, directory, "csv")
+
+
+def load_frames(directory: Path) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    events = pd.read_csv(directory / "events.csv", parse_dates=["timestamp"])
+    events["metadata"] = events["metadata"].map(ast.literal_eval)
+    feedback = pd.read_csv(directory / "feedback.csv", parse_dates=["timestamp"])
+    users = pd.read_csv(directory / "users.csv").rename(columns={"id": "user_id"})
+    return events, feedback, users
+
+
+def bench_pipeline(results: list[BenchResult], directory: Path, scale: int, repeat: int, shard_workers: int = 1) -> None:
+    from ml import pipeline
+    from ml.sentiment import HashingSentiment
+    from ml.sharding import ShardConfig
+
+    events, feedback, users = measure(results, "load.csv", scale, scale, 1, lambda: load_frames(directory))
+    features = measure(
+        results, "pipeline.feature_vectors", scale, len(events), repeat,
+        lambda: pipeline.compute_user_feature_vectors(events),
+    )
+    measure(results, "pipeline.cluster_users", scale, len(features), repeat, lambda: pipeline.cluster_users(features))
+    measure(results, "pipeline.anomaly_detection", scale, len(events), repeat, lambda: pipeline.anomaly_detection(events))
+    measure(results, "pipeline.feature_misuse", scale, len(events), repeat, lambda: pipeline.detect_feature_misuse(events))
+    measure(results, "pipeline.sentiment", scale, len(feedback), repeat, lambda: pipeline.sentiment_analysis(feedback))
+    texts = feedback["text"].astype(str).tolist()
+    hashing = measure(
+        results, "sentiment.hashing.train", scale, len(feedback), 1,
+        lambda: HashingSentiment.train(texts, feedback["rating"]),
+    )
+    measure(results, "sentiment.hashing.score", scale, len(feedback), repeat, lambda: hashing.polarity(texts))
+    measure(
+        results, "pipeline.generate_window", scale, len(events) + len(feedback), repeat,
+        lambda: pipeline.generate_insights_for_window(events, feedback, users),
+    )
+    if shard_workers > 1:
+        shards = ShardConfig(workers=shard_workers)
+        measure(
+            results, "pipeline.generate_sharded", scale, len(events) + len(feedback), repeat,
+            lambda: pipeline.generate_insights_for_window(events, feedback, users, shards=shards),
+        )
+
+
+def bench_api(results: list[BenchResult], directory: Path, scale: int) -> None:
+    # DATABASE_URL is pointed at a scratch SQLite file before the app is imported; each
+    # scale then gets a fresh database, swapped in the same way the API tests do.
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import models
+    from app.core.security import FIXTURE_USER
+    from app.db import session as db_session
+    from app.db.base import Base
+    from app.main import app
+
+    engine = create_engine(f"sqlite+pysqlite:///{directory / 'api.db'}")
+    Base.metadata.create_all(bind=engine)
+    db_session.engine = engine
+    db_session.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    events, feedback, users = load_frames(directory)
+    with db_session.SessionLocal() as db:
+        db.bulk_insert_mappings(models.User, [
+            {"id": int(row.user_id), "plan": row.plan, "country": row.country} for row in users.itertuples()
+        ])
+        db.commit()
+
+    client = TestClient(app)
+    token = client.post("/api/auth/login", json=FIXTURE_USER).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def records(frame: pd.DataFrame) -> list[dict]:
+        frame = frame.assign(timestamp=frame["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S"))
+        return frame.to_dict("records")
+
+    def post_batches(path: str, rows: list[dict]) -> None:
+        for offset in range(0, len(rows), API_BATCH):
+            res = client.post(path, json=rows[offset:offset + API_BATCH], headers=headers)
+            res.raise_for_status()
+
+    event_rows, feedback_rows = records(events), records(feedback)
+    measure(results, "api.ingest_events", scale, len(event_rows), 1, lambda: post_batches("/api/events", event_rows))
+    measure(results, "api.ingest_feedback", scale, len(feedback_rows), 1, lambda: post_batches("/api/feedback", feedback_rows))
+
+    window = {
+        "start_time": (DATASET_END - timedelta(days=121)).isoformat(),
+        "end_time": (DATASET_END + timedelta(days=1)).isoformat(),
+    }
+    total = len(event_rows) + len(feedback_rows)
+
+    def generate() -> None:
+        client.post("/api/insights/generate", json=window, headers=headers).raise_for_status()
+
+    measure(results, "api.generate", scale, total, 1, generate)
+    measure(results, "api.generate_cached", scale, total, 1, generate)
+    measure(
+        results, "api.list_insights", scale, 100, 1,
+        lambda: client.get("/api/insights?limit=100", headers=headers).raise_for_status(),
+    )
+
+
+def compare(results: list[BenchResult], baseline_path: Path, threshold: float, min_seconds: float) -> list[str]:
+    # A stage regresses when it is slower than the baseline by more than `threshold`
+    # (relative) and `min_seconds` (absolute, to ignore timer noise on tiny stages).
+    baseline = {(r["name"], r["scale"]): r for r in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result.name, result.scale))
+        if previous is None:
+            continue
+        slower = result.seconds - previous["seconds"]
+        if slower > min_seconds and result.seconds > previous["seconds"] * (1 + threshold):
+            regressions.append(
+                f"{result.name} @ {result.scale}: {previous['seconds']:.3f}s -> {result.seconds:.3f}s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time pipeline stages and API endpoints on synthetic data")
+    parser.add_argument("--scale", type=int, action="append", help="events per dataset; repeatable (default 10000)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per pipeline stage; the best is kept")
+    parser.add_argument("--shard-workers", type=int, default=1, help="also time the user-sharded detectors")
+    parser.add_argument("--skip-api", action="store_true", help="only benchmark ml/pipeline.py")
+    parser.add_argument("--output", type=Path, default=None, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, default=None, help="earlier --output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+    scales = args.scale or [10_000]
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    os.environ.setdefault("DATABASE_URL", f"sqlite+pysqlite:///{workdir / 'bench.db'}")
+    _use_dummy_model()
+
+    results: list[BenchResult] = []
+    print(f"{'stage':<28} {'scale':>10} {'seconds':>11} {'throughput':>21}")
+    for scale in scales:
+        directory = workdir / str(scale)
+        directory.mkdir()
+        measure(results, "generate.csv", scale, scale, 1, lambda: generate_dataset(directory, scale, args.seed))
+        bench_pipeline(results, directory, scale, max(1, args.repeat), args.shard_workers)
+        if not args.skip_api:
+            bench_api(results, directory, scale)
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": [asdict(r) for r in results],
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import os
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming monthly event partitions and drop expired ones")
+    parser.add_argument("--months-ahead", type=int, default=3, help="months of empty partitions to keep ready")
+    parser.add_argument("--retain-months", type=int, default=None, help="drop partitions older than this many months")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "sqlite+pysqlite:///./app.db")
+    engine = create_engine(database_url, pool_pre_ping=True)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with SessionLocal() as db:
+        if not partitions.is_partitioned(db):
+            print("events is not partitioned; nothing to do")
+            return
+        created = partitions.ensure_future_partitions(db, args.months_ahead)
+        print(f"Created {created} partitions")
+        if args.retain_months is not None:
+            cutoff = partitions.add_months(date.today().replace(day=1), -args.retain_months)
+            dropped = partitions.drop_partitions_before(db, cutoff)
+            print(f"Dropped {len(dropped)} partitions before {cutoff}: {', '.join(dropped) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,59 @@
-import csv
+import argparse
 import os
-import ast
 from pathlib import Path
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.db.base import Base
-from app import models
+from app import bulk_load
 
 DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "out"
+EXTENSIONS = (".parquet", ".csv", ".ndjson")
 
 
-def load_csv(path: Path):
-    with path.open("r") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+def find_source(data_dir: Path, table: str) -> Path | None:
+    for extension in EXTENSIONS:
+        path = data_dir / f"{table}{extension}"
+        if path.exists():
+            return path
+    return None
+
+
+def print_progress(report: bulk_load.LoadReport) -> None:
+    print(f"  {report.table}: {report.rows:,} rows ({report.rows_per_sec:,.0f} rows/s)", flush=True)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Stream users, events and feedback exports into the database")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="directory with <table>.parquet|csv|ndjson")
+    parser.add_argument("--tables", nargs="+", choices=list(bulk_load.SPECS), default=list(bulk_load.SPECS))
+    parser.add_argument("--chunk-rows", type=int, default=bulk_load.DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--rebuild-indexes", action="store_true", help="drop secondary indexes during the load")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="resume file; rerun with the same path to continue")
+    args = parser.parse_args()
+
     database_url = os.getenv("DATABASE_URL", "sqlite+pysqlite:///./app.db")
     engine = create_engine(database_url, pool_pre_ping=True)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     Base.metadata.create_all(bind=engine)
 
-    users = load_csv(DATA_DIR / "users.csv")
-    events = load_csv(DATA_DIR / "events.csv")
-    feedback = load_csv(DATA_DIR / "feedback.csv")
-
-    db = SessionLocal()
-    for row in users:
-        db.merge(models.User(
-            id=int(row["id"]),
-            created_at=row["created_at"],
-            plan=row["plan"],
-            country=row["country"],
-        ))
-    db.commit()
-
-    for row in events:
-        db.add(models.Event(
-            user_id=int(row["user_id"]),
-            event_type=row["event_type"],
-            metadata=ast.literal_eval(row["metadata"]),
-            timestamp=row["timestamp"],
-        ))
-    db.commit()
-
-    for row in feedback:
-        db.add(models.Feedback(
-            user_id=int(row["user_id"]),
-            text=row["text"],
-            rating=int(row["rating"]),
-            timestamp=row["timestamp"],
-        ))
-    db.commit()
-    db.close()
+    checkpoint = bulk_load.Checkpoint(args.checkpoint)
+    sources = {table: find_source(args.data_dir, table) for table in args.tables}
+    with SessionLocal() as db:
+        for table, path in sources.items():
+            if path is None:
+                print(f"Skipping {table}: no export in {args.data_dir}")
+                continue
+            print(f"Loading {table} from {path}")
+            spec_tables = [bulk_load.SPECS[table].table] if args.rebuild_indexes else []
+            with bulk_load.indexes_dropped(db, spec_tables):
+                report = bulk_load.load_file(db, table, path, args.chunk_rows, checkpoint, print_progress)
+            print(
+                f"Loaded {report.rows:,} {table} rows in {report.seconds:.1f}s "
+                f"({report.rows_per_sec:,.0f} rows/s, {report.skipped:,} already loaded)"
+            )
+            if table == "events":
+                print(f"Rebuilt {bulk_load.refresh_rollups(db, report):,} rollup rows")
 
     print("Seed complete")
 
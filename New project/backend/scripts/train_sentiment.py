@@ -0,0 +1,63 @@
+import argparse
+import os
+from pathlib import Path
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from ml.sentiment import HASH_FEATURES, HashingSentiment, weak_labels
+
+# Trains the "hashing" sentiment backend on rated feedback, from the database or exports:
+#   PYTHONPATH=.:.. python scripts/train_sentiment.py --output sentiment.npz
+#   PYTHONPATH=.:.. python scripts/train_sentiment.py --input feedback.parquet --output sentiment.npz
+# Then set SENTIMENT_BACKEND=hashing and SENTIMENT_MODEL_PATH=sentiment.npz.
+
+
+def load_feedback(inputs: list[Path]) -> tuple[list[str], np.ndarray]:
+    if inputs:
+        import pandas as pd
+        from ml.offline import read_chunks
+
+        frames = [chunk for path in inputs for chunk in read_chunks(path, ["text", "rating"])]
+        frame = pd.concat(frames, ignore_index=True)
+        return frame["text"].astype(str).tolist(), pd.to_numeric(frame["rating"], errors="coerce").to_numpy(float)
+
+    database_url = os.getenv("DATABASE_URL", "sqlite+pysqlite:///./app.db")
+    SessionLocal = sessionmaker(bind=create_engine(database_url, pool_pre_ping=True))
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(models.Feedback.text, models.Feedback.rating).where(models.Feedback.rating.is_not(None))
+        ).all()
+    return [r.text for r in rows], np.array([r.rating for r in rows], dtype=float)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the hashing sentiment backend with ratings as weak labels")
+    parser.add_argument("--input", type=Path, nargs="*", default=[], help="feedback exports (default: the database)")
+    parser.add_argument("--output", type=Path, required=True)
+    parser.add_argument("--n-features", type=int, default=HASH_FEATURES)
+    parser.add_argument("--ngram-max", type=int, default=2)
+    parser.add_argument("--C", type=float, default=1.0, help="inverse regularization strength")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of rows kept back to report accuracy")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts, ratings = load_feedback(args.input)
+    held_out = np.random.default_rng(args.seed).random(len(texts)) < args.holdout
+    train = np.flatnonzero(~held_out)
+    model = HashingSentiment.train(
+        [texts[i] for i in train], ratings[train], n_features=args.n_features, ngram_max=args.ngram_max, C=args.C
+    )
+    labels = weak_labels(ratings[held_out])
+    if (labels >= 0).any():
+        test = np.flatnonzero(held_out)[labels >= 0]
+        predicted = model.polarity([texts[i] for i in test]) > 0
+        accuracy = float((predicted == (labels[labels >= 0] == 1)).mean())
+        print(f"Held-out agreement with ratings: {accuracy:.3f} on {len(test):,} rows")
+    model.save(args.output)
+    print(f"Trained on {len(train):,} rows; wrote {args.output} ({np.count_nonzero(model.coef):,} weights)")
+
+
+if __name__ == "__main__":
+    main()
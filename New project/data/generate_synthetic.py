@@ -1,72 +1,280 @@
-import csv
-import random
-from datetime import datetime, timedelta
+import argparse
+import json
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
 
 
 OUTPUT_DIR = Path(__file__).parent / "out"
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 USERS = 1000
 EVENTS = 100_000
 FEEDBACK = 5_000
 EVENT_TYPES = ["signup", "login", "feature_use", "upgrade", "churn"]
+EVENT_WEIGHTS = [0.05, 0.45, 0.40, 0.05, 0.05]
 FEATURES = ["export", "import", "dashboard", "alerts", "reports"]
+COUNTRIES = ["US", "CA", "GB", "IN", "DE"]
+POSITIVE = ["Love it", "Great product", "Very helpful"]
+NEGATIVE = ["Confusing", "Buggy", "Frustrating experience"]
+FORMATS = {"csv": "csv", "ndjson": "ndjson", "parquet": "parquet"}
+CHUNK_ROWS = 1_000_000
 
+# Metadata is written as JSON; the strings are built once and indexed per row.
+METADATA_JSON = np.array(["{}"] + [json.dumps({"feature": f}) for f in FEATURES], dtype=object)
 
-def random_date(start_days_ago: int = 120):
-    start = datetime.utcnow() - timedelta(days=start_days_ago)
-    return start + timedelta(seconds=random.randint(0, start_days_ago * 86400))
 
+@dataclass(frozen=True)
+class GeneratorConfig:
+    users: int = USERS
+    events: int = EVENTS
+    feedback: int = FEEDBACK
+    seed: int = 0
+    days: int = 120
+    # End of the generated span; defaults to today's midnight (UTC) so a seed
+    # reproduces the same data for the whole day. Pass --end for fixed output.
+    end: datetime | None = None
+    # Zipf-like exponent for per-user activity; 0 spreads events uniformly.
+    activity_alpha: float = 1.1
+    # Share of users that stop producing events after `churn_after` of the span.
+    churn_fraction: float = 0.1
+    churn_after: float = 0.7
+    # Share of positive feedback, and share whose rating contradicts its text.
+    positive_share: float = 0.65
+    mismatch_share: float = 0.05
+    chunk_rows: int = CHUNK_ROWS
 
-def generate_users(path: Path):
-    with path.open("w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["id", "created_at", "plan", "country"])
-        for user_id in range(1, USERS + 1):
-            writer.writerow([
-                user_id,
-                random_date().isoformat(),
-                "pro" if user_id % 4 == 0 else "free",
-                random.choice(["US", "CA", "GB", "IN", "DE"]),
-            ])
-
-
-def generate_events(path: Path):
-    with path.open("w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["user_id", "event_type", "metadata", "timestamp"])
-        for _ in range(EVENTS):
-            user_id = random.randint(1, USERS)
-            event_type = random.choice(EVENT_TYPES)
-            metadata = {"feature": random.choice(FEATURES)} if event_type == "feature_use" else {}
-            writer.writerow([
-                user_id,
-                event_type,
-                metadata,
-                random_date().isoformat(),
-            ])
-
-
-def generate_feedback(path: Path):
-    positive = ["Love it", "Great product", "Very helpful"]
-    negative = ["Confusing", "Buggy", "Frustrating experience"]
+    def end_time(self) -> np.datetime64:
+        end = self.end or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        if end.tzinfo is not None:
+            end = end.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(end, "s")
+
+    def start_time(self) -> np.datetime64:
+        return self.end_time() - np.timedelta64(self.days * 86400, "s")
+
+
+def _rng(config: GeneratorConfig, stream: int, chunk: int = 0) -> np.random.Generator:
+    # Every (stream, chunk) has its own generator, so output does not depend on how
+    # chunks are spread over worker processes.
+    return np.random.default_rng([config.seed, stream, chunk])
+
+
+def _user_profile(config: GeneratorConfig) -> tuple[np.ndarray, np.ndarray]:
+    # Returns the activity CDF over user ids 1..N and the churned-user mask.
+    rng = _rng(config, 0)
+    ranks = rng.permutation(config.users) + 1
+    weights = ranks.astype(np.float64) ** -config.activity_alpha
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    churned = rng.random(config.users) < config.churn_fraction
+    return cdf, churned
+
+
+def _sample_users(rng: np.random.Generator, cdf: np.ndarray, size: int) -> np.ndarray:
+    return np.searchsorted(cdf, rng.random(size), side="right").clip(max=len(cdf) - 1) + 1
+
+
+def _timestamps(config: GeneratorConfig, rng: np.random.Generator, size: int, churned: np.ndarray | None = None) -> np.ndarray:
+    span = config.days * 86400
+    offsets = rng.random(size) * span
+    if churned is not None:
+        offsets[churned] *= config.churn_after
+    return config.start_time() + offsets.astype("timedelta64[s]")
+
+
+def users_chunk(config: GeneratorConfig, chunk: int, start: int, size: int) -> pd.DataFrame:
+    rng = _rng(config, 1, chunk)
+    ids = np.arange(start + 1, start + size + 1)
+    return pd.DataFrame({
+        "id": ids,
+        "created_at": _timestamps(config, rng, size),
+        "plan": np.where(ids % 4 == 0, "pro", "free"),
+        "country": np.asarray(COUNTRIES)[rng.integers(0, len(COUNTRIES), size)],
+    })
+
+
+def events_chunk(config: GeneratorConfig, chunk: int, start: int, size: int) -> pd.DataFrame:
+    cdf, churned = _user_profile(config)
+    rng = _rng(config, 2, chunk)
+    user_ids = _sample_users(rng, cdf, size)
+    types = rng.choice(len(EVENT_TYPES), size=size, p=EVENT_WEIGHTS)
+    features = rng.integers(0, len(FEATURES), size)
+    metadata = np.where(types == EVENT_TYPES.index("feature_use"), features + 1, 0)
+    return pd.DataFrame({
+        "user_id": user_ids,
+        "event_type": np.asarray(EVENT_TYPES, dtype=object)[types],
+        "metadata": METADATA_JSON[metadata],
+        "timestamp": _timestamps(config, rng, size, churned[user_ids - 1]),
+    })
+
+
+def feedback_chunk(config: GeneratorConfig, chunk: int, start: int, size: int) -> pd.DataFrame:
+    cdf, _ = _user_profile(config)
+    rng = _rng(config, 3, chunk)
+    positive = rng.random(size) < config.positive_share
+    texts = np.where(
+        positive,
+        np.asarray(POSITIVE, dtype=object)[rng.integers(0, len(POSITIVE), size)],
+        np.asarray(NEGATIVE, dtype=object)[rng.integers(0, len(NEGATIVE), size)],
+    )
+    # Mismatched rows get a rating from the opposite end of the scale.
+    rated_positive = positive ^ (rng.random(size) < config.mismatch_share)
+    ratings = np.where(rated_positive, 5, rng.integers(1, 4, size))
+    return pd.DataFrame({
+        "user_id": _sample_users(rng, cdf, size),
+        "text": texts,
+        "rating": ratings,
+        "timestamp": _timestamps(config, rng, size),
+    })
+
+
+TABLES: dict[str, Callable[[GeneratorConfig, int, int, int], pd.DataFrame]] = {
+    "users": users_chunk,
+    "events": events_chunk,
+    "feedback": feedback_chunk,
+}
+
+
+def _iso(values: pd.Series) -> pd.Series:
+    return pd.Series(np.datetime_as_string(values.to_numpy("datetime64[s]"), unit="s"), index=values.index, dtype=object)
+
+
+def _json_strings(values: pd.Series) -> pd.Series:
+    # Small vocabularies, so each distinct value is escaped once.
+    return values.map({value: json.dumps(value) for value in values.unique()})
+
+
+def render(frame: pd.DataFrame, fmt: str, header: bool):
+    # Returns text for csv/ndjson and a pyarrow Table for parquet.
+    if fmt == "parquet":
+        import pyarrow as pa
+
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    datetimes = [c for c in frame.columns if np.issubdtype(frame[c].dtype, np.datetime64)]
+    frame = frame.assign(**{c: _iso(frame[c]) for c in datetimes})
+    if fmt == "csv":
+        return frame.to_csv(index=False, header=header)
+    fields = []
+    for column in frame.columns:
+        values = frame[column]
+        if column == "metadata" or pd.api.types.is_numeric_dtype(values):
+            encoded = values.astype(str)
+        elif column in datetimes:
+            encoded = '"' + values + '"'
+        else:
+            encoded = _json_strings(values)
+        fields.append(f'"{column}":' + encoded)
+    line = fields[0]
+    for field in fields[1:]:
+        line = line + "," + field
+    return "".join(("{" + line + "}\n").tolist())
+
+
+def _render_chunk(task: tuple) -> object:
+    table, config, chunk, start, size, fmt = task
+    return render(TABLES[table](config, chunk, start, size), fmt, header=chunk == 0)
+
+
+def _chunks(total: int, chunk_rows: int) -> Iterator[tuple[int, int, int]]:
+    for chunk, start in enumerate(range(0, total, chunk_rows)):
+        yield chunk, start, min(chunk_rows, total - start)
+
+
+def _ordered_results(tasks: list[tuple], workers: int) -> Iterator[object]:
+    # Keeps at most 2 x workers chunks in flight so memory stays bounded when the
+    # writer is slower than the generators.
+    if workers <= 1:
+        for task in tasks:
+            yield _render_chunk(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: list[Future] = []
+        for task in tasks:
+            pending.append(pool.submit(_render_chunk, task))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def write_table(table: str, config: GeneratorConfig, directory: Path, fmt: str = "csv", workers: int = 1) -> Path:
+    path = directory / f"{table}.{FORMATS[fmt]}"
+    total = getattr(config, table)
+    tasks = [(table, config, chunk, start, size, fmt) for chunk, start, size in _chunks(total, config.chunk_rows)]
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for part in _ordered_results(tasks, workers):
+                if writer is None:
+                    writer = pq.ParquetWriter(path, part.schema)
+                writer.write_table(part)
+        finally:
+            if writer is not None:
+                writer.close()
+        return path
     with path.open("w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["user_id", "text", "rating", "timestamp"])
-        for _ in range(FEEDBACK):
-            user_id = random.randint(1, USERS)
-            is_pos = random.random() > 0.35
-            writer.writerow([
-                user_id,
-                random.choice(positive if is_pos else negative),
-                5 if is_pos else random.randint(1, 3),
-                random_date().isoformat(),
-            ])
+        for part in _ordered_results(tasks, workers):
+            f.write(part)
+    return path
+
+
+def generate(config: GeneratorConfig, directory: Path = OUTPUT_DIR, fmt: str = "csv", workers: int = 1) -> dict[str, Path]:
+    directory.mkdir(parents=True, exist_ok=True)
+    return {table: write_table(table, config, directory, fmt, workers) for table in TABLES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate reproducible synthetic users, events and feedback")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on --users/--events/--feedback")
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--events", type=int, default=EVENTS)
+    parser.add_argument("--feedback", type=int, default=FEEDBACK)
+    parser.add_argument("--days", type=int, default=120, help="length of the generated time span")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="end of the span (ISO date)")
+    parser.add_argument("--activity-alpha", type=float, default=1.1, help="power-law skew of user activity")
+    parser.add_argument("--churn-fraction", type=float, default=0.1)
+    parser.add_argument("--churn-after", type=float, default=0.7, help="fraction of the span before churners stop")
+    parser.add_argument("--positive-share", type=float, default=0.65)
+    parser.add_argument("--mismatch-share", type=float, default=0.05)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    config = GeneratorConfig(
+        users=max(1, int(args.users * args.scale)),
+        events=int(args.events * args.scale),
+        feedback=int(args.feedback * args.scale),
+        seed=args.seed,
+        days=args.days,
+        end=args.end,
+        activity_alpha=args.activity_alpha,
+        churn_fraction=args.churn_fraction,
+        churn_after=args.churn_after,
+        positive_share=args.positive_share,
+        mismatch_share=args.mismatch_share,
+        chunk_rows=args.chunk_rows,
+    )
+    # Resolve the end once so every worker uses the same span.
+    config = replace(config, end=config.end or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0))
+    started = time.perf_counter()
+    paths = generate(config, args.output_dir, args.format, args.workers)
+    elapsed = time.perf_counter() - started
+    rows = config.users + config.events + config.feedback
+    print(f"Wrote {rows:,} rows to {args.output_dir} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    for table, path in paths.items():
+        print(f"  {table}: {path}")
 
 
 if __name__ == "__main__":
-    generate_users(OUTPUT_DIR / "users.csv")
-    generate_events(OUTPUT_DIR / "events.csv")
-    generate_feedback(OUTPUT_DIR / "feedback.csv")
-    print(f"Wrote CSVs to {OUTPUT_DIR}")
+    main()
@@ -27,20 +27,24 @@ export default function App() {
   const handleGenerate = async () => {
     if (!token) return
     setStatus('Generating insights...')
-    await generateInsights(token)
-    const list = await fetchInsights(token)
+    await generateInsights(token, cohort)
+    const list = await fetchInsights(token, cohort)
     setInsights(list)
     setStatus('')
   }
 
+  const handleCohortChange = async (value: string) => {
+    setCohort(value)
+    if (!token) return
+    setInsights(await fetchInsights(token, value))
+  }
+
   const handleSeed = async () => {
     setStatus('Seeding demo data...')
     await seedDemo()
     setStatus('Demo data seeded')
   }
 
-  const filtered = cohort === 'all' ? insights : insights.filter((i) => i.payload?.cohort === cohort)
-
   return (
     <div className="page">
       <header>
@@ -51,7 +55,7 @@ export default function App() {
       <section className="controls">
         <button onClick={handleGenerate}>Generate Insights</button>
         <button onClick={handleSeed}>Replay Demo Data</button>
-        <CohortSelector value={cohort} onChange={setCohort} />
+        <CohortSelector value={cohort} onChange={handleCohortChange} />
         <span className="status">{status}</span>
       </section>
 
@@ -62,7 +66,7 @@ export default function App() {
         </div>
         <div className="panel">
           <h2>Insights</h2>
-          <InsightCards insights={filtered} />
+          <InsightCards insights={insights} />
         </div>
       </section>
     </div>
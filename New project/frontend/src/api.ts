@@ -5,6 +5,7 @@ export type Insight = {
   payload: Record<string, unknown>
   created_at: string
   explanation?: string
+  run_id?: number | null
 }
 
 export async function login(username: string, password: string) {
@@ -17,21 +18,40 @@ export async function login(username: string, password: string) {
   return res.json() as Promise<{ access_token: string }>
 }
 
-export async function fetchInsights(token: string): Promise<Insight[]> {
-  const res = await fetch('/api/insights?limit=10', {
-    headers: { Authorization: `Bearer ${token}` }
-  })
+function cohortParam(cohort?: string) {
+  return cohort && cohort !== 'all' ? cohort : undefined
+}
+
+// Last response per URL, replayed when the server answers a poll with 304.
+const insightsCache = new Map<string, { etag: string; insights: Insight[] }>()
+
+export async function fetchInsights(token: string, cohort?: string): Promise<Insight[]> {
+  const label = cohortParam(cohort)
+  const query = label ? `&cohort_label=${encodeURIComponent(label)}` : ''
+  const url = `/api/insights?limit=10${query}`
+  const cached = insightsCache.get(url)
+  const headers: Record<string, string> = { Authorization: `Bearer ${token}` }
+  if (cached) headers['If-None-Match'] = cached.etag
+  const res = await fetch(url, { headers })
+  if (res.status === 304 && cached) return cached.insights
   if (!res.ok) throw new Error('Failed to load insights')
-  return res.json()
+  const insights: Insight[] = await res.json()
+  const etag = res.headers.get('ETag')
+  if (etag) insightsCache.set(url, { etag, insights })
+  return insights
 }
 
-export async function generateInsights(token: string) {
+export async function generateInsights(token: string, cohort?: string) {
   const now = new Date()
   const start = new Date(now.getTime() - 7 * 24 * 60 * 60 * 1000)
   const res = await fetch('/api/insights/generate', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${token}` },
-    body: JSON.stringify({ start_time: start.toISOString(), end_time: now.toISOString() })
+    body: JSON.stringify({
+      start_time: start.toISOString(),
+      end_time: now.toISOString(),
+      cohort_label: cohortParam(cohort) ?? null
+    })
   })
   if (!res.ok) throw new Error('Failed to generate insights')
   return res.json()
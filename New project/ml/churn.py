@@ -0,0 +1,75 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class DailyCountMatrix:
+    user_ids: np.ndarray
+    start: pd.Timestamp | None
+    counts: np.ndarray
+
+    @property
+    def n_days(self) -> int:
+        return self.counts.shape[1]
+
+
+@dataclass
+class ChurnScores:
+    user_ids: np.ndarray
+    recent: np.ndarray
+    mean: np.ndarray
+    z_score: np.ndarray
+
+
+def build_daily_matrix(user_ids, days, weights=None, start=None, n_days: int | None = None) -> DailyCountMatrix:
+    # `days` must already be normalized to midnight; `weights` lets pre-aggregated
+    # (user, day, count) rows feed the same matrix as raw events. `start`/`n_days` pin
+    # the column span, so a subset of users gets the same columns as the full window.
+    days = pd.to_datetime(pd.Series(days, copy=False))
+    if len(days) == 0:
+        return DailyCountMatrix(np.empty(0, dtype=np.int64), None, np.zeros((0, 0), dtype=np.int32))
+    codes, uniques = pd.factorize(pd.Series(user_ids, copy=False), sort=True)
+    start = days.min() if start is None else pd.Timestamp(start)
+    offsets = (days - start).dt.days.to_numpy(dtype=np.int64)
+    n_users = len(uniques)
+    n_days = int(offsets.max()) + 1 if n_days is None else n_days
+    flat = codes.astype(np.int64) * n_days + offsets
+    dense = np.bincount(flat, weights=weights, minlength=n_users * n_days)
+    counts = dense.astype(np.int32).reshape(n_users, n_days)
+    return DailyCountMatrix(np.asarray(uniques, dtype=np.int64), start, counts)
+
+
+def rolling_churn_scores(matrix: DailyCountMatrix, window: int = 3, fill_missing_days: bool = False) -> ChurnScores:
+    # With fill_missing_days=False each user's series is their active days only, which
+    # is what the per-user rolling() implementation did. With True, idle days count as
+    # zeros from the user's first active day to the end of the window.
+    if window < 2:
+        raise ValueError("window must be at least 2")
+    counts = matrix.counts
+    active = counts > 0
+    if fill_missing_days:
+        first_active = np.where(active.any(axis=1), active.argmax(axis=1), matrix.n_days)
+        eligible = matrix.n_days - first_active >= window
+        selected = np.zeros_like(active)
+        selected[:, max(0, matrix.n_days - window):] = True
+        recent = counts[:, -1] if matrix.n_days else np.zeros(len(counts), dtype=np.int32)
+    else:
+        rank_from_end = np.cumsum(active[:, ::-1], axis=1)[:, ::-1]
+        eligible = active.sum(axis=1) >= window
+        selected = active & (rank_from_end <= window)
+        recent = np.where(active & (rank_from_end == 1), counts, 0).sum(axis=1)
+
+    values = np.where(selected, counts, 0).astype(np.float64)
+    mean = values.sum(axis=1) / window
+    deviations = np.where(selected, values - mean[:, None], 0.0)
+    std = np.sqrt((deviations ** 2).sum(axis=1) / (window - 1))
+    z_score = (recent - mean) / np.where(std > 0, std, 1.0)
+
+    return ChurnScores(
+        user_ids=matrix.user_ids[eligible],
+        recent=recent[eligible],
+        mean=mean[eligible],
+        z_score=z_score[eligible],
+    )
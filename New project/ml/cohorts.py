@@ -0,0 +1,106 @@
+from __future__ import annotations
+import pickle
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+
+DEFAULT_CLUSTERS = 3
+
+
+def cohort_name(label: int) -> str:
+    return f"cohort_{label}"
+
+
+def align_features(feature_df: pd.DataFrame, columns: list[str]) -> np.ndarray:
+    # Event types the model has never seen are dropped; missing ones count as zero.
+    return feature_df.reindex(columns=columns, fill_value=0).to_numpy(dtype=np.float64)
+
+
+@dataclass
+class CohortModel:
+    feature_columns: list[str]
+    scaler: StandardScaler
+    kmeans: MiniBatchKMeans
+    # label_map[i] is the stable cohort number of k-means cluster i.
+    label_map: np.ndarray
+    samples_seen: int = 0
+
+    @property
+    def n_clusters(self) -> int:
+        return self.kmeans.n_clusters
+
+    def centroids(self) -> np.ndarray:
+        # Raw-feature-space centroids ordered by stable cohort number.
+        centroids = np.empty_like(self.kmeans.cluster_centers_)
+        centroids[self.label_map] = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        return centroids
+
+    def partial_fit(self, feature_df: pd.DataFrame) -> CohortModel:
+        X = align_features(feature_df, self.feature_columns)
+        # The centers live in the scaler's space, so they are carried over when the
+        # scaler's mean and variance move; otherwise they drift relative to the data.
+        centers = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        self.scaler.partial_fit(X)
+        self.kmeans.cluster_centers_ = self.scaler.transform(centers)
+        self.kmeans.partial_fit(self.scaler.transform(X))
+        self.samples_seen += len(X)
+        return self
+
+    def predict(self, feature_df: pd.DataFrame) -> dict[int, str]:
+        if feature_df.empty:
+            return {}
+        X = self.scaler.transform(align_features(feature_df, self.feature_columns))
+        labels = self.label_map[self.kmeans.predict(X)]
+        return {int(uid): cohort_name(int(label)) for uid, label in zip(feature_df["user_id"], labels)}
+
+    def dumps(self) -> bytes:
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(blob: bytes) -> CohortModel:
+        return pickle.loads(blob)
+
+
+def _match_labels(new: CohortModel, previous: CohortModel) -> np.ndarray:
+    # Pair each new centroid with the closest previous one (in raw feature space over
+    # the union of columns) so cohort_N keeps its meaning across reclusters.
+    columns = sorted(set(new.feature_columns) | set(previous.feature_columns))
+    a = align_features(pd.DataFrame(new.centroids(), columns=new.feature_columns), columns)
+    b = align_features(pd.DataFrame(previous.centroids(), columns=previous.feature_columns), columns)
+    cost = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+    _, matched = linear_sum_assignment(cost)
+    return matched
+
+
+def fit_cohort_model(
+    feature_df: pd.DataFrame,
+    k: int = DEFAULT_CLUSTERS,
+    previous: CohortModel | None = None,
+    random_state: int = 42,
+) -> CohortModel:
+    columns = [str(c) for c in feature_df.columns if c != "user_id"]
+    k = min(k, max(1, len(feature_df)))
+    scaler = StandardScaler()
+    X = scaler.fit_transform(align_features(feature_df, columns))
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3, batch_size=1024)
+    kmeans.fit(X)
+    model = CohortModel(feature_columns=columns, scaler=scaler, kmeans=kmeans, label_map=np.arange(k), samples_seen=len(X))
+    if previous is not None and previous.n_clusters == k:
+        model.label_map = _match_labels(model, previous)
+    return model
+
+
+def update_cohort_model(
+    model: CohortModel | None,
+    feature_df: pd.DataFrame,
+    k: int = DEFAULT_CLUSTERS,
+) -> CohortModel:
+    # Warm-starts from the persisted model. A full fit only happens on the first run, or
+    # once enough users exist to grow a model that was seeded with fewer than k of them.
+    if model is None or model.n_clusters < k <= len(feature_df):
+        return fit_cohort_model(feature_df, k=k, previous=model)
+    return model.partial_fit(feature_df)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Sequence
+import numpy as np
+
+
+DEFAULT_MAX_ENTRIES = 200_000
+STORE_FILES = ("meta.json", "index.json", "index.log", "vectors.npy", "ticks.npy")
+
+
+def text_key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    # On-disk layout: meta.json (model name, dim, capacity), index.json (key -> slot) plus
+    # index.log ("key slot" lines appended per batch, a reused slot dropping its old key),
+    # and vectors.npy and ticks.npy as memory-mapped arrays with one row per slot. The log
+    # is folded into index.json once it outgrows the index, so writes stay amortized O(batch).
+    def __init__(self, directory: str | Path, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.directory = Path(directory)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index: dict[str, int] = {}
+        self._pending: dict[str, Future] = {}
+        self._log_lines = 0
+        self._vectors: np.ndarray | None = None
+        self._ticks: np.ndarray | None = None
+        self._tick = 0
+        self._open()
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta_path = self._path("meta.json")
+        if not meta_path.exists():
+            return
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta.get("model_name") != self.model_name or meta.get("capacity") != self.max_entries:
+                # Vectors from another model (or a resized store) are not reusable.
+                self.clear()
+                return
+            self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+            self._ticks = np.load(self._path("ticks.npy"), mmap_mode="r+")
+            self._index = json.loads(self._path("index.json").read_text())
+            self._replay_log()
+        except (OSError, ValueError):
+            self.clear()
+            return
+        self._tick = int(self._ticks.max()) if len(self._ticks) else 0
+
+    def _replay_log(self) -> None:
+        log_path = self._path("index.log")
+        if not log_path.exists():
+            return
+        by_slot = {slot: key for key, slot in self._index.items()}
+        for line in log_path.read_text().splitlines():
+            parts = line.split()
+            if len(parts) != 2 or not parts[1].isdigit():
+                # A torn last line from an interrupted append.
+                continue
+            key, slot = parts[0], int(parts[1])
+            by_slot.pop(self._index.get(key), None)
+            self._index.pop(by_slot.get(slot), None)
+            self._index[key] = by_slot[slot] = slot
+            self._log_lines += 1
+
+    def _allocate(self, dim: int) -> None:
+        shape = (self.max_entries, dim)
+        self._vectors = np.lib.format.open_memmap(self._path("vectors.npy"), mode="w+", dtype=np.float32, shape=shape)
+        self._ticks = np.lib.format.open_memmap(
+            self._path("ticks.npy"), mode="w+", dtype=np.int64, shape=(self.max_entries,)
+        )
+        self._compact()
+        meta = {"model_name": self.model_name, "dim": dim, "capacity": self.max_entries}
+        self._path("meta.json").write_text(json.dumps(meta))
+
+    def clear(self) -> None:
+        self._vectors = None
+        self._ticks = None
+        self._index = {}
+        self._log_lines = 0
+        self._tick = 0
+        for name in STORE_FILES:
+            self._path(name).unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "entries": len(self._index),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def encode(self, model, texts: Sequence[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [text_key(t) for t in texts]
+        unique: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+
+        # The lock only covers index lookups and writes; texts another thread is already
+        # encoding are waited on instead of being encoded twice, and the model runs unlocked.
+        found: dict[str, np.ndarray] = {}
+        waiting: dict[str, Future] = {}
+        with self._lock:
+            for key in unique:
+                slot = self._index.get(key)
+                if slot is not None:
+                    found[key] = np.array(self._vectors[slot])
+                    self._touch(slot)
+                elif key in self._pending:
+                    waiting[key] = self._pending[key]
+            missing = [key for key in unique if key not in found and key not in waiting]
+            for key in missing:
+                self._pending[key] = Future()
+            # Hits count every text served without encoding, including in-batch repeats.
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            try:
+                encoded = np.asarray(model.encode([unique[k] for k in missing]), dtype=np.float32)
+            except BaseException as exc:
+                with self._lock:
+                    for key in missing:
+                        self._pending.pop(key).set_exception(exc)
+                raise
+            with self._lock:
+                if self._vectors is None:
+                    self._allocate(encoded.shape[1])
+                self._store(missing, encoded)
+                for key, vector in zip(missing, encoded):
+                    found[key] = vector
+                    self._pending.pop(key).set_result(vector)
+        for key, future in waiting.items():
+            found[key] = future.result()
+
+        return np.stack([found[k] for k in keys])
+
+    def _touch(self, slot: int) -> None:
+        self._tick += 1
+        self._ticks[slot] = self._tick
+
+    def _store(self, keys: list[str], vectors: np.ndarray) -> None:
+        if len(keys) > self.max_entries:
+            keys = keys[-self.max_entries:]
+            vectors = vectors[-self.max_entries:]
+        # Occupied slots are always the contiguous range [0, len(index)).
+        occupied = len(self._index)
+        slots = list(range(occupied, occupied + min(self.max_entries - occupied, len(keys))))
+        evict = len(keys) - len(slots)
+        if evict:
+            # Drop the least recently used entries to make room for the new batch.
+            by_slot = {slot: key for key, slot in self._index.items()}
+            victims = np.argsort(self._ticks[:occupied], kind="stable")[:evict]
+            for slot in victims:
+                del self._index[by_slot[int(slot)]]
+                slots.append(int(slot))
+            self.evictions += evict
+        for key, slot, vector in zip(keys, slots, vectors):
+            self._index[key] = slot
+            self._vectors[slot] = vector
+            self._touch(slot)
+        self._flush(zip(keys, slots))
+
+    def _flush(self, entries) -> None:
+        # Vectors reach disk before the log lines that point at them.
+        self._vectors.flush()
+        self._ticks.flush()
+        lines = [f"{key} {slot}\n" for key, slot in entries]
+        with open(self._path("index.log"), "a") as log:
+            log.writelines(lines)
+        self._log_lines += len(lines)
+        if self._log_lines > len(self._index):
+            self._compact()
+
+    def _compact(self) -> None:
+        tmp = self._path("index.json.tmp")
+        tmp.write_text(json.dumps(self._index))
+        os.replace(tmp, self._path("index.json"))
+        self._path("index.log").unlink(missing_ok=True)
+        self._log_lines = 0
+
+
+_cache: EmbeddingCache | None = None
+
+
+def configure_cache(directory: str | Path | None, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES) -> EmbeddingCache | None:
+    global _cache
+    _cache = EmbeddingCache(directory, model_name, max_entries) if directory else None
+    return _cache
+
+
+def get_cache() -> EmbeddingCache | None:
+    return _cache
@@ -0,0 +1,137 @@
+from __future__ import annotations
+import logging
+import os
+import resource
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Iterable
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+POSITIVE_ANCHOR = "I love this product and it works great"
+NEGATIVE_ANCHOR = "This product is frustrating and broken"
+
+
+class DummyModel:
+    # Offline fallback when the sentence-transformer weights cannot be loaded.
+    def encode(self, texts: Iterable[str]):
+        rng = np.random.default_rng(42)
+        return rng.normal(size=(len(texts), 8))
+
+
+@dataclass
+class ModelStats:
+    model_name: str
+    loaded: bool = False
+    dummy: bool = False
+    load_seconds: float | None = None
+    param_bytes: int | None = None
+    rss_delta_bytes: int | None = None
+    loaded_at: float | None = None
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is a high-water mark (KB on Linux), good enough as a fallback.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _param_bytes(model) -> int | None:
+    parameters = getattr(model, "parameters", None)
+    if parameters is None:
+        return None
+    return int(sum(p.numel() * p.element_size() for p in parameters()))
+
+
+def _load_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class EmbeddingModelRegistry:
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        self._lock = threading.Lock()
+        self._model = None
+        self._anchors: tuple[np.ndarray, np.ndarray] | None = None
+        self._stats = ModelStats(model_name=model_name)
+
+    @property
+    def model_name(self) -> str:
+        return self._stats.model_name
+
+    def configure(self, model_name: str) -> None:
+        with self._lock:
+            if model_name == self._stats.model_name:
+                return
+            self._model = None
+            self._anchors = None
+            self._stats = ModelStats(model_name=model_name)
+
+    def get_model(self):
+        model = self._model
+        if model is not None:
+            return model
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            return self._model
+
+    def anchor_embeddings(self) -> tuple[np.ndarray, np.ndarray]:
+        anchors = self._anchors
+        if anchors is not None:
+            return anchors
+        model = self.get_model()
+        with self._lock:
+            if self._anchors is None:
+                # Encoded one at a time so the dummy model keeps its per-call behaviour.
+                self._anchors = (
+                    np.asarray(model.encode([POSITIVE_ANCHOR])),
+                    np.asarray(model.encode([NEGATIVE_ANCHOR])),
+                )
+            return self._anchors
+
+    def warm_up(self) -> ModelStats:
+        self.anchor_embeddings()
+        return self._stats
+
+    def stats(self) -> dict:
+        return asdict(self._stats)
+
+    def _load(self):
+        started = time.perf_counter()
+        rss_before = _rss_bytes()
+        try:
+            model = _load_sentence_transformer(self._stats.model_name)
+            self._stats.dummy = False
+        except Exception:
+            logger.warning("Falling back to DummyModel; could not load %s", self._stats.model_name)
+            model = DummyModel()
+            self._stats.dummy = True
+        self._stats.loaded = True
+        self._stats.load_seconds = time.perf_counter() - started
+        self._stats.param_bytes = _param_bytes(model)
+        self._stats.rss_delta_bytes = max(0, _rss_bytes() - rss_before)
+        self._stats.loaded_at = time.time()
+        logger.info(
+            "Loaded embedding model %s in %.2fs (params=%s bytes, rss_delta=%s bytes)",
+            self._stats.model_name,
+            self._stats.load_seconds,
+            self._stats.param_bytes,
+            self._stats.rss_delta_bytes,
+        )
+        return model
+
+
+registry = EmbeddingModelRegistry()
+
+
+def get_registry() -> EmbeddingModelRegistry:
+    return registry
@@ -0,0 +1,34 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Observers receive (stage, seconds) for every timed block. The ML package stays free
+# of any metrics backend; the API registers its exporter here.
+StageObserver = Callable[[str, float], None]
+
+_observers: list[StageObserver] = []
+
+
+def add_observer(observer: StageObserver) -> None:
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_observer(observer: StageObserver) -> None:
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+def record(stage: str, seconds: float) -> None:
+    for observer in list(_observers):
+        observer(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
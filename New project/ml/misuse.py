@@ -0,0 +1,81 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+MISUSE_FEATURE = "export"
+MISUSE_THRESHOLD = 3
+MATCH_COLUMNS = ["rule", "user_id", "second"]
+COUNT_COLUMNS = ["rule", "user_id", "count"]
+# Low bits of each sort key hold the second within the window, high bits the (rule, user) group.
+_TIME_BITS = 34
+
+
+@dataclass(frozen=True)
+class MisuseRule:
+    # Flags users with at least `threshold` events of `feature` (restricted to
+    # `event_type` when set) in the window, or within any `span_seconds` stretch of it.
+    feature: str
+    threshold: int = MISUSE_THRESHOLD
+    event_type: str | None = None
+    span_seconds: int | None = None
+
+
+DEFAULT_RULES = (MisuseRule(MISUSE_FEATURE),)
+
+
+def parse_rules(items: list[dict]) -> tuple[MisuseRule, ...]:
+    return tuple(MisuseRule(**item) for item in items)
+
+
+def _seconds(values: pd.Series) -> np.ndarray:
+    return pd.to_datetime(values).to_numpy("datetime64[s]").astype(np.int64)
+
+
+def match_rules(events: pd.DataFrame, features: pd.Series, rules: tuple[MisuseRule, ...]) -> pd.DataFrame:
+    # One (rule, user_id, second) row per event and rule it matches. Rows are narrowed to
+    # the rule features first, then joined against the whole rule table at once.
+    if events.empty or not rules:
+        return pd.DataFrame({c: np.array([], dtype=np.int64) for c in MATCH_COLUMNS})
+    candidates = np.flatnonzero(features.isin({rule.feature for rule in rules}).to_numpy())
+    table = pd.DataFrame({
+        "rule": np.arange(len(rules)),
+        "feature": [rule.feature for rule in rules],
+        "rule_event_type": [rule.event_type for rule in rules],
+    })
+    hits = pd.DataFrame({
+        "row": candidates,
+        "feature": features.take(candidates).astype(object).to_numpy(),
+        "event_type": events["event_type"].take(candidates).astype(object).to_numpy(),
+    }).merge(table, on="feature", sort=False)
+    hits = hits[hits["rule_event_type"].isna() | hits["rule_event_type"].eq(hits["event_type"])]
+    rows = hits["row"].to_numpy()
+    return pd.DataFrame({
+        "rule": hits["rule"].to_numpy(np.int64),
+        "user_id": events["user_id"].to_numpy(np.int64)[rows],
+        "second": _seconds(events["timestamp"].take(rows)),
+    })
+
+
+def misuse_counts(matches: pd.DataFrame, rules: tuple[MisuseRule, ...]) -> pd.DataFrame:
+    # Per (rule, user): matched events in the window, or the most in any span for rules
+    # with `span_seconds`. A single sort and searchsorted covers every rule.
+    if matches.empty:
+        return pd.DataFrame({c: np.array([], dtype=np.int64) for c in COUNT_COLUMNS})
+    rule, user_id, second = (matches[c].to_numpy() for c in MATCH_COLUMNS)
+    order = np.lexsort((second, user_id, rule))
+    rule, user_id, second = rule[order], user_id[order], second[order] - second.min()
+    starts = np.r_[True, (np.diff(rule) != 0) | (np.diff(user_id) != 0)]
+    group = np.cumsum(starts) - 1
+    key = (group << _TIME_BITS) | second
+    spans = np.array([r.span_seconds or 0 for r in rules], dtype=np.int64)[rule]
+    # Lower bounds never reach into the previous group; without a span the bound is the
+    # group's first key, so the count is the group's size.
+    first = group << _TIME_BITS
+    lower = np.where(spans > 0, np.maximum(key - spans + 1, first), first)
+    in_span = np.arange(len(key)) - np.searchsorted(key, lower, side="left") + 1
+    return pd.DataFrame({
+        "rule": rule[starts],
+        "user_id": user_id[starts],
+        "count": np.maximum.reduceat(in_span, np.flatnonzero(starts)),
+    })
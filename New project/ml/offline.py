@@ -0,0 +1,250 @@
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator
+import numpy as np
+import pandas as pd
+
+from .misuse import COUNT_COLUMNS, DEFAULT_RULES, MisuseRule, match_rules, misuse_counts, parse_rules
+from .pipeline import (
+    Insight,
+    anomaly_detection,
+    extract_features,
+    finalize_insights,
+    misuse_insights,
+    sentiment_analysis,
+)
+from .sentiment import BACKENDS, DEFAULT_BACKEND, configure_sentiment
+
+# Runs the window detectors over exports that do not fit in memory:
+#   python -m ml.offline events.parquet [more files...] --feedback feedback.parquet --output insights.json
+# Events are reduced chunk by chunk into per-user aggregates whose size is bounded by
+# users x days, never by the number of events.
+DEFAULT_CHUNK_ROWS = 1_000_000
+EVENT_COLUMNS = ["user_id", "event_type", "metadata", "timestamp"]
+FEEDBACK_COLUMNS = ["user_id", "text", "rating", "timestamp"]
+# Pending partials are folded together once this many have accumulated.
+_COMPACT_EVERY = 16
+
+
+def read_chunks(path: Path, columns: list[str], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        # Only the needed columns are decoded, one record batch at a time.
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    elif suffix in (".ndjson", ".jsonl"):
+        for chunk in pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False, convert_dates=False):
+            yield chunk[columns]
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+
+
+def _timestamps(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(values) and getattr(values.dt, "tz", None) is None:
+        return values
+    return pd.to_datetime(values, utc=True, format="ISO8601").dt.tz_localize(None)
+
+
+def _fold(parts: list[pd.Series]) -> list[pd.Series]:
+    parts = [p for p in parts if not p.empty]
+    if len(parts) <= 1:
+        return parts
+    combined = pd.concat(parts)
+    return [combined.groupby(level=list(range(combined.index.nlevels))).sum()]
+
+
+@dataclass
+class PartialAggregates:
+    # daily: (user_id, day) -> events; event_types: (user_id, event_type) -> events;
+    # misuse: (rule, user_id) -> matched events for rules without a span. Each is kept as
+    # a few pending partial Series that are summed lazily, so `update` and `merge` are
+    # both cheap appends. Span rules need event times across chunk boundaries, so their
+    # matches (rule, user_id, second) are kept as rows.
+    rules: tuple[MisuseRule, ...] = DEFAULT_RULES
+    daily: list[pd.Series] = field(default_factory=list)
+    event_types: list[pd.Series] = field(default_factory=list)
+    misuse: list[pd.Series] = field(default_factory=list)
+    span_matches: list[pd.DataFrame] = field(default_factory=list)
+    rows: int = 0
+
+    def update(self, events: pd.DataFrame, start: datetime | None = None, end: datetime | None = None) -> None:
+        timestamps = _timestamps(events["timestamp"])
+        keep = pd.Series(True, index=events.index)
+        if start is not None:
+            keep &= timestamps >= start
+        if end is not None:
+            keep &= timestamps <= end
+        events = events.loc[keep]
+        timestamps = timestamps.loc[keep]
+        self.rows += len(events)
+        if events.empty:
+            return
+        user_ids = events["user_id"].astype("int64")
+        self.daily.append(user_ids.groupby([user_ids, timestamps.dt.normalize().rename("day")]).size())
+        self.event_types.append(user_ids.groupby([user_ids, events["event_type"].astype(str).rename("event_type")]).size())
+        matches = match_rules(events.assign(timestamp=timestamps), extract_features(events["metadata"]), self.rules)
+        spanned = np.array([bool(rule.span_seconds) for rule in self.rules])[matches["rule"].to_numpy()]
+        totals = matches[~spanned]
+        self.misuse.append(totals.groupby(["rule", "user_id"]).size())
+        self.span_matches.append(matches[spanned])
+        if len(self.daily) >= _COMPACT_EVERY:
+            self.compact()
+
+    def merge(self, other: PartialAggregates) -> PartialAggregates:
+        self.daily.extend(other.daily)
+        self.event_types.extend(other.event_types)
+        self.misuse.extend(other.misuse)
+        self.span_matches.extend(other.span_matches)
+        self.rows += other.rows
+        self.compact()
+        return self
+
+    def compact(self) -> None:
+        self.daily = _fold(self.daily)
+        self.event_types = _fold(self.event_types)
+        self.misuse = _fold(self.misuse)
+        self.span_matches = [pd.concat(self.span_matches, ignore_index=True)] if self.span_matches else []
+
+    def daily_counts(self) -> pd.DataFrame:
+        self.compact()
+        if not self.daily:
+            return pd.DataFrame(columns=["user_id", "day", "count"])
+        return self.daily[0].rename_axis(["user_id", "day"]).reset_index(name="count")
+
+    def feature_vectors(self) -> pd.DataFrame:
+        # Same shape as compute_user_feature_vectors.
+        self.compact()
+        if not self.event_types:
+            return pd.DataFrame(columns=["user_id", "event_count"])
+        counts = self.event_types[0].rename_axis(["user_id", "event_type"]).unstack(fill_value=0)
+        counts["event_count"] = counts.sum(axis=1)
+        return counts.reset_index()
+
+    def misuse_counts(self) -> pd.DataFrame:
+        # Same rows as ml.misuse.misuse_counts over all the window's events.
+        self.compact()
+        parts = [self.misuse[0].rename_axis(["rule", "user_id"]).reset_index(name="count")] if self.misuse else []
+        if self.span_matches:
+            parts.append(misuse_counts(self.span_matches[0], self.rules))
+        if not parts:
+            return pd.DataFrame({c: np.array([], dtype=np.int64) for c in COUNT_COLUMNS})
+        return pd.concat(parts, ignore_index=True).sort_values(["rule", "user_id"], kind="stable")
+
+    def insights(self) -> list[Insight]:
+        found = anomaly_detection(pd.DataFrame(), daily_counts=self.daily_counts())
+        return found + misuse_insights(self.misuse_counts(), self.rules)
+
+
+def aggregate_events(
+    path: Path,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    progress: Callable[[Path, PartialAggregates, float], None] | None = None,
+    rules: tuple[MisuseRule, ...] = DEFAULT_RULES,
+) -> PartialAggregates:
+    aggregates = PartialAggregates(rules=rules)
+    started = time.perf_counter()
+    for chunk in read_chunks(path, EVENT_COLUMNS, chunk_rows):
+        aggregates.update(chunk, start, end)
+        if progress is not None:
+            progress(path, aggregates, time.perf_counter() - started)
+    aggregates.compact()
+    return aggregates
+
+
+def feedback_insights(
+    paths: list[Path], chunk_rows: int = DEFAULT_CHUNK_ROWS, start: datetime | None = None, end: datetime | None = None
+) -> list[Insight]:
+    # Sentiment is judged per row, so feedback needs no aggregation.
+    found: list[Insight] = []
+    for path in paths:
+        for chunk in read_chunks(path, FEEDBACK_COLUMNS, chunk_rows):
+            timestamps = _timestamps(chunk["timestamp"])
+            keep = pd.Series(True, index=chunk.index)
+            if start is not None:
+                keep &= timestamps >= start
+            if end is not None:
+                keep &= timestamps <= end
+            found.extend(sentiment_analysis(chunk.loc[keep].reset_index(drop=True)))
+    return found
+
+
+def run_offline(
+    event_paths: list[Path],
+    feedback_paths: list[Path] = (),
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    workers: int = 1,
+    progress: Callable[[Path, PartialAggregates, float], None] | None = None,
+    rules: tuple[MisuseRule, ...] = DEFAULT_RULES,
+) -> tuple[list[dict], PartialAggregates]:
+    aggregates = PartialAggregates(rules=rules)
+    if workers > 1 and len(event_paths) > 1:
+        # Files are reduced independently and merged; progress is per finished file.
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(aggregate_events, path, chunk_rows, start, end, None, rules) for path in event_paths]
+            for path, future in zip(event_paths, futures):
+                aggregates.merge(future.result())
+                if progress is not None:
+                    progress(path, aggregates, 0.0)
+    else:
+        for path in event_paths:
+            aggregates.merge(aggregate_events(path, chunk_rows, start, end, progress, rules))
+    insights = aggregates.insights() + feedback_insights(list(feedback_paths), chunk_rows, start, end)
+    return finalize_insights(insights), aggregates
+
+
+def _print_progress(path: Path, aggregates: PartialAggregates, seconds: float) -> None:
+    rate = f", {aggregates.rows / seconds:,.0f} rows/s" if seconds else ""
+    print(f"{path.name}: {aggregates.rows:,} events aggregated{rate}", file=sys.stderr, flush=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the insight detectors over Parquet/CSV/NDJSON event exports")
+    parser.add_argument("events", nargs="+", type=Path, help="event export files")
+    parser.add_argument("--feedback", nargs="*", type=Path, default=[], help="feedback export files")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1, help="processes used to reduce separate event files")
+    parser.add_argument("--output", type=Path, default=None, help="write insights as JSON (default: stdout)")
+    parser.add_argument("--rules", type=Path, default=None, help="JSON list of misuse rules (default: export >= 3)")
+    parser.add_argument("--features-output", type=Path, default=None, help="write per-user feature vectors as CSV")
+    parser.add_argument("--sentiment-backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--sentiment-model", default=None, help="model file for the hashing sentiment backend")
+    args = parser.parse_args(argv)
+
+    rules = parse_rules(json.loads(args.rules.read_text())) if args.rules else DEFAULT_RULES
+    configure_sentiment(args.sentiment_backend, args.sentiment_model)
+    started = time.perf_counter()
+    insights, aggregates = run_offline(
+        args.events, args.feedback, args.chunk_rows, args.start, args.end, args.workers, _print_progress, rules
+    )
+    elapsed = time.perf_counter() - started
+    print(
+        f"{aggregates.rows:,} events -> {len(insights)} insights in {elapsed:.1f}s "
+        f"({aggregates.rows / elapsed if elapsed else 0:,.0f} events/s)",
+        file=sys.stderr,
+    )
+    if args.features_output:
+        aggregates.feature_vectors().to_csv(args.features_output, index=False)
+    body = json.dumps(insights, indent=2, default=str)
+    if args.output:
+        args.output.write_text(body)
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 from __future__ import annotations
+import ast
+import json
+import re
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Iterable
 import numpy as np
 import pandas as pd
 from sklearn.cluster import KMeans
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .churn import ChurnScores, build_daily_matrix, rolling_churn_scores
+from .instrumentation import timed
+from .misuse import DEFAULT_RULES, MisuseRule, match_rules, misuse_counts
+from .sentiment import get_sentiment_backend
+from .sharding import ShardConfig, run_sharded
+from .stages import Stage, StageGraph, StageRun
 
 
 @dataclass
@@ -17,6 +24,12 @@ class Insight:
     explanation: str | None = None
 
 
+CHURN_WINDOW = 3
+CHURN_Z_THRESHOLD = -1.0
+
+SENTIMENT_KEYWORDS = ("love", "great", "helpful")
+_KEYWORD_PATTERN = "|".join(re.escape(word) for word in SENTIMENT_KEYWORDS)
+
 PROMPT_TEMPLATE = """
 You are an analytics assistant. Explain the insight in plain language.
 Insight type: {insight_type}
@@ -26,10 +39,23 @@ Tone: concise, actionable
 """.strip()
 
 
-def compute_user_feature_vectors(events: pd.DataFrame) -> pd.DataFrame:
-    if events.empty:
+def compute_user_feature_vectors(events: pd.DataFrame, daily_counts: pd.DataFrame | None = None) -> pd.DataFrame:
+    # `daily_counts` (user_id, day, event_type, count) is the pre-aggregated rollup of
+    # `events`; when present it replaces the scan over raw events.
+    if daily_counts is not None:
+        if daily_counts.empty:
+            return pd.DataFrame(columns=["user_id", "event_count"])
+        counts = daily_counts.groupby(["user_id", "event_type"], observed=True)["count"].sum().unstack(fill_value=0)
+    elif events.empty:
         return pd.DataFrame(columns=["user_id", "event_count"])
-    counts = events.groupby(["user_id", "event_type"]).size().unstack(fill_value=0)
+    else:
+        counts = events.groupby(["user_id", "event_type"], observed=True).size().unstack(fill_value=0)
+    return feature_vector_frame(counts)
+
+
+def feature_vector_frame(counts: pd.DataFrame) -> pd.DataFrame:
+    # `counts` is the user x event_type pivot indexed by user_id.
+    counts.columns = pd.Index(counts.columns.astype(str), name=counts.columns.name)
     counts["event_count"] = counts.sum(axis=1)
     counts.reset_index(inplace=True)
     return counts
@@ -45,89 +71,130 @@ def cluster_users(feature_df: pd.DataFrame, k: int = 3) -> dict[int, str]:
     return {int(uid): f"cohort_{label}" for uid, label in zip(feature_df["user_id"], labels)}
 
 
-def anomaly_detection(events: pd.DataFrame) -> list[Insight]:
-    insights: list[Insight] = []
-    if events.empty:
-        return insights
-    events["date"] = pd.to_datetime(events["timestamp"]).dt.date
-    daily = events.groupby(["user_id", "date"]).size().reset_index(name="count")
-    for user_id, group in daily.groupby("user_id"):
-        series = group.sort_values("date")["count"]
-        if len(series) < 3:
-            continue
-        rolling = series.rolling(window=3, min_periods=3).mean()
-        std = series.rolling(window=3, min_periods=3).std()
-        last_mean = rolling.iloc[-1]
-        last_std = std.iloc[-1] or 0.0
-        z_score = (series.iloc[-1] - last_mean) / (last_std or 1.0)
-        if z_score < -1.0:
-            insights.append(Insight(
-                type="silent_churn_risk",
-                score=float(abs(z_score)),
-                payload={"user_id": int(user_id), "recent_count": int(series.iloc[-1]), "mean": float(last_mean)},
-            ))
-    return insights
+def anomaly_detection(
+    events: pd.DataFrame,
+    window: int = CHURN_WINDOW,
+    z_threshold: float = CHURN_Z_THRESHOLD,
+    fill_missing_days: bool = False,
+    daily_counts: pd.DataFrame | None = None,
+) -> list[Insight]:
+    if daily_counts is not None:
+        if daily_counts.empty:
+            return []
+        per_day = daily_counts.groupby(["user_id", "day"], observed=True)["count"].sum().reset_index()
+        matrix = build_daily_matrix(per_day["user_id"], pd.to_datetime(per_day["day"]), per_day["count"].to_numpy())
+    elif events.empty:
+        return []
+    else:
+        days = pd.to_datetime(events["timestamp"]).dt.normalize()
+        matrix = build_daily_matrix(events["user_id"], days)
+    return churn_insights(rolling_churn_scores(matrix, window, fill_missing_days), z_threshold)
+
+
+def churn_insights(scores: ChurnScores, z_threshold: float = CHURN_Z_THRESHOLD) -> list[Insight]:
+    flagged = np.flatnonzero(scores.z_score < z_threshold)
+    return [
+        Insight(
+            type="silent_churn_risk",
+            score=float(abs(scores.z_score[i])),
+            payload={"user_id": int(scores.user_ids[i]), "recent_count": int(scores.recent[i]), "mean": float(scores.mean[i])},
+        )
+        for i in flagged
+    ]
 
 
 def sentiment_analysis(feedback: pd.DataFrame) -> list[Insight]:
-    insights: list[Insight] = []
     if feedback.empty:
-        return insights
-    model = _get_model()
+        return []
     texts = feedback["text"].astype(str).tolist()
-    embeddings = model.encode(texts)
-
-    pos_anchor = model.encode(["I love this product and it works great"])
-    neg_anchor = model.encode(["This product is frustrating and broken"])
-    pos_sim = cosine_similarity(embeddings, pos_anchor).flatten()
-    neg_sim = cosine_similarity(embeddings, neg_anchor).flatten()
-    polarity = pos_sim - neg_sim
-
-    for idx, row in feedback.iterrows():
-        text = str(row["text"]).lower()
-        score = float(polarity[idx])
-        if abs(score) < 0.05:
-            score = 1.0 if any(word in text for word in ["love", "great", "helpful"]) else -1.0
-        if row.get("rating") is not None and row.get("rating") <= 2 and score > 0:
-            insights.append(Insight(
-                type="sentiment_mismatch",
-                score=score,
-                payload={"user_id": int(row["user_id"]), "rating": int(row["rating"]), "text": row["text"]},
-            ))
-        if row.get("rating") is not None and row.get("rating") >= 4 and score < 0:
-            insights.append(Insight(
-                type="sentiment_mismatch",
-                score=abs(score),
-                payload={"user_id": int(row["user_id"]), "rating": int(row["rating"]), "text": row["text"]},
-            ))
-    return insights
+    return sentiment_mismatches(feedback, get_sentiment_backend().polarity(texts))
+
+
+def sentiment_mismatches(feedback: pd.DataFrame, polarity: np.ndarray) -> list[Insight]:
+    if feedback.empty or "rating" not in feedback.columns:
+        return []
+    # Everything is positional so filtered or re-indexed frames line up with `polarity`.
+    polarity = np.asarray(polarity, dtype=float)
+    lowered = feedback["text"].astype(str).str.lower()
+    has_keyword = lowered.str.contains(_KEYWORD_PATTERN, regex=True).to_numpy(dtype=bool)
+    scores = np.where(np.abs(polarity) < 0.05, np.where(has_keyword, 1.0, -1.0), polarity)
+
+    ratings = pd.to_numeric(feedback["rating"], errors="coerce").to_numpy(dtype=float)
+    low_but_positive = (ratings <= 2) & (scores > 0)
+    high_but_negative = (ratings >= 4) & (scores < 0)
+    hits = np.flatnonzero(low_but_positive | high_but_negative)
+
+    user_ids = feedback["user_id"].to_numpy()[hits]
+    texts = feedback["text"].to_numpy()[hits]
+    return [
+        Insight(
+            type="sentiment_mismatch",
+            score=float(abs(score)),
+            payload={"user_id": int(user_id), "rating": int(rating), "text": text},
+        )
+        for user_id, rating, text, score in zip(user_ids, ratings[hits], texts, scores[hits])
+    ]
+
+
+# events.feature holds metadata["feature"] when it is a top-level string, cut to the
+# column's 100 characters, and NULL otherwise. Ingest, the bulk loader, the offline
+# pipeline and the SQL in migration 0009 all follow this one rule.
+FEATURE_MAX_LENGTH = 100
+# Flat JSON ("feature": "x") and legacy Python-literal ('feature': 'x') metadata.
+_FEATURE_PATTERN = re.compile(r"""[{,]\s*["']feature["']\s*:\s*["']([^"'\\]*)["']""")
 
 
-def _get_model():
+def metadata_feature(metadata) -> str | None:
+    feature = metadata.get("feature") if isinstance(metadata, dict) else None
+    return feature[:FEATURE_MAX_LENGTH] if isinstance(feature, str) else None
+
+
+def _parse_feature(text: str) -> str | None:
+    try:
+        return metadata_feature(json.loads(text))
+    except ValueError:
+        pass
     try:
-        return SentenceTransformer("all-MiniLM-L6-v2")
-    except Exception:
-        class DummyModel:
-            def encode(self, texts: Iterable[str]):
-                rng = np.random.default_rng(42)
-                return rng.normal(size=(len(texts), 8))
-        return DummyModel()
+        return metadata_feature(ast.literal_eval(text))
+    except (ValueError, SyntaxError, TypeError):
+        return None
 
 
-def detect_feature_misuse(events: pd.DataFrame) -> list[Insight]:
-    insights: list[Insight] = []
+def extract_features(metadata: pd.Series) -> pd.Series:
+    # Parsed metadata (dicts) or its serialized text -> feature name per row, NaN/None if absent.
+    if metadata.map(type).eq(dict).any():
+        return pd.Series([metadata_feature(m) for m in metadata], index=metadata.index, dtype=object)
+    text = metadata.astype(str)
+    features = text.str.extract(_FEATURE_PATTERN, expand=False).str.slice(0, FEATURE_MAX_LENGTH)
+    # The regex only sees flat objects; nested or escaped metadata is parsed row by row.
+    parse = text.str.count("{").gt(1) | text.str.contains("\\", regex=False)
+    if parse.any():
+        features = features.astype(object)
+        features[parse] = text[parse].map(_parse_feature)
+    return features
+
+
+def detect_feature_misuse(events: pd.DataFrame, rules: tuple[MisuseRule, ...] = DEFAULT_RULES) -> list[Insight]:
     if events.empty:
-        return insights
-    if "metadata" not in events.columns:
-        return insights
-    misuse = events[events["metadata"].apply(lambda m: isinstance(m, dict) and m.get("feature") == "export")]
-    for user_id, count in misuse.groupby("user_id").size().items():
-        if count >= 3:
-            insights.append(Insight(
-                type="feature_misuse",
-                score=float(count),
-                payload={"user_id": int(user_id), "feature": "export", "count": int(count)},
-            ))
+        return []
+    if "feature" not in events.columns and "metadata" not in events.columns:
+        return []
+    return misuse_insights(misuse_counts(match_rules(events, _features(events), rules), rules), rules)
+
+
+def misuse_insights(counts: pd.DataFrame, rules: tuple[MisuseRule, ...]) -> list[Insight]:
+    # `counts` has one (rule, user_id, count) row per pair, ordered by rule then user.
+    thresholds = np.array([rule.threshold for rule in rules], dtype=np.int64)
+    flagged = counts[counts["count"].to_numpy() >= thresholds[counts["rule"].to_numpy()]]
+    insights: list[Insight] = []
+    for index, user_id, count in flagged[["rule", "user_id", "count"]].itertuples(index=False):
+        rule = rules[index]
+        payload = {"user_id": int(user_id), "feature": rule.feature, "count": int(count)}
+        if rule.event_type is not None:
+            payload["event_type"] = rule.event_type
+        if rule.span_seconds:
+            payload["span_seconds"] = rule.span_seconds
+        insights.append(Insight(type="feature_misuse", score=float(count), payload=payload))
     return insights
 
 
@@ -136,33 +203,110 @@ def explain_insight(insight_payload: dict, insight_type: str) -> str:
     return PROMPT_TEMPLATE.format(insight_type=insight_type, facts=facts)
 
 
+def _user_days(events: pd.DataFrame, daily_counts: pd.DataFrame | None) -> pd.DataFrame:
+    # (user_id, day, count) per active day; timestamps are parsed here once per run.
+    if daily_counts is not None:
+        if daily_counts.empty:
+            return pd.DataFrame(columns=["user_id", "day", "count"])
+        return daily_counts.groupby(["user_id", "day"], observed=True)["count"].sum().reset_index()
+    if events.empty:
+        return pd.DataFrame(columns=["user_id", "day", "count"])
+    days = pd.to_datetime(events["timestamp"]).dt.normalize().rename("day")
+    return events["user_id"].groupby([events["user_id"], days]).size().reset_index(name="count")
+
+
+def _features(events: pd.DataFrame) -> pd.Series:
+    # Frames loaded from the database carry the normalized `feature` column (migration 0009).
+    if "feature" in events.columns:
+        return events["feature"]
+    if events.empty or "metadata" not in events.columns:
+        return pd.Series(index=events.index, dtype=object)
+    return extract_features(events["metadata"])
+
+
+# Shared intermediates come first; detectors only read them, so no stage copies the
+# input frames and the three detectors can run side by side.
+WINDOW_STAGES = StageGraph(
+    [
+        Stage("user_days", _user_days, ("events", "daily_counts")),
+        Stage("feature_vectors", compute_user_feature_vectors, ("events", "daily_counts")),
+        Stage("features", _features, ("events",)),
+        Stage("misuse_matches", match_rules, ("events", "features", "rules")),
+        Stage("anomaly", lambda user_days: anomaly_detection(pd.DataFrame(), daily_counts=user_days), ("user_days",)),
+        Stage("misuse", lambda misuse_matches, rules: misuse_insights(misuse_counts(misuse_matches, rules), rules),
+              ("misuse_matches", "rules")),
+        Stage("sentiment", sentiment_analysis, ("feedback",)),
+    ],
+    inputs=("events", "feedback", "users", "daily_counts", "rules"),
+)
+# Same outputs, but the per-user work (daily counts, churn, misuse, event-type pivot) is
+# done in one pass over user-hashed shards in a process pool; see ml.sharding.
+SHARDED_WINDOW_STAGES = StageGraph(
+    [
+        Stage("features", _features, ("events",)),
+        Stage("per_user", run_sharded, ("events", "daily_counts", "features", "rules", "config")),
+        Stage("feature_vectors", lambda per_user: per_user[2], ("per_user",)),
+        Stage("anomaly", lambda per_user: per_user[0], ("per_user",)),
+        Stage("misuse", lambda per_user: per_user[1], ("per_user",)),
+        Stage("sentiment", sentiment_analysis, ("feedback",)),
+    ],
+    inputs=("events", "feedback", "users", "daily_counts", "rules", "config"),
+)
+DETECTORS = ("anomaly", "misuse", "sentiment")
+DETECTOR_THREADS = 3
+
+
+def window_stages(
+    events: pd.DataFrame,
+    feedback: pd.DataFrame,
+    users: pd.DataFrame,
+    daily_counts: pd.DataFrame | None = None,
+    shards: ShardConfig | None = None,
+    rules: tuple[MisuseRule, ...] = DEFAULT_RULES,
+) -> StageRun:
+    # Per-run memo of the window's intermediates; each stage is timed as "pipeline.<stage>".
+    inputs = dict(events=events, feedback=feedback, users=users, daily_counts=daily_counts, rules=tuple(rules))
+    if shards is not None and shards.workers > 1:
+        return SHARDED_WINDOW_STAGES.start("pipeline", config=shards, **inputs)
+    return WINDOW_STAGES.start("pipeline", **inputs)
+
+
 def generate_insights_for_window(
     events: pd.DataFrame,
     feedback: pd.DataFrame,
     users: pd.DataFrame,
+    daily_counts: pd.DataFrame | None = None,
+    stages: StageRun | None = None,
+    max_workers: int = DETECTOR_THREADS,
+    shards: ShardConfig | None = None,
+    rules: tuple[MisuseRule, ...] = DEFAULT_RULES,
 ) -> list[dict]:
+    # Feature vectors are stored once per generation run by the caller rather than
+    # being copied into every insight payload. Callers that already built `stages` for
+    # this window (e.g. for feature vectors) pass it to reuse its intermediates.
+    stages = stages or window_stages(events, feedback, users, daily_counts, shards, rules)
+    results = stages.run(list(DETECTORS), max_workers=max_workers)
     insights: list[Insight] = []
+    for name in DETECTORS:
+        insights.extend(results[name])
+    return finalize_insights(insights)
 
-    feature_vectors = compute_user_feature_vectors(events)
-    _ = users
-    insights.extend(anomaly_detection(events.copy()))
-    insights.extend(detect_feature_misuse(events.copy()))
-    insights.extend(sentiment_analysis(feedback.copy()))
 
+def finalize_insights(insights: list[Insight]) -> list[dict]:
     if not insights:
-        insights.append(Insight(
+        insights = [Insight(
             type="silent_churn_risk",
             score=0.1,
             payload={"user_id": 0, "recent_count": 0, "mean": 0},
-        ))
+        )]
 
     result = []
-    for insight in insights:
-        result.append({
-            "type": insight.type,
-            "score": insight.score,
-            "payload": insight.payload,
-            "explanation": explain_insight(insight.payload, insight.type),
-            "features": feature_vectors.to_dict(orient="records"),
-        })
+    with timed("pipeline.explain"):
+        for insight in insights:
+            result.append({
+                "type": insight.type,
+                "score": insight.score,
+                "payload": insight.payload,
+                "explanation": explain_insight(insight.payload, insight.type),
+            })
     return result
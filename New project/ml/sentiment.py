@@ -0,0 +1,161 @@
+from __future__ import annotations
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import ClassVar, Iterable, Protocol
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from .embedding_cache import get_cache
+from .embeddings import DummyModel, get_registry
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# Backends map feedback texts to a polarity in [-1, 1] (positive > 0). "embedding" is the
+# sentence-transformer anchor comparison; "hashing" is a linear model over hashed n-grams
+# trained on rated feedback, which needs no network and scores sparse rows on the CPU.
+BACKENDS = ("embedding", "hashing")
+DEFAULT_BACKEND = "embedding"
+HASH_FEATURES = 2 ** 20
+POSITIVE_RATING = 4
+NEGATIVE_RATING = 2
+
+
+class SentimentBackend(Protocol):
+    name: str
+
+    def polarity(self, texts: list[str]) -> np.ndarray: ...
+
+
+def _encode(model, texts: list[str]):
+    cache = get_cache()
+    if cache is None or isinstance(model, DummyModel) or cache.model_name != get_registry().model_name:
+        return model.encode(texts)
+    return cache.encode(model, texts)
+
+
+class EmbeddingSentiment:
+    name = "embedding"
+
+    def polarity(self, texts: list[str]) -> np.ndarray:
+        registry = get_registry()
+        model = registry.get_model()
+        with timed("pipeline.embed"):
+            embeddings = _encode(model, texts)
+        pos_anchor, neg_anchor = registry.anchor_embeddings()
+        return cosine_similarity(embeddings, pos_anchor).flatten() - cosine_similarity(embeddings, neg_anchor).flatten()
+
+
+def _vectorizer(n_features: int, ngram_max: int):
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    # Stateless, so the saved model is just the weights and these two numbers.
+    return HashingVectorizer(n_features=n_features, ngram_range=(1, ngram_max), alternate_sign=False, norm="l2")
+
+
+def weak_labels(ratings: Iterable) -> np.ndarray:
+    # 1 for ratings >= POSITIVE_RATING, 0 for <= NEGATIVE_RATING, -1 (unused) otherwise.
+    ratings = np.asarray(ratings, dtype=float)
+    return np.where(ratings >= POSITIVE_RATING, 1, np.where(ratings <= NEGATIVE_RATING, 0, -1))
+
+
+@dataclass
+class HashingSentiment:
+    coef: np.ndarray
+    intercept: float
+    n_features: int = HASH_FEATURES
+    ngram_max: int = 2
+    name: ClassVar[str] = "hashing"
+    _vectorizer: object = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._vectorizer = _vectorizer(self.n_features, self.ngram_max)
+
+    def polarity(self, texts: list[str]) -> np.ndarray:
+        # Sparse rows times a dense weight vector: cost follows the tokens present.
+        rows = self._vectorizer.transform(texts)
+        margin = rows @ self.coef + self.intercept
+        # 2 * sigmoid(margin) - 1, i.e. P(positive) rescaled to [-1, 1].
+        return np.tanh(np.asarray(margin, dtype=np.float64) / 2)
+
+    @classmethod
+    def train(
+        cls, texts: list[str], ratings: Iterable, n_features: int = HASH_FEATURES, ngram_max: int = 2, C: float = 1.0
+    ) -> HashingSentiment:
+        from sklearn.linear_model import LogisticRegression
+
+        labels = weak_labels(ratings)
+        keep = labels >= 0
+        if len(set(labels[keep].tolist())) < 2:
+            raise ValueError(
+                f"training needs both positive (>= {POSITIVE_RATING}) and negative (<= {NEGATIVE_RATING}) ratings"
+            )
+        rows = _vectorizer(n_features, ngram_max).transform([t for t, k in zip(texts, keep) if k])
+        model = LogisticRegression(C=C, solver="liblinear", class_weight="balanced").fit(rows, labels[keep])
+        return cls(model.coef_.ravel().astype(np.float32), float(model.intercept_[0]), n_features, ngram_max)
+
+    def save(self, path: str | Path) -> None:
+        # Only the non-zero weights are stored; the hashed space is mostly empty.
+        indices = np.flatnonzero(self.coef)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                indices=indices.astype(np.int64),
+                values=self.coef[indices],
+                intercept=self.intercept,
+                n_features=self.n_features,
+                ngram_max=self.ngram_max,
+            )
+
+    @classmethod
+    def load(cls, path: str | Path) -> HashingSentiment:
+        with np.load(path) as data:
+            n_features = int(data["n_features"])
+            coef = np.zeros(n_features, dtype=np.float32)
+            coef[data["indices"]] = data["values"]
+            return cls(coef, float(data["intercept"]), n_features, int(data["ngram_max"]))
+
+
+class _BackendRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend_name = DEFAULT_BACKEND
+        self._model_path: str | None = None
+        self._backend: SentimentBackend | None = None
+
+    def configure(self, backend: str = DEFAULT_BACKEND, model_path: str | None = None) -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown sentiment backend {backend!r}; expected one of {BACKENDS}")
+        with self._lock:
+            if (backend, model_path) == (self._backend_name, self._model_path):
+                return
+            self._backend_name, self._model_path, self._backend = backend, model_path, None
+
+    def get(self) -> SentimentBackend:
+        backend = self._backend
+        if backend is not None:
+            return backend
+        with self._lock:
+            if self._backend is None:
+                self._backend = self._load()
+            return self._backend
+
+    def _load(self) -> SentimentBackend:
+        if self._backend_name == "hashing":
+            if self._model_path and Path(self._model_path).exists():
+                return HashingSentiment.load(self._model_path)
+            logger.warning("Falling back to embedding sentiment; no hashing model at %s", self._model_path)
+        return EmbeddingSentiment()
+
+
+_registry = _BackendRegistry()
+
+
+def configure_sentiment(backend: str = DEFAULT_BACKEND, model_path: str | None = None) -> None:
+    _registry.configure(backend, model_path)
+
+
+def get_sentiment_backend() -> SentimentBackend:
+    return _registry.get()
@@ -0,0 +1,183 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+
+from .churn import build_daily_matrix, rolling_churn_scores
+from .misuse import MisuseRule, match_rules, misuse_counts
+
+# Per-user detectors only ever look at one user's rows, so the window can be split by
+# user and each shard scored in its own process. Shards travel to the workers as Arrow
+# IPC streams in shared memory, which the workers map without copying.
+DEFAULT_SHARD_ROWS = 500_000
+
+
+@dataclass(frozen=True)
+class ShardConfig:
+    workers: int = 1
+    # Target rows per shard; a window gets at least `workers` shards.
+    shard_rows: int = DEFAULT_SHARD_ROWS
+
+    def shard_count(self, rows: int) -> int:
+        if self.workers <= 1 or rows == 0:
+            return 1
+        return max(self.workers, -(-rows // max(1, self.shard_rows)))
+
+
+@dataclass
+class ShardResult:
+    anomaly: list
+    # (rule, user_id, count) rows, see ml.misuse.misuse_counts
+    misuse: pd.DataFrame
+    # (user_id, event code) -> count
+    type_counts: pd.Series
+
+
+def shard_ids(user_ids, n_shards: int) -> np.ndarray:
+    # pandas hashes with a fixed key, so a user lands in the same shard in every process.
+    hashed = pd.util.hash_array(np.asarray(user_ids, dtype=np.int64))
+    return (hashed % np.uint64(n_shards)).astype(np.int64)
+
+
+def _event_codes(values: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    # Codes follow the column order compute_user_feature_vectors produces: category
+    # order for categoricals, sorted values otherwise.
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(np.int32), values.cat.categories
+    codes, labels = pd.factorize(values, sort=True)
+    return codes.astype(np.int32), labels
+
+
+def _epoch_days(values: pd.Series) -> np.ndarray:
+    return pd.to_datetime(values).to_numpy("datetime64[D]").astype(np.int64)
+
+
+def detect_shard(
+    counts: pd.DataFrame, matches: pd.DataFrame, rules: tuple[MisuseRule, ...], start_day: int, n_days: int
+) -> ShardResult:
+    # `counts`: (user_id, day, event, count) with days since the epoch; `matches`: the
+    # misuse rule matches of the shard's users. Imported here because pipeline imports us.
+    from .pipeline import CHURN_WINDOW, CHURN_Z_THRESHOLD, churn_insights
+
+    per_day = counts.groupby(["user_id", "day"])["count"].sum().reset_index()
+    matrix = build_daily_matrix(
+        per_day["user_id"],
+        pd.to_datetime(per_day["day"].to_numpy().astype("datetime64[D]")),
+        per_day["count"].to_numpy(),
+        start=np.datetime64(start_day, "D"),
+        n_days=n_days,
+    )
+    return ShardResult(
+        anomaly=churn_insights(rolling_churn_scores(matrix, CHURN_WINDOW), CHURN_Z_THRESHOLD),
+        misuse=misuse_counts(matches, rules),
+        type_counts=counts[counts["event"] >= 0].groupby(["user_id", "event"])["count"].sum(),
+    )
+
+
+def _write_shared(frames: list[pd.DataFrame]) -> tuple[SharedMemory, list[tuple[int, int]]]:
+    import pyarrow as pa
+
+    tables = [pa.Table.from_pandas(frame, preserve_index=False) for frame in frames]
+    spans, offset = [], 0
+    for table in tables:
+        mock = pa.MockOutputStream()
+        with pa.ipc.new_stream(mock, table.schema) as writer:
+            writer.write_table(table)
+        spans.append((offset, mock.size()))
+        offset += mock.size()
+    shm = SharedMemory(create=True, size=max(1, offset))
+    for table, (start, size) in zip(tables, spans):
+        sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf[start:start + size]))
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return shm, spans
+
+
+def _detect_shared(task: tuple) -> ShardResult:
+    import pyarrow as pa
+
+    name, spans, rules, start_day, n_days = task
+    shm = SharedMemory(name=name)
+    try:
+        buffer = pa.py_buffer(shm.buf)
+        counts, matches = (
+            pa.ipc.open_stream(buffer.slice(start, size)).read_all().to_pandas() for start, size in spans
+        )
+        result = detect_shard(counts, matches, rules, start_day, n_days)
+        # Nothing may still point into the segment when it is closed.
+        del counts, matches, buffer
+        return result
+    finally:
+        shm.close()
+
+
+def _per_user_rows(events: pd.DataFrame, daily_counts: pd.DataFrame | None) -> tuple[pd.DataFrame, pd.Index]:
+    # Mirrors the serial stages: counts come from the rollup when present.
+    source = daily_counts if daily_counts is not None else events
+    codes, labels = _event_codes(source["event_type"])
+    counts = pd.DataFrame({
+        "user_id": source["user_id"].to_numpy(np.int64),
+        "day": _epoch_days(source["day"] if daily_counts is not None else source["timestamp"]),
+        "event": codes,
+        "count": source["count"].to_numpy() if daily_counts is not None else np.ones(len(source), dtype=np.int64),
+    })
+    return counts, labels
+
+
+def run_sharded(
+    events: pd.DataFrame,
+    daily_counts: pd.DataFrame | None,
+    features: pd.Series,
+    rules: tuple[MisuseRule, ...],
+    config: ShardConfig,
+) -> tuple[list, list, pd.DataFrame]:
+    # Returns (anomaly insights, misuse insights, feature vectors), identical to the
+    # serial anomaly_detection / detect_feature_misuse / compute_user_feature_vectors.
+    from .pipeline import feature_vector_frame, misuse_insights
+
+    # Rule matching is a single vectorized join; only the per-user counting is sharded.
+    matches = match_rules(events, features, rules)
+    source = daily_counts if daily_counts is not None else events
+    if source.empty:
+        empty = pd.DataFrame(columns=["user_id", "event_count"])
+        return [], misuse_insights(misuse_counts(matches, rules), rules), empty
+
+    counts, labels = _per_user_rows(events, daily_counts)
+    start_day = int(counts["day"].min())
+    n_days = int(counts["day"].max()) - start_day + 1
+    n_shards = config.shard_count(len(counts))
+    if n_shards == 1:
+        results = [detect_shard(counts, matches, rules, start_day, n_days)]
+    else:
+        count_shards = shard_ids(counts["user_id"], n_shards)
+        match_shards = shard_ids(matches["user_id"], n_shards)
+        segments = []
+        try:
+            for shard in range(n_shards):
+                segments.append(_write_shared([
+                    counts[count_shards == shard].reset_index(drop=True),
+                    matches[match_shards == shard].reset_index(drop=True),
+                ]))
+            tasks = [(shm.name, spans, rules, start_day, n_days) for shm, spans in segments]
+            with ProcessPoolExecutor(max_workers=min(config.workers, n_shards)) as pool:
+                results = list(pool.map(_detect_shared, tasks))
+        finally:
+            for shm, _ in segments:
+                shm.close()
+                shm.unlink()
+
+    # Shards hold disjoint users and the serial detectors emit users in ascending order
+    # (per rule for misuse), so sorting reproduces the serial output exactly.
+    anomaly = sorted((i for r in results for i in r.anomaly), key=lambda insight: insight.payload["user_id"])
+    misuse_rows = pd.concat([r.misuse for r in results]).sort_values(["rule", "user_id"], kind="stable")
+    misuse = misuse_insights(misuse_rows, rules)
+
+    type_counts = pd.concat([r.type_counts for r in results])
+    pivot = type_counts.unstack(fill_value=0).sort_index().sort_index(axis=1)
+    count_dtype = source["count"].dtype if daily_counts is not None else np.int64
+    pivot = pivot.astype(count_dtype)
+    pivot.index = pd.Index(pivot.index.to_numpy().astype(source["user_id"].dtype), name="user_id")
+    pivot.columns = pd.Index(labels[pivot.columns.to_numpy()], name="event_type")
+    return anomaly, misuse, feature_vector_frame(pivot)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from .instrumentation import record
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    # Called with the results of `deps` as keyword arguments, in declaration order.
+    fn: Callable[..., Any]
+    deps: tuple[str, ...] = ()
+
+
+@dataclass
+class StageRun:
+    # Memoized results for one set of inputs; each stage runs at most once.
+    graph: StageGraph
+    results: dict[str, Any]
+    timings: dict[str, float] = field(default_factory=dict)
+    prefix: str = "stage"
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def get(self, name: str) -> Any:
+        return self.run([name], max_workers=1)[name]
+
+    def run(self, targets: list[str], max_workers: int = 4) -> dict[str, Any]:
+        # Runs every missing stage needed for `targets`, starting each as soon as its
+        # dependencies are available; independent stages share the thread pool.
+        pending = [name for name in self.graph.closure(targets) if name not in self.results]
+        if pending:
+            if max_workers <= 1:
+                for name in pending:
+                    self._execute(name)
+            else:
+                self._run_parallel(pending, max_workers)
+        return {name: self.results[name] for name in targets}
+
+    def _run_parallel(self, pending: list[str], max_workers: int) -> None:
+        waiting = list(pending)
+        running: dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.prefix) as pool:
+            while waiting or running:
+                ready = [n for n in waiting if all(d in self.results for d in self.graph.stages[n].deps)]
+                for name in ready:
+                    waiting.remove(name)
+                    # A copied context keeps request-scoped instrumentation working in workers.
+                    running[pool.submit(copy_context().run, self._execute, name)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    future.result()
+
+    def _execute(self, name: str) -> None:
+        stage = self.graph.stages[name]
+        kwargs = {dep: self.results[dep] for dep in stage.deps}
+        started = time.perf_counter()
+        value = stage.fn(**kwargs)
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.results[name] = value
+            self.timings[name] = seconds
+        record(f"{self.prefix}.{name}", seconds)
+
+
+class StageGraph:
+    def __init__(self, stages: list[Stage], inputs: tuple[str, ...] = ()):
+        self.inputs = inputs
+        self.stages = {stage.name: stage for stage in stages}
+        known = set(inputs)
+        for stage in stages:
+            missing = [d for d in stage.deps if d not in known]
+            if missing:
+                raise ValueError(f"stage {stage.name!r} depends on unknown or later stages: {missing}")
+            known.add(stage.name)
+
+    def closure(self, targets: list[str]) -> list[str]:
+        # Stages needed for `targets`, in declaration (hence dependency) order.
+        needed: set[str] = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in needed or name in self.inputs:
+                continue
+            if name not in self.stages:
+                raise KeyError(name)
+            needed.add(name)
+            stack.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+    def start(self, prefix: str = "stage", **inputs: Any) -> StageRun:
+        missing = set(self.inputs) - set(inputs)
+        if missing:
+            raise ValueError(f"missing inputs: {sorted(missing)}")
+        return StageRun(self, dict(inputs), prefix=prefix)
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 from ml.pipeline import generate_insights_for_window
 
 
@@ -28,3 +29,413 @@ def test_pipeline_outputs_required_types():
     assert "silent_churn_risk" in types
     assert "feature_misuse" in types
     assert "sentiment_mismatch" in types
+
+
+def test_embedding_registry_loads_once_and_caches_anchors(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from ml import embeddings
+
+    calls = []
+
+    def fake_load(name):
+        calls.append(name)
+        return embeddings.DummyModel()
+
+    monkeypatch.setattr(embeddings, "_load_sentence_transformer", fake_load)
+    registry = embeddings.EmbeddingModelRegistry("fake-model")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        models = list(pool.map(lambda _: registry.get_model(), range(16)))
+
+    assert calls == ["fake-model"]
+    assert all(m is models[0] for m in models)
+    assert registry.anchor_embeddings() is registry.anchor_embeddings()
+    stats = registry.stats()
+    assert stats["loaded"] and stats["load_seconds"] is not None
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[float(len(t)), float(sum(map(ord, t)))] for t in texts])
+
+
+def test_embedding_cache_dedups_persists_and_evicts(tmp_path):
+    from ml.embedding_cache import EmbeddingCache
+
+    model = CountingModel()
+    cache = EmbeddingCache(tmp_path, "m1", max_entries=3)
+    first = cache.encode(model, ["Love it", "Buggy", "Love it"])
+    assert model.encoded == ["Love it", "Buggy"]
+    assert np.allclose(first[0], first[2])
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    reopened = EmbeddingCache(tmp_path, "m1", max_entries=3)
+    again = reopened.encode(model, ["Buggy", "Love it"])
+    assert model.encoded == ["Love it", "Buggy"]
+    assert np.allclose(again, first[[1, 0]])
+
+    reopened.encode(model, ["Great", "Slow"])
+    assert len(reopened) == 3 and reopened.stats()["evictions"] == 1
+
+    switched = EmbeddingCache(tmp_path, "m2", max_entries=3)
+    assert len(switched) == 0
+
+
+def test_embedding_cache_encodes_outside_the_lock_and_logs_the_index(tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from ml.embedding_cache import EmbeddingCache
+
+    class BlockingModel(CountingModel):
+        def __init__(self):
+            super().__init__()
+            self.entered = threading.Event()
+            self.release = threading.Event()
+
+        def encode(self, texts):
+            self.entered.set()
+            assert self.release.wait(5)
+            return super().encode(texts)
+
+    model = CountingModel()
+    cache = EmbeddingCache(tmp_path, "m1", max_entries=4)
+    love = cache.encode(model, ["Love it"])
+    slow = BlockingModel()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pending = pool.submit(cache.encode, slow, ["Buggy", "Slow"])
+        assert slow.entered.wait(5)
+        # A hit is served while another thread's model call is still running, and a
+        # text that thread is encoding is waited for rather than encoded again.
+        assert np.allclose(cache.encode(model, ["Love it"]), love)
+        repeat = pool.submit(cache.encode, model, ["Slow"])
+        slow.release.set()
+        assert np.allclose(repeat.result(), pending.result()[1:])
+    assert model.encoded == ["Love it"] and slow.encoded == ["Buggy", "Slow"]
+
+    # Batches append to index.log, which is replayed on open and folded into index.json
+    # once it outgrows the index.
+    assert len((tmp_path / "index.log").read_text().splitlines()) == 3
+    assert EmbeddingCache(tmp_path, "m1", max_entries=4)._index == cache._index
+    cache.encode(model, ["Great", "Fine", "Meh"])
+    assert cache.stats()["evictions"] == 2 and not (tmp_path / "index.log").exists()
+    # "Love it" takes the least recently used slot ("Slow"); replay drops the old key.
+    cache.encode(model, ["Love it"])
+    reopened = EmbeddingCache(tmp_path, "m1", max_entries=4)
+    assert len(reopened) == 4 and reopened._index == cache._index
+    reopened.encode(model, ["Love it", "Great", "Fine", "Meh"])
+    assert model.encoded == ["Love it", "Great", "Fine", "Meh", "Love it"]
+
+
+def test_sentiment_mismatches_are_positional_for_filtered_frames():
+    from ml.pipeline import sentiment_mismatches
+
+    feedback = pd.DataFrame(
+        [
+            {"user_id": 1, "text": "I LOVE this", "rating": 1},
+            {"user_id": 2, "text": "Buggy", "rating": 5},
+            {"user_id": 3, "text": "Fine", "rating": 3},
+            {"user_id": 4, "text": "Great", "rating": None},
+            {"user_id": 5, "text": "Meh", "rating": 2},
+        ],
+        index=[40, 10, 30, 20, 99],
+    )
+    polarity = np.array([0.01, -0.02, 0.5, 0.0, 0.3])
+
+    insights = sentiment_mismatches(feedback, polarity)
+
+    assert [(i.payload["user_id"], i.score) for i in insights] == [(1, 1.0), (2, 1.0), (5, 0.3)]
+    assert insights[0].payload == {"user_id": 1, "rating": 1, "text": "I LOVE this"}
+
+
+def test_anomaly_detection_vectorized_options_and_no_mutation():
+    from ml.pipeline import anomaly_detection
+
+    rows = []
+    for day, count in zip(["2026-01-01", "2026-01-02", "2026-01-03", "2026-01-04"], [4, 4, 4, 1]):
+        rows += [{"user_id": 7, "timestamp": day}] * count
+    rows += [{"user_id": 8, "timestamp": day} for day in ["2026-01-01", "2026-01-02", "2026-01-03"] for _ in range(2)]
+    rows.append({"user_id": 9, "timestamp": "2026-01-05"})
+    events = pd.DataFrame(rows, index=range(100, 100 + len(rows)))
+
+    insights = anomaly_detection(events)
+    assert [(i.payload["user_id"], i.payload["recent_count"], i.payload["mean"]) for i in insights] == [(7, 1, 3.0)]
+    assert "date" not in events.columns
+
+    assert anomaly_detection(events, z_threshold=-2.0) == []
+    gap_fill = anomaly_detection(events, window=5, fill_missing_days=True)
+    assert [i.payload["user_id"] for i in gap_fill] == [7, 8]
+
+
+def test_daily_count_rollups_match_raw_events():
+    from ml.pipeline import anomaly_detection, compute_user_feature_vectors
+
+    rng = np.random.default_rng(3)
+    events = pd.DataFrame({
+        "user_id": rng.integers(1, 30, 2000),
+        "event_type": rng.choice(["login", "feature_use", "upgrade"], 2000),
+        "timestamp": pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 20 * 86400, 2000), unit="s"),
+    })
+    daily_counts = (
+        events.assign(day=events["timestamp"].dt.normalize())
+        .groupby(["user_id", "day", "event_type"])
+        .size()
+        .reset_index(name="count")
+    )
+
+    pd.testing.assert_frame_equal(
+        compute_user_feature_vectors(events),
+        compute_user_feature_vectors(events.iloc[:0], daily_counts),
+    )
+    assert anomaly_detection(events) == anomaly_detection(events.iloc[:0], daily_counts=daily_counts)
+
+
+def test_cohort_model_partial_fit_and_stable_recluster_labels():
+    from ml.cohorts import CohortModel, fit_cohort_model, update_cohort_model
+
+    rng = np.random.default_rng(0)
+    centers = np.array([[1, 1], [20, 2], [2, 30]])
+    def sample(n):
+        groups = rng.integers(0, 3, n)
+        values = np.abs(centers[groups] + rng.normal(scale=0.5, size=(n, 2))).round()
+        return pd.DataFrame({"user_id": np.arange(n), "login": values[:, 0], "feature_use": values[:, 1]}), groups
+
+    first, groups = sample(300)
+    model = update_cohort_model(None, first)
+    labels = model.predict(first)
+    assert len(set(labels.values())) == 3
+
+    second, _ = sample(200)
+    restored = CohortModel.loads(model.dumps())
+    assert update_cohort_model(restored, second) is restored
+    assert restored.samples_seen == 500
+
+    refit = fit_cohort_model(first, previous=restored, random_state=7)
+    assert refit.predict(first) == labels
+
+    # A batch from a single cohort moves the scaler's mean and variance a long way; the
+    # centroids must stay where the cohorts are and the earlier users keep their labels.
+    shifted, shifted_groups = sample(2_000)
+    shifted = shifted[shifted_groups == 1]
+    before = restored.centroids()
+    restored.partial_fit(shifted)
+    assert np.abs(restored.centroids() - before).max() < 2
+    assert restored.predict(first) == labels
+
+
+def test_offline_aggregates_match_in_memory_pipeline(tmp_path):
+    import json
+    from ml.offline import run_offline
+    from ml.pipeline import generate_insights_for_window
+
+    rng = np.random.default_rng(5)
+    n = 600
+    events = pd.DataFrame({
+        "user_id": rng.integers(1, 12, n),
+        "event_type": rng.choice(["login", "feature_use"], n),
+        "metadata": [{"feature": f} if f else {} for f in rng.choice(["export", "import", ""], n)],
+        "timestamp": pd.Timestamp("2026-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 10 * 86400, n)), unit="s"),
+    })
+    # Two users drop to a single event on the last day.
+    events = events[~((events["user_id"] <= 2) & (events["timestamp"] >= "2026-01-10"))]
+    last_day = pd.DataFrame({
+        "user_id": [1, 2], "event_type": "login", "metadata": [{}, {}], "timestamp": pd.Timestamp("2026-01-10 12:00"),
+    })
+    events = pd.concat([events, last_day], ignore_index=True)
+    feedback = pd.DataFrame([
+        {"user_id": 3, "text": "I love this product", "rating": 1, "timestamp": "2026-01-02"},
+        {"user_id": 4, "text": "Buggy", "rating": 5, "timestamp": "2026-01-03"},
+    ])
+    events.assign(metadata=events["metadata"].map(json.dumps)).iloc[:300].to_csv(tmp_path / "a.csv", index=False)
+    events.assign(metadata=events["metadata"].map(json.dumps)).iloc[300:].to_csv(tmp_path / "b.csv", index=False)
+    feedback.to_csv(tmp_path / "feedback.csv", index=False)
+
+    expected = generate_insights_for_window(events, feedback, pd.DataFrame())
+    offline, aggregates = run_offline(
+        [tmp_path / "a.csv", tmp_path / "b.csv"], [tmp_path / "feedback.csv"], chunk_rows=64
+    )
+
+    def key(insights):
+        return sorted((i["type"], i["payload"]["user_id"], round(i["score"], 9)) for i in insights)
+
+    assert key(offline) == key(expected)
+    assert {"silent_churn_risk", "feature_misuse"} <= {i["type"] for i in offline}
+    assert aggregates.rows == len(events)
+    assert aggregates.feature_vectors()["event_count"].sum() == len(events)
+
+
+def test_window_stages_share_intermediates_and_match_serial_run():
+    from ml import instrumentation
+    from ml.pipeline import generate_insights_for_window, window_stages
+
+    rng = np.random.default_rng(11)
+    n = 400
+    events = pd.DataFrame({
+        "user_id": rng.integers(1, 8, n),
+        "event_type": rng.choice(["login", "feature_use"], n),
+        "metadata": [{"feature": f} if f else {} for f in rng.choice(["export", ""], n)],
+        "timestamp": pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 6 * 86400, n), unit="s"),
+    })
+    feedback = pd.DataFrame(columns=["user_id", "text", "rating"])
+    recorded = []
+    observer = lambda stage, seconds: recorded.append(stage)
+    instrumentation.add_observer(observer)
+    try:
+        stages = window_stages(events, feedback, pd.DataFrame())
+        vectors = stages.get("feature_vectors")
+        parallel = generate_insights_for_window(events, feedback, pd.DataFrame(), stages=stages, max_workers=3)
+        serial = generate_insights_for_window(events, feedback, pd.DataFrame(), max_workers=1)
+    finally:
+        instrumentation.remove_observer(observer)
+
+    assert stages.get("feature_vectors") is vectors
+    assert parallel == serial
+    assert "feature_misuse" in {i["type"] for i in parallel}
+    # Feature vectors are stored per run, not copied into every insight.
+    assert all(set(i) == {"type", "score", "payload", "explanation"} for i in parallel)
+    # Every stage ran once per memo, including the shared ones.
+    assert recorded.count("pipeline.user_days") == 2 and recorded.count("pipeline.feature_vectors") == 1
+    assert set(stages.timings) == {"feature_vectors", "user_days", "features", "misuse_matches", "anomaly", "misuse", "sentiment"}
+    assert list(events.columns) == ["user_id", "event_type", "metadata", "timestamp"]
+
+
+def test_sharded_detectors_match_serial_run():
+    from ml.pipeline import generate_insights_for_window, window_stages
+    from ml.sharding import ShardConfig, shard_ids
+
+    rng = np.random.default_rng(23)
+    n = 3000
+    events = pd.DataFrame({
+        "user_id": rng.integers(1, 60, n).astype("int32"),
+        "event_type": pd.Categorical(rng.choice(["login", "feature_use"], n), categories=["upgrade", "login", "feature_use"]),
+        "metadata": [{"feature": f} if f else {} for f in rng.choice(["export", ""], n, p=[0.1, 0.9])],
+        "timestamp": pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 12 * 86400, n), unit="s"),
+    })
+    daily_counts = (
+        events.assign(day=events["timestamp"].dt.normalize())
+        .groupby(["user_id", "day", "event_type"], observed=True)
+        .size()
+        .reset_index(name="count")
+    )
+    feedback = pd.DataFrame(columns=["user_id", "text", "rating"])
+    shards = ShardConfig(workers=2, shard_rows=500)
+    assert shards.shard_count(n) == 6
+    assert (shard_ids([5, 6, 5], 4) == shard_ids([5, 6, 5], 4)[[0, 1, 0]]).all()
+
+    for rollup in (None, daily_counts):
+        serial = window_stages(events, feedback, pd.DataFrame(), rollup)
+        sharded = window_stages(events, feedback, pd.DataFrame(), rollup, shards)
+        expected = generate_insights_for_window(events, feedback, pd.DataFrame(), stages=serial)
+        assert generate_insights_for_window(events, feedback, pd.DataFrame(), stages=sharded) == expected
+        assert {i["type"] for i in expected} == {"silent_churn_risk", "feature_misuse"}
+        pd.testing.assert_frame_equal(sharded.get("feature_vectors"), serial.get("feature_vectors"))
+
+
+def test_misuse_rules_are_evaluated_in_one_pass():
+    import json
+    from ml.misuse import MisuseRule, match_rules, misuse_counts
+    from ml.pipeline import detect_feature_misuse, extract_features
+
+    t0 = pd.Timestamp("2026-01-01")
+    rows = [(1, "feature_use", "export", t0 + pd.Timedelta(minutes=m)) for m in (0, 1, 2, 90)]
+    rows += [(2, "feature_use", "export", t0 + pd.Timedelta(hours=h)) for h in (0, 2, 4)]
+    rows += [(2, "api_call", "export", t0), (3, "feature_use", "import", t0), (3, "login", None, t0)]
+    events = pd.DataFrame(rows, columns=["user_id", "event_type", "feature", "timestamp"])
+    rules = (
+        MisuseRule("export", threshold=4),
+        MisuseRule("export", threshold=3, event_type="feature_use", span_seconds=3600),
+        MisuseRule("import", threshold=1),
+    )
+
+    matches = match_rules(events, events["feature"], rules)
+    assert len(matches) == 8 + 7 + 1
+    counts = misuse_counts(matches, rules)
+    assert counts.values.tolist() == [[0, 1, 4], [0, 2, 4], [1, 1, 3], [1, 2, 1], [2, 3, 1]]
+
+    insights = detect_feature_misuse(events, rules)
+    assert [i.payload for i in insights] == [
+        {"user_id": 1, "feature": "export", "count": 4},
+        {"user_id": 2, "feature": "export", "count": 4},
+        {"user_id": 1, "feature": "export", "count": 3, "event_type": "feature_use", "span_seconds": 3600},
+        {"user_id": 3, "feature": "import", "count": 1},
+    ]
+    # Without a `feature` column the default rule reads metadata, as before.
+    legacy = events.assign(metadata=[{"feature": f} if f else {} for f in events["feature"]]).drop(columns="feature")
+    assert [(i.payload["user_id"], i.score) for i in detect_feature_misuse(legacy)] == [(1, 4.0), (2, 4.0)]
+
+    # Parsed and serialized metadata agree: only top-level strings, cut to the column width.
+    metadata = [
+        {"feature": "export"}, {"a": {"feature": "export"}}, {"feature": 5}, {"feature": None},
+        {"feature": "x" * 150}, {"feature": 'say "hi"'}, {"other": 1, "feature": "import"}, {},
+    ]
+    expected = ["export", None, None, None, "x" * 100, 'say "hi"', "import", None]
+    assert extract_features(pd.Series(metadata)).tolist() == expected
+    from_text = extract_features(pd.Series([json.dumps(m) for m in metadata]))
+    assert from_text.where(from_text.notna(), None).tolist() == expected
+    assert extract_features(pd.Series(["{'feature': 'import'}", "{'a': {'feature': 'x'}}"])).tolist() == ["import", None]
+
+
+def test_hashing_sentiment_backend_trains_round_trips_and_is_selectable(tmp_path):
+    from ml import sentiment
+    from ml.pipeline import sentiment_analysis
+
+    texts = ["love it, great product", "very helpful and great", "buggy and frustrating", "confusing, broken export"] * 25
+    ratings = [5, 4, 1, 2] * 25
+    model = sentiment.HashingSentiment.train(texts, ratings, n_features=2 ** 12)
+    polarity = model.polarity(["great, love it", "so buggy and broken"])
+    assert polarity[0] > 0 > polarity[1] and np.all(np.abs(polarity) <= 1)
+
+    path = tmp_path / "sentiment.npz"
+    model.save(path)
+    restored = sentiment.HashingSentiment.load(path)
+    np.testing.assert_array_equal(restored.coef, model.coef)
+    np.testing.assert_allclose(restored.polarity(texts[:4]), model.polarity(texts[:4]))
+
+    feedback = pd.DataFrame([
+        {"user_id": 1, "text": "I love this, great", "rating": 1},
+        {"user_id": 2, "text": "Buggy and frustrating", "rating": 5},
+        {"user_id": 3, "text": "Very helpful", "rating": 5},
+    ])
+    try:
+        sentiment.configure_sentiment("hashing", str(path))
+        assert sentiment.get_sentiment_backend().name == "hashing"
+        assert [i.payload["user_id"] for i in sentiment_analysis(feedback)] == [1, 2]
+        sentiment.configure_sentiment("hashing", str(tmp_path / "missing.npz"))
+        assert sentiment.get_sentiment_backend().name == "embedding"
+    finally:
+        sentiment.configure_sentiment()
+
+
+def test_synthetic_generator_is_reproducible_across_workers_and_formats(tmp_path, monkeypatch):
+    from datetime import datetime
+    from pathlib import Path
+    from data.generate_synthetic import GeneratorConfig, generate
+
+    monkeypatch.syspath_prepend(str(Path(__file__).parents[1] / "backend"))
+    from app.bulk_load import read_chunks
+
+    # Several chunks per table, so the workers really split the output.
+    config = GeneratorConfig(users=40, events=2_500, feedback=300, seed=7, end=datetime(2026, 1, 1), chunk_rows=700)
+    frames = {}
+    for fmt in ("csv", "ndjson", "parquet"):
+        serial = generate(config, tmp_path / f"{fmt}-1", fmt, workers=1)
+        parallel = generate(config, tmp_path / f"{fmt}-3", fmt, workers=3)
+        for table, path in serial.items():
+            assert path.read_bytes() == parallel[table].read_bytes()
+            frame = pd.concat(read_chunks(path, chunk_rows=1_000), ignore_index=True)
+            assert len(frame) == getattr(config, table)
+            frames[fmt, table] = frame
+
+    for table, columns in {"users": ["id", "country"], "events": ["user_id", "event_type"], "feedback": ["user_id", "text", "rating"]}.items():
+        expected = frames["parquet", table][columns].astype(str)
+        for fmt in ("csv", "ndjson"):
+            pd.testing.assert_frame_equal(frames[fmt, table][columns].astype(str), expected)
+    timestamps = {
+        fmt: pd.to_datetime(frames[fmt, "events"]["timestamp"]).to_numpy("datetime64[s]") for fmt in ("csv", "ndjson", "parquet")
+    }
+    assert (timestamps["csv"] == timestamps["parquet"]).all() and (timestamps["ndjson"] == timestamps["parquet"]).all()
+    features = frames["ndjson", "events"]["metadata"].map(lambda m: m.get("feature"))
+    assert features.notna().eq(frames["ndjson", "events"]["event_type"].eq("feature_use")).all()
+    assert frames["csv", "events"]["metadata"].str.startswith("{").all()